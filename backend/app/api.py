@@ -1,8 +1,8 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
-from app import ckan_client
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from app import streaming
+from app.services import ckan_client
 import os
-import tempfile
 import pandas as pd
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -17,7 +17,7 @@ app.add_middleware(
 )
 
 @app.get("/datasets/search")
-def search_datasets(
+async def search_datasets(
     query: str = "",
     start: int = 0,
     rows: int = 10,
@@ -29,7 +29,7 @@ def search_datasets(
     Ejemplo: /datasets/search?query=consumo&format=csv&theme=agua&start=0&rows=5
     """
     try:
-        results = ckan_client.search_datasets(
+        results = await ckan_client.search_datasets(
             query=query,
             start=start,
             rows=rows,
@@ -42,51 +42,53 @@ def search_datasets(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/resources/{resource_id}")
-def get_resource(resource_id: str):
+async def get_resource(resource_id: str):
     try:
-        resource = ckan_client.get_resource(resource_id)
+        resource = await ckan_client.get_resource(resource_id)
         return resource
     except Exception as e:
         print("ERROR:", e) 
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/resources/{resource_id}/download")
-def download_resource(resource_id: str):
+async def download_resource(resource_id: str, request: Request):
     try:
-        resource = ckan_client.get_resource(resource_id)
+        resource = await ckan_client.get_resource(resource_id)
         resource_url = resource.get("url")
         if not resource_url or not resource_url.endswith('.csv'):
             raise HTTPException(status_code=400, detail="El recurso no es un archivo CSV válido o no tiene URL.")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
-            ckan_client.download_csv(resource_url, tmp.name)
-            tmp_path = tmp.name
+        # El archivo se reenvía a medida que llega desde CKAN, sin pasar por un temporal en disco
         filename = os.path.basename(resource_url)
-        return FileResponse(tmp_path, filename=filename, media_type="text/csv")
+        return await streaming.proxy_download(
+            resource_url, request.headers.get("accept-encoding"), filename=filename, media_type="text/csv"
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         print("ERROR:", e) 
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/resources/{resource_id}/columns")
-def get_csv_columns(resource_id: str):
+async def get_csv_columns(resource_id: str):
     try:
-        resource = ckan_client.get_resource(resource_id)
+        resource = await ckan_client.get_resource(resource_id)
         resource_url = resource.get("url")
         if not resource_url or not resource_url.endswith('.csv'):
             raise HTTPException(status_code=400, detail="El recurso no es un archivo CSV válido o no tiene URL.")
-        df = pd.read_csv(resource_url, encoding="latin1", sep=";", on_bad_lines='skip')
+        df = await run_in_threadpool(pd.read_csv, resource_url, encoding="latin1", sep=";", on_bad_lines='skip')
         return {"columns": df.columns.tolist()}
     except Exception as e:
         print("ERROR:", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/resources/{resource_id}/filter")
-def filter_csv_rows(resource_id: str, columna: str, valor: str, page: int = 1, page_size: int = 10):
+async def filter_csv_rows(resource_id: str, columna: str, valor: str, page: int = 1, page_size: int = 10):
     try:
-        resource = ckan_client.get_resource(resource_id)
+        resource = await ckan_client.get_resource(resource_id)
         resource_url = resource.get("url")
         if not resource_url or not resource_url.endswith('.csv'):
             raise HTTPException(status_code=400, detail="El recurso no es un archivo CSV válido o no tiene URL.")
-        df = pd.read_csv(resource_url, encoding="latin1", sep=";", on_bad_lines='skip')
+        df = await run_in_threadpool(pd.read_csv, resource_url, encoding="latin1", sep=";", on_bad_lines='skip')
         if columna not in df.columns:
             raise HTTPException(status_code=400, detail=f"La columna '{columna}' no existe en el recurso.")
         filtered = df[df[columna].astype(str) == valor]
@@ -106,13 +108,13 @@ def filter_csv_rows(resource_id: str, columna: str, valor: str, page: int = 1, p
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/resources/{resource_id}/stats")
-def csv_column_stats(resource_id: str, columna: str):
+async def csv_column_stats(resource_id: str, columna: str):
     try:
-        resource = ckan_client.get_resource(resource_id)
+        resource = await ckan_client.get_resource(resource_id)
         resource_url = resource.get("url")
         if not resource_url or not resource_url.endswith('.csv'):
             raise HTTPException(status_code=400, detail="El recurso no es un archivo CSV válido o no tiene URL.")
-        df = pd.read_csv(resource_url, encoding="latin1", sep=";", on_bad_lines='skip')
+        df = await run_in_threadpool(pd.read_csv, resource_url, encoding="latin1", sep=";", on_bad_lines='skip')
         if columna not in df.columns:
             raise HTTPException(status_code=400, detail=f"La columna '{columna}' no existe en el recurso.")
         if not pd.api.types.is_numeric_dtype(df[columna]):
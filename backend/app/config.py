@@ -1,4 +1,6 @@
 # app/config.py
+import os
+import tempfile
 from pydantic import BaseSettings
 from typing import List
 
@@ -15,10 +17,52 @@ class Settings(BaseSettings):
     ALLOWED_DOMAINS: List[str] = ["datos.cali.gov.co"]
     REQUEST_TIMEOUT: int = 30  # segundos
     MAX_RETRIES: int = 3
+    CONNECT_TIMEOUT: int = 10  # segundos
+    HTTP_MAX_CONNECTIONS: int = 100  # Conexiones totales del pool HTTP
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 10  # Conexiones simultáneas por host (CKAN)
+    HTTP_KEEPALIVE_SECONDS: int = 30
     
     # Configuración de rendimiento
     CHUNK_SIZE: int = 10000  # Número de filas por chunk
     PANDAS_READ_CHUNKSIZE: int = 1000  # Tamaño de chunk para lectura de pandas
+    STREAM_GZIP_LEVEL: int = 6  # Nivel de gzip de descargas y exportaciones en streaming
+    STREAM_BROTLI_QUALITY: int = 5  # Calidad de brotli (si está instalado) en descargas y exportaciones
+    SNIFF_BYTES: int = 16 * 1024  # Bytes iniciales usados para detectar codificación y separador
+    COMPUTE_WORKERS: int = 4  # Tareas de cómputo simultáneas por worker
+    COMPUTE_MAX_QUEUE: int = 32  # Tareas en espera antes de responder 503
+    COMPUTE_DISCONNECT_POLL_SECONDS: float = 0.5  # Frecuencia de verificación de desconexión del cliente
+    CHART_MAX_POINTS: int = 500  # Puntos por defecto de las series de gráficas (reducidas con LTTB)
+    QUERY_MAX_ROWS: int = 10000  # Filas máximas devueltas por /resources/{id}/query
+    QUERY_TIMEOUT_SECONDS: float = 10  # Tiempo máximo de una consulta antes de interrumpirla
+    QUERY_THREADS: int = 2  # Hilos de DuckDB por consulta
+    QUERY_MEMORY_LIMIT_MB: int = 512  # Memoria máxima de DuckDB por consulta
+    ADMISSION_MAX_CONCURRENT: int = 8  # Análisis pesados simultáneos por worker (KPIs, filtros, gráficas, consultas)
+    ADMISSION_MEMORY_MB: int = 2048  # Memoria estimada que pueden reservar a la vez los análisis en curso
+    ADMISSION_MAX_QUEUE: int = 64  # Solicitudes en espera de admisión antes de responder 503
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 15  # Espera máxima en la cola de admisión
+    ADMISSION_PARSE_FACTOR: float = 5  # Bytes en memoria por byte de archivo al parsearlo
+    ADMISSION_WORK_FACTOR: float = 0.5  # Memoria de trabajo de un análisis respecto del frame que recorre
+    ADMISSION_ROW_BYTES: int = 32  # Memoria de trabajo por fila (máscaras, posiciones, códigos de agrupación)
+    MEMORY_BUDGET_MB: int = 1024  # Memoria para DataFrames cargados, KPIs, frecuencias, índices y respuestas (LRU)
+    HTTP_CACHE_MAX_AGE_SECONDS: int = 60  # Cache-Control max-age de las respuestas de análisis (con ETag)
+    DATASET_REVALIDATE_SECONDS: int = 300  # Tiempo antes de revalidar los datasets de dominio con CKAN
+    HEALTH_PROBE_INTERVAL_SECONDS: int = 15  # /health reutiliza la última sonda a CKAN durante este tiempo
+    HEALTH_PROBE_TIMEOUT_SECONDS: float = 5  # Tiempo máximo de la sonda a CKAN de /health
+    WARMUP_ENABLED: bool = True  # Precarga agua, energía y WARMUP_RESOURCE_IDS al iniciar
+    WARMUP_RESOURCE_IDS: List[str] = []  # Recursos CKAN de uso común a precargar
+    REFRESH_INTERVAL_SECONDS: int = 600  # Intervalo del refresco en segundo plano de los datasets precargados
+
+    # Configuración de caché en disco
+    SNAPSHOTS_ENABLED: bool = True  # Snapshots columnares (Arrow IPC) de los recursos ya parseados
+    SNAPSHOT_DIR: str = os.path.join(tempfile.gettempdir(), "monita", "snapshots")
+    DOWNLOAD_CACHE_ENABLED: bool = True  # Caché en disco de los archivos descargados de CKAN
+    DOWNLOAD_CACHE_DIR: str = os.path.join(tempfile.gettempdir(), "monita", "downloads")
+    DOWNLOAD_CACHE_MAX_MB: int = 2048  # Cuota de disco de la caché de descargas (LRU)
+    METADATA_CACHE_PATH: str = os.path.join(tempfile.gettempdir(), "monita", "metadata.sqlite3")
+    METADATA_TTL_SECONDS: int = 300  # Metadatos de recursos servidos sin consultar CKAN
+    CATALOG_TTL_SECONDS: int = 600  # Búsquedas de datasets (selectores de agua y energía, /datasets/search)
+    METADATA_STALE_SECONDS: int = 86400  # Tras el TTL se sirve la copia guardada mientras se revalida en segundo plano
+    METADATA_NEGATIVE_TTL_SECONDS: int = 60  # Tiempo que se recuerda un "no encontrado" de CKAN
     
     # Configuración general
     API_VERSION: str = "1.0.0"
@@ -29,4 +73,6 @@ settings = Settings()
 
 # Para compatibilidad con código existente
 CKAN_BASE_URL = settings.CKAN_BASE_URL
+AGUA_DATASET_URL = settings.AGUA_DATASET_URL
+ENERGIA_DATASET_URL = settings.ENERGIA_DATASET_URL
 API_VERSION = settings.API_VERSION
\ No newline at end of file
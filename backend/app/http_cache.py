@@ -0,0 +1,138 @@
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+
+from app.config import settings
+from app.services.memory_manager import manager
+
+logger = logging.getLogger(__name__)
+
+_counters = {"hits": 0, "misses": 0, "not_modified": 0}
+
+# Devuelve (ámbito, versión) de los datos que lee la solicitud: dominio o resource_id y su versión upstream
+VersionResolver = Callable[[Request], Awaitable[Optional[Tuple[str, str]]]]
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.body)
+
+
+def no_cache(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    """Excluye un endpoint de la caché HTTP de su router (p. ej. los que no dependen de la versión del dataset)"""
+    endpoint.http_cache = False
+    return endpoint
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _cache_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": f"public, max-age={settings.HTTP_CACHE_MAX_AGE_SECONDS}"}
+
+
+def _check_rate_limit(request: Request, endpoint: Callable[..., Any]) -> None:
+    """
+    Aplica el límite de slowapi del endpoint antes de buscar en la caché: un HIT (o un 304)
+    también cuenta, y en un fallo se rechaza antes de resolver la versión, que puede cargar
+    el dataset. El decorador del endpoint ve la marca de slowapi y no lo cuenta dos veces.
+    slowapi no expone esta verificación: se usa su API privada, con la versión fijada en
+    requirements.txt y un test que falla si cambia.
+    """
+    limiter = getattr(request.app.state, "limiter", None)
+    if limiter is None or not limiter.enabled or getattr(request.state, "_rate_limiting_complete", False):
+        return
+    limiter._check_request_limit(request, endpoint, False)
+    request.state._rate_limiting_complete = True
+
+
+def cached_route(resolve_version: VersionResolver) -> Type[APIRoute]:
+    """
+    Clase de ruta que guarda las respuestas GET por (ámbito, versión de los datos, ruta,
+    query params ordenados) en la caché de memoria, con ETag fuerte y Cache-Control.
+
+    Una solicitud con `If-None-Match` igual al ETag vigente recibe 304 sin ejecutar el
+    endpoint. Cuando cambia la versión de los datos cambia la clave: las respuestas de la
+    versión anterior se descartan al guardar la primera de la nueva.
+
+    El límite de solicitudes (slowapi) se aplica siempre, antes de la caché. Las dependencias
+    del endpoint, como el control de admisión, solo corren cuando hay que generar la respuesta:
+    servir una respuesta guardada no consume la memoria que ese control reparte.
+    """
+
+    class CachedRoute(APIRoute):
+        def get_route_handler(self) -> Callable[[Request], Awaitable[Response]]:
+            handler = super().get_route_handler()
+            if "GET" not in self.methods or not getattr(self.endpoint, "http_cache", True):
+                return handler
+
+            async def cached_handler(request: Request) -> Response:
+                _check_rate_limit(request, self.endpoint)
+                try:
+                    scope = await resolve_version(request)
+                except HTTPException:
+                    # Recurso inexistente o CKAN caído: es el mismo error que daría el endpoint
+                    raise
+                except Exception as e:
+                    # El endpoint reportará el error a su manera
+                    logger.debug(f"Sin versión para {request.url.path}: {str(e)}")
+                    scope = None
+                if scope is None:
+                    return await handler(request)
+                owner, version = scope
+                key = ("http", owner, version, request.url.path, tuple(sorted(request.query_params.multi_items())))
+                if_none_match = request.headers.get("if-none-match")
+                cached = manager.get(key)
+                if cached is not None:
+                    _counters["hits"] += 1
+                    if _matches(if_none_match, cached.etag):
+                        _counters["not_modified"] += 1
+                        return Response(status_code=304, headers=_cache_headers(cached.etag))
+                    return Response(content=cached.body, headers={**cached.headers, "X-Cache": "HIT"})
+
+                _counters["misses"] += 1
+                response = await handler(request)
+                body = getattr(response, "body", None)
+                if (
+                    response.status_code != 200 or body is None
+                    or response.background is not None or "set-cookie" in response.headers
+                ):
+                    return response
+                etag = etag_for(body)
+                headers = {
+                    name: value for name, value in response.headers.items() if name != "content-length"
+                }
+                headers.update(_cache_headers(etag))
+                manager.discard_stale(owner, version)
+                manager.put(key, CachedResponse(body=body, etag=etag, headers=headers))
+                if _matches(if_none_match, etag):
+                    return Response(status_code=304, headers=_cache_headers(etag))
+                return Response(content=body, headers={**headers, "X-Cache": "MISS"})
+
+            return cached_handler
+
+    return CachedRoute
+
+
+def stats() -> Dict[str, int]:
+    """Respuestas servidas desde la caché (hits, de ellas 304) y generadas por el endpoint (misses)"""
+    return dict(_counters)
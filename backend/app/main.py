@@ -1,19 +1,53 @@
+import functools
+from contextlib import asynccontextmanager
+
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from fastapi import FastAPI
 from slowapi.errors import RateLimitExceeded
-from app.routers import agua, energia, resources, health
 from fastapi.middleware.cors import CORSMiddleware
 
+# El limiter debe existir antes de importar los routers: resources lo importa desde aquí
 limiter = Limiter(key_func=get_remote_address)
+
+from app.config import settings
+from app.routers import agua, energia, resources, health
+from app.services import compute, dataset_store, http_client, metrics
+from app.services.scheduler import scheduler
+
+if settings.WARMUP_ENABLED:
+    for domain in ("agua", "energia"):
+        scheduler.add_job(domain, functools.partial(dataset_store.refresh, domain))
+    for resource_id in settings.WARMUP_RESOURCE_IDS:
+        scheduler.add_job(f"recurso:{resource_id}", functools.partial(resources.warm_resource, resource_id))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # La precarga corre en segundo plano: la API responde mientras tanto y /health/ready indica cuándo terminó
+    scheduler.start()
+    try:
+        yield
+    finally:
+        await scheduler.stop()
+        await http_client.aclose()
+        compute.pool.shutdown()
+
+
 app = FastAPI(
     title="Monita API",
     description="API para monitoreo intensivo de agua y energía de Cali",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # Mide la serialización JSON de cada respuesta (etapa "serialize" de Server-Timing)
+    default_response_class=metrics.TimedJSONResponse
 )
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Tiempos por etapa (Server-Timing) y métricas por ruta para /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
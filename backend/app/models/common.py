@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, Field, StrictBool, StrictFloat, StrictInt, StrictStr
+from typing import List, Dict, Any, Optional, Union
 
 class TimeSeriesItem(BaseModel):
     mes: str
@@ -18,13 +18,21 @@ class SummaryKPIs(BaseModel):
 class AnomalyItem(BaseModel):
     fecha: str
     valor: float
-    tipo: str  # ejemplo: "alto", "bajo", "outlier"
+    tipo: str  # ejemplo: "outlier"
+    direccion: Optional[str] = None  # "alto" o "bajo" respecto a la línea base del grupo
+    zona: Optional[str] = None
+    tipo_usuario: Optional[str] = None
+    score: Optional[float] = None
 
 class ComparativaItem(BaseModel):
     periodo: str
     zona1: float
     zona2: float
 
+class ComparativaMatrizItem(BaseModel):
+    periodo: str
+    valores: Dict[str, float]  # zona -> consumo del periodo
+
 class DatasetInfo(BaseModel):
     id: str
     nombre: str
@@ -44,10 +52,18 @@ class SummaryResponse(BaseModel):
 
 class AnomaliesResponse(BaseModel):
     anomalies: List[AnomalyItem]
+    metodo: Optional[str] = None
+    page: Optional[int] = None
+    page_size: Optional[int] = None
+    total: Optional[int] = None
 
 class ComparativaResponse(BaseModel):
     comparativa: List[ComparativaItem]
 
+class ComparativaMatrizResponse(BaseModel):
+    zonas: List[str]
+    comparativa: List[ComparativaMatrizItem]
+
 class DatasetsResponse(BaseModel):
     datasets: List[DatasetInfo]
 
@@ -71,14 +87,20 @@ class ResourceFilterResponse(BaseModel):
     page: int
     total_pages: int
     total: int
+    next_cursor: Optional[str] = None  # Cursor opaco de la página siguiente (None en la última)
 
 class ColumnKPI(BaseModel):
     column: str
     count: int
+    nulls: Optional[int] = None
     mean: float = None
     min: float = None
     max: float = None
     sum: float = None
+    std: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
 
 class ResourceKPIsResponse(BaseModel):
     kpis: List[ColumnKPI]
@@ -91,4 +113,35 @@ class ResourceChartResponse(BaseModel):
     column: str
     chart_type: str  # "histogram", "bar", "line", etc.
     data: List[ChartDataPoint]
+    total_points: Optional[int] = None  # Puntos de la serie completa antes de reducirla a max_points
 
+# Tipos estrictos: sin ellos pydantic convertiría "3" en 3.0 y el filtro no coincidiría con texto
+Scalar = Union[StrictBool, StrictInt, StrictFloat, StrictStr]
+
+class QueryCondition(BaseModel):
+    column: str
+    op: str = Field(..., regex="^(=|!=|<|<=|>|>=|in|not_in|between|contains|is_null|not_null)$")
+    value: Optional[Union[List[Scalar], Scalar]] = None  # Lista para in/not_in y [desde, hasta] para between
+
+class QueryAggregate(BaseModel):
+    fn: str = Field(..., regex="^(count|count_distinct|sum|avg|min|max|median|stddev)$")
+    column: Optional[str] = None  # Sin columna solo para count (filas)
+    alias: Optional[str] = None
+
+class QueryOrder(BaseModel):
+    column: str  # Columna del recurso o alias de un agregado
+    direction: str = Field("asc", regex="^(asc|desc)$")
+
+class ResourceQueryRequest(BaseModel):
+    select: List[str] = []  # Columnas a devolver cuando no hay agregados (vacío: todas)
+    where: List[QueryCondition] = []
+    group_by: List[str] = []
+    aggregates: List[QueryAggregate] = []
+    order_by: List[QueryOrder] = []
+    limit: Optional[int] = Field(None, ge=1)
+
+class ResourceQueryResponse(BaseModel):
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+    row_count: int
+    truncated: bool  # True si el resultado se cortó en el límite de filas
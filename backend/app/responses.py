@@ -0,0 +1,94 @@
+import json
+import math
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import Response
+
+from app.services import metrics
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa json de la librería estándar
+    orjson = None
+
+
+def column_values(series: pd.Series) -> Any:
+    """
+    Valores de una columna listos para serializar.
+    Las columnas numéricas se devuelven como array NumPy (sin pasar por objetos Python);
+    fechas y textos como listas con None en lugar de NaN/NaT.
+    """
+    values = series.to_numpy()
+    kind = values.dtype.kind
+    if kind in "biuf":
+        return np.ascontiguousarray(values)
+    if kind == "M":
+        texts = np.datetime_as_string(values, unit="auto").astype(object)
+        texts[np.isnat(values)] = None
+        return texts.tolist()
+    values = values.astype(object)
+    values[pd.isna(values)] = None
+    return values.tolist()
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        items = obj.tolist()
+        if obj.dtype.kind == "f":
+            for i in np.flatnonzero(~np.isfinite(obj)):
+                items[i] = None
+        return items
+    if isinstance(obj, np.generic):
+        return _finite(obj.item())
+    if isinstance(obj, (pd.Timestamp, pd.Period)):
+        return str(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def _finite(obj: Any) -> Any:
+    """NaN e ±inf como None en floats, listas y diccionarios (lo que orjson hace por su cuenta)"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    return obj
+
+
+def dumps(content: Any) -> bytes:
+    """Serializa a JSON escribiendo los arrays NumPy directamente (NaN e ±inf se emiten como null)"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        _finite(content), default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def columnar_content(df: pd.DataFrame, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    columns = [str(c) for c in df.columns]
+    content = {
+        "columns": columns,
+        "data": {name: column_values(df.iloc[:, i]) for i, name in enumerate(columns)},
+    }
+    if extra:
+        content.update(extra)
+    return content
+
+
+class ColumnarResponse(Response):
+    """
+    Respuesta en formato columnar: {"columns": [...], "data": {col: [...]}, ...extra}.
+    Se activa con `?format=columnar` en los endpoints que lo soportan. Armar y serializar
+    el cuerpo se mide como la etapa `serialize`, igual que en TimedJSONResponse.
+    """
+    media_type = "application/json"
+
+    def __init__(self, df: pd.DataFrame, extra: Optional[Dict[str, Any]] = None, **kwargs):
+        with metrics.span("serialize"):
+            super().__init__(content=columnar_content(df, extra), **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,86 +1,136 @@
 from typing import List, Optional
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from app.http_cache import cached_route, no_cache
+from app.services.admission import admit_dataset
+from app.services.consumo_cube import parse_fecha
+from app.services.dataset_store import get_dataset
 from app.services.agua_analysis import (
-    get_timeseries, get_zonas, get_summary, get_anomalies, get_comparativa, get_datasets, get_raw
+    get_timeseries, get_zonas, get_summary, get_anomalies, get_comparativa, get_comparativa_matriz,
+    get_datasets, get_raw
 )
 from app.models.common import (
     TimeSeriesResponse, ZonasResponse, SummaryResponse, AnomaliesResponse,
-    ComparativaResponse, DatasetsResponse, ZonasDistinctResponse, TiposUsuarioDistinctResponse
+    ComparativaResponse, ComparativaMatrizResponse, DatasetsResponse, ZonasDistinctResponse, TiposUsuarioDistinctResponse
 )
 
-router = APIRouter(prefix="/agua", tags=["agua"])
+async def dataset_version(request: Request):
+    """Versión vigente del dataset de agua: las respuestas en caché se invalidan cuando cambia"""
+    dataset = await run_in_threadpool(get_dataset, "agua")
+    return "agua", dataset.version
+
+def parse_fechas(fecha_inicio, fecha_fin):
+    """fecha_inicio y fecha_fin como Timestamp; 400 si alguna no es una fecha"""
+    try:
+        return parse_fecha(fecha_inicio), parse_fecha(fecha_fin)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida: {str(e)}")
+
+router = APIRouter(prefix="/agua", tags=["agua"], route_class=cached_route(dataset_version))
+
+# Solo los análisis pasan por el control de admisión; los listados (datasets, distinct) no esperan turno
+admit = Depends(admit_dataset("agua"))
 
 @router.get("/datasets", response_model=DatasetsResponse)
-def list_datasets():
-    return get_datasets()
+@no_cache
+async def list_datasets():
+    return await get_datasets()
 
-@router.get("/consumo/timeseries", response_model=TimeSeriesResponse)
+@router.get("/consumo/timeseries", response_model=TimeSeriesResponse, dependencies=[admit])
 def consumo_timeseries(
     zonas: Optional[List[str]] = Query(None),
     tipo_usuario: Optional[str] = None,
     fecha_inicio: Optional[str] = None,
-    fecha_fin: Optional[str] = None
+    fecha_fin: Optional[str] = None,
+    format: str = Query("json", regex="^(json|columnar)$")
 ):
-    return get_timeseries(zonas=zonas, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    fecha_inicio, fecha_fin = parse_fechas(fecha_inicio, fecha_fin)
+    return get_timeseries(zonas=zonas, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, format=format)
 
-@router.get("/consumo/zonas", response_model=ZonasResponse)
+@router.get("/consumo/zonas", response_model=ZonasResponse, dependencies=[admit])
 def consumo_zonas(
     zonas: Optional[List[str]] = Query(None),
     tipo_usuario: Optional[str] = None,
     fecha_inicio: Optional[str] = None,
-    fecha_fin: Optional[str] = None
+    fecha_fin: Optional[str] = None,
+    format: str = Query("json", regex="^(json|columnar)$")
 ):
-    return get_zonas(zonas=zonas, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    fecha_inicio, fecha_fin = parse_fechas(fecha_inicio, fecha_fin)
+    return get_zonas(zonas=zonas, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, format=format)
 
-@router.get("/consumo/summary", response_model=SummaryResponse)
+@router.get("/consumo/summary", response_model=SummaryResponse, dependencies=[admit])
 def consumo_summary(
     zonas: Optional[List[str]] = Query(None),
     tipo_usuario: Optional[str] = None,
     fecha_inicio: Optional[str] = None,
     fecha_fin: Optional[str] = None
 ):
+    fecha_inicio, fecha_fin = parse_fechas(fecha_inicio, fecha_fin)
     return get_summary(zonas=zonas, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
 
-@router.get("/consumo/anomalies", response_model=AnomaliesResponse)
+@router.get("/consumo/anomalies", response_model=AnomaliesResponse, dependencies=[admit])
 def consumo_anomalies(
     zonas: Optional[List[str]] = Query(None),
     tipo_usuario: Optional[str] = None,
     fecha_inicio: Optional[str] = None,
-    fecha_fin: Optional[str] = None
+    fecha_fin: Optional[str] = None,
+    metodo: str = Query("zscore", regex="^(zscore|mad|seasonal)$", description="Línea base por zona y tipo de usuario: zscore, mad (robusto) o seasonal (residuo estacional)"),
+    umbral: float = Query(2.0, gt=0, description="Puntaje absoluto mínimo para considerar una anomalía"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(100, ge=1, le=1000),
+    format: str = Query("json", regex="^(json|columnar)$")
 ):
-    return get_anomalies(zonas=zonas, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    fecha_inicio, fecha_fin = parse_fechas(fecha_inicio, fecha_fin)
+    return get_anomalies(
+        zonas=zonas, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin,
+        metodo=metodo, umbral=umbral, page=page, page_size=page_size, format=format
+    )
 
-@router.get("/consumo/comparativa", response_model=ComparativaResponse)
+@router.get("/consumo/comparativa", response_model=ComparativaResponse, dependencies=[admit])
 def consumo_comparativa(
     zona1: str,
     zona2: str,
     tipo_usuario: Optional[str] = None,
     fecha_inicio: Optional[str] = None,
-    fecha_fin: Optional[str] = None
+    fecha_fin: Optional[str] = None,
+    format: str = Query("json", regex="^(json|columnar)$")
+):
+    fecha_inicio, fecha_fin = parse_fechas(fecha_inicio, fecha_fin)
+    return get_comparativa(zona1=zona1, zona2=zona2, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, format=format)
+
+@router.get("/consumo/comparativa/matriz", response_model=ComparativaMatrizResponse, dependencies=[admit])
+def consumo_comparativa_matriz(
+    zonas: Optional[List[str]] = Query(None),
+    tipos_usuario: Optional[List[str]] = Query(None),
+    fecha_inicio: Optional[str] = None,
+    fecha_fin: Optional[str] = None,
+    format: str = Query("json", regex="^(json|columnar)$")
 ):
-    return get_comparativa(zona1=zona1, zona2=zona2, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    fecha_inicio, fecha_fin = parse_fechas(fecha_inicio, fecha_fin)
+    # Sin zonas se comparan todas las presentes en el dataset
+    return get_comparativa_matriz(zonas=zonas, tipos_usuario=tipos_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, format=format)
 
-@router.get("/consumo/raw", response_model=TimeSeriesResponse)
+@router.get("/consumo/raw", response_model=TimeSeriesResponse, dependencies=[admit])
 def consumo_raw(
     zonas: Optional[List[str]] = Query(None),
     tipo_usuario: Optional[str] = None,
     fecha_inicio: Optional[str] = None,
-    fecha_fin: Optional[str] = None
+    fecha_fin: Optional[str] = None,
+    format: str = Query("json", regex="^(json|columnar)$")
 ):
-    return get_raw(zonas=zonas, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    fecha_inicio, fecha_fin = parse_fechas(fecha_inicio, fecha_fin)
+    return get_raw(zonas=zonas, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, format=format)
 
 @router.get("/zonas/distinct", response_model=ZonasDistinctResponse)
 def get_zonas_distinct():
-    import pandas as pd
-    from app.config import AGUA_DATASET_URL
-    df = pd.read_csv(AGUA_DATASET_URL, encoding="utf-8")
+    from app.services.dataset_store import get_frame
+    df = get_frame("agua")
     zonas = sorted(df["zona"].dropna().unique())
     return {"zonas": zonas}
 
 @router.get("/tipos_usuario/distinct", response_model=TiposUsuarioDistinctResponse)
 def get_tipos_usuario_distinct():
-    import pandas as pd
-    from app.config import AGUA_DATASET_URL
-    df = pd.read_csv(AGUA_DATASET_URL, encoding="utf-8")
+    from app.services.dataset_store import get_frame
+    df = get_frame("agua")
     tipos = sorted(df["tipo_usuario"].dropna().unique())
     return {"tipos_usuario": tipos}
\ No newline at end of file
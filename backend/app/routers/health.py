@@ -1,12 +1,83 @@
+from typing import Dict, Iterable, Tuple
+
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app import http_cache
+from app.services import (
+    admission, ckan_client, compute, download_cache, memory_manager, metadata_cache, metrics, single_flight
+)
+from app.services.scheduler import scheduler
 
 router = APIRouter()
 
 @router.get("/health", tags=["health"])
-def health_check():
-    # Aquí podrías agregar chequeos adicionales (DB, CKAN, etc.)
+async def health_check():
+    ready = scheduler.is_ready()
+    ckan = scheduler.upstream_status()
+    probe = await ckan_client.probe()
     return {
-        "status": "ok",
-        "ckan": "ok",  # o "fail" si falla la conexión
+        "status": "ok" if ready and ckan != "fail" and probe["ok"] else ("degraded" if ready else "starting"),
+        "ready": ready,
+        "ckan": ckan,  # "ok", "fail" (la última precarga falló) o "unknown" (aún no se consultó)
+        "ckan_probe": probe,  # latencia real de CKAN (status_show), renovada cada HEALTH_PROBE_INTERVAL_SECONDS
+        "datasets": scheduler.report(),
+        "compute": compute.pool.stats(),
+        "admission": admission.controller.stats(),
+        "single_flight": single_flight.stats(),
+        "memory": memory_manager.manager.stats(),
+        "downloads": download_cache.cache.stats(),
+        "metadata": metadata_cache.cache.stats(),
+        "http_cache": http_cache.stats(),
         "version": "1.0.0"
-    }
\ No newline at end of file
+    }
+
+@router.get("/health/ready", tags=["health"])
+def readiness_check():
+    """Responde 503 hasta que termina la primera ronda de precarga (para el readiness probe)"""
+    ready = scheduler.is_ready()
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready})
+
+def _service_metrics() -> Iterable[Tuple[str, str, str, Dict[tuple, float]]]:
+    """Métricas tomadas de los contadores que cada servicio ya lleva (los mismos de /health)"""
+    memory = memory_manager.manager
+    metadata = metadata_cache.cache.stats()
+    downloads = download_cache.cache.stats()
+    responses = http_cache.stats()
+    caches = {
+        "memory": (memory.hits, memory.misses),
+        "http": (responses["hits"], responses["misses"]),
+        "metadata": (metadata["hits"] + metadata["stale"], metadata["misses"]),
+        "downloads": (downloads["hits"], downloads["misses"]),
+    }
+    yield ("monita_cache_hits_total", "counter", "Aciertos por caché",
+           {(("cache", name),): hits for name, (hits, _) in caches.items()})
+    yield ("monita_cache_misses_total", "counter", "Fallos por caché",
+           {(("cache", name),): misses for name, (_, misses) in caches.items()})
+    yield ("monita_cache_hit_ratio", "gauge", "Proporción de aciertos por caché desde el inicio",
+           {(("cache", name),): hits / (hits + misses) for name, (hits, misses) in caches.items() if hits + misses})
+    yield ("monita_memory_cache_bytes", "gauge", "Bytes en la caché de memoria (frames y estructuras derivadas)",
+           {(): memory.used_bytes})
+    rss = metrics.rss_bytes()
+    if rss is not None:
+        yield ("monita_process_resident_bytes", "gauge", "Memoria residente del proceso", {(): rss})
+    pool = compute.pool.stats()
+    yield ("monita_compute_tasks", "gauge", "Tareas del pool de cómputo",
+           {(("state", "queued"),): pool["queued"], (("state", "running"),): pool["running"]})
+    gate = admission.controller
+    queue = gate.stats()
+    yield ("monita_admission_requests", "gauge", "Solicitudes en el control de admisión",
+           {(("state", "queued"),): queue["queued"], (("state", "running"),): queue["running"]})
+    yield ("monita_admission_reserved_bytes", "gauge", "Memoria reservada por las solicitudes admitidas",
+           {(): gate.reserved_bytes})
+    yield ("monita_admission_rejected_total", "counter", "Solicitudes rechazadas con 503",
+           {(("reason", "queue_full"),): gate.rejected, (("reason", "timeout"),): gate.timed_out})
+    probe = ckan_client.last_probe()
+    if probe is not None:
+        yield ("monita_ckan_probe_latency_seconds", "gauge", "Latencia de la última sonda a CKAN",
+               {(): probe["latency_ms"] / 1000})
+        yield ("monita_ckan_up", "gauge", "1 si la última sonda a CKAN respondió bien", {(): int(probe["ok"])})
+
+@router.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Métricas en formato de exposición de Prometheus"""
+    return PlainTextResponse(metrics.render(_service_metrics()), media_type="text/plain; version=0.0.4")
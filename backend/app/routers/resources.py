@@ -1,23 +1,33 @@
 from app.main import limiter
-from fastapi import Request, APIRouter, HTTPException, Query
-from typing import Dict, List, Any, Optional
+from fastapi import Request, APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+from typing import AsyncIterator, Dict, List, Any, Optional
+import io
+import mimetypes
+import os
 import pandas as pd
 import numpy as np
 import math
 import logging
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import httpx
 from urllib.parse import urlparse
-from functools import lru_cache
-import gc
 from app.config import settings
+from app import streaming
+from app.http_cache import cached_route
+from app.responses import ColumnarResponse
+from app.services import (
+    admission, chart_engine, ckan_client, compute, download_cache, filter_index, http_client, kpi_engine, memory_manager, metrics, query_engine, single_flight, snapshot_store, stream_reader,
+    typed_loader
+)
 from app.models.common import (
     ResourcePreviewResponse,
     ResourceColumnsResponse,
     ResourceFilterResponse,
     ResourceKPIsResponse,
     ResourceChartResponse,
+    ResourceQueryRequest,
+    ResourceQueryResponse,
     ColumnKPI,
     ChartDataPoint
 )
@@ -25,16 +35,15 @@ from app.models.common import (
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+async def resource_version(request: Request):
+    """Versión upstream del recurso de la ruta: las respuestas en caché se invalidan cuando cambia"""
+    resource_id = request.path_params["resource_id"]
+    resource = await get_resource_metadata_cached(resource_id)
+    return resource_id, snapshot_store.resource_version(resource)
 
-session = requests.Session()
-retries = Retry(
-    total=settings.MAX_RETRIES,
-    backoff_factor=0.5,
-    status_forcelist=[500, 502, 503, 504]
-)
-session.mount('http://', HTTPAdapter(max_retries=retries))
-session.mount('https://', HTTPAdapter(max_retries=retries))
+router = APIRouter(route_class=cached_route(resource_version))
+
+_load_flight = single_flight.group("recursos")
 
 def validate_url(url: str) -> bool:
     """Valida que la URL sea segura, esté permitida y tenga extensión válida"""
@@ -51,73 +60,83 @@ def validate_url(url: str) -> bool:
     except Exception:
         return False
 
-def get_file_size(url: str) -> int:
+async def get_file_size(url: str) -> int:
     """Obtiene el tamaño del archivo en bytes sin descargarlo completamente"""
     try:
-        response = session.head(url, timeout=settings.REQUEST_TIMEOUT, allow_redirects=True)
+        with metrics.span("head"):
+            response = await http_client.head(url)
         response.raise_for_status()
         size = int(response.headers.get('content-length', 0))
         return size
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error al obtener tamaño del archivo {url}: {str(e)}")
         raise HTTPException(
             status_code=400,
             detail=f"No se pudo obtener el tamaño del archivo: {str(e)}"
         )
 
-@lru_cache(maxsize=128)
-def get_resource_metadata_cached(resource_id: str) -> Dict[str, Any]:
-    """Obtiene los metadatos de un recurso desde CKAN (con caché simple)"""
+async def get_resource_metadata_cached(resource_id: str, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Obtiene los metadatos de un recurso desde la caché de metadatos (con TTL y revalidación
+    en segundo plano; `refresh` fuerza la consulta a CKAN). Los "no encontrado" también se guardan.
+    """
     try:
-        res = session.get(f"{settings.CKAN_BASE_URL}/resource_show?id={resource_id}", timeout=settings.REQUEST_TIMEOUT)
-        data = res.json()
-        if not data.get("success"):
-            raise HTTPException(status_code=404, detail="Recurso no encontrado en CKAN")
-        return data["result"]
+        return await ckan_client.get_resource(resource_id, refresh=refresh)
+    except ckan_client.ResourceNotFound:
+        raise HTTPException(status_code=404, detail="Recurso no encontrado en CKAN")
     except Exception as e:
         logger.error(f"Error al obtener metadatos del recurso {resource_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Error al obtener metadatos del recurso")
 
-def get_resource_dataframe(url: str, formato: str, nrows: Optional[int] = None) -> pd.DataFrame:
-    """Carga un DataFrame desde una URL con manejo de memoria y validaciones"""
+async def get_resource_dataframe(url: str, formato: str, nrows: Optional[int] = None, request: Optional[Request] = None, version: Optional[str] = None) -> pd.DataFrame:
+    """
+    Carga un DataFrame desde una URL con manejo de memoria y validaciones. Las cargas
+    completas pasan por la caché de descargas en disco (`version` evita revalidar con CKAN).
+    """
     if not validate_url(url):
         raise HTTPException(status_code=400, detail="URL no permitida o inválida")
 
-    file_size_bytes = get_file_size(url)
+    if nrows is not None and formato not in ["xlsx", "xls"]:
+        # Vista parcial de un CSV: se leen solo los primeros KB, sin HEAD ni descarga completa
+        try:
+            with metrics.span("download"):
+                return await stream_reader.read_csv_head(url, nrows)
+        except httpx.HTTPError as e:
+            logger.error(f"Error al leer el inicio de {url}: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"No se pudo descargar el archivo: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error al leer archivo {formato} desde {url}: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Error al leer el archivo {formato}: {str(e)}")
+
     max_size_bytes = settings.MAX_FILE_SIZE_MB * 1024 * 1024
-    if file_size_bytes > max_size_bytes:
+    if not download_cache.is_enabled():
+        # Sin caché se verifica el tamaño antes de descargar; con caché el límite se aplica al guardar
+        file_size_bytes = await get_file_size(url)
+        if file_size_bytes > max_size_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"El archivo es demasiado grande. Tamaño máximo permitido: {settings.MAX_FILE_SIZE_MB}MB"
+            )
+
+    try:
+        with metrics.span("download"):
+            content = await download_cache.download(url, version=version, max_bytes=max_size_bytes)
+    except ValueError:
         raise HTTPException(
             status_code=413,
             detail=f"El archivo es demasiado grande. Tamaño máximo permitido: {settings.MAX_FILE_SIZE_MB}MB"
         )
+    except httpx.HTTPError as e:
+        logger.error(f"Error al descargar {url}: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"No se pudo descargar el archivo: {str(e)}")
 
     try:
-        if file_size_bytes > 10 * 1024 * 1024:  # >10MB
-            chunks = []
-            chunk_iter = pd.read_csv(
-                url,
-                chunksize=settings.PANDAS_READ_CHUNKSIZE,
-                nrows=nrows,
-                encoding_errors='replace'
-            ) if formato == "csv" else pd.read_excel(
-                url,
-                chunksize=settings.PANDAS_READ_CHUNKSIZE,
-                nrows=nrows
-            )
-            for chunk in chunk_iter:
-                chunks.append(chunk)
-                if nrows and len(chunks) * settings.PANDAS_READ_CHUNKSIZE >= nrows:
-                    break
-            df = pd.concat(chunks, ignore_index=True)
-            if nrows:
-                df = df.head(nrows)
-            return df
-        if formato == "csv":
-            return pd.read_csv(url, nrows=nrows, encoding_errors='replace')
-        elif formato in ["xlsx", "xls"]:
-            return pd.read_excel(url, nrows=nrows)
-        else:
-            return pd.read_csv(url, nrows=nrows, encoding_errors='replace')
+        with metrics.span("parse"):
+            df = await compute.run(parse_dataframe, content, formato, nrows, len(content), request=request)
+        metrics.count("parsed_rows", len(df))
+        return df
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error al leer archivo {formato} desde {url}: {str(e)}")
         raise HTTPException(
@@ -125,12 +144,146 @@ def get_resource_dataframe(url: str, formato: str, nrows: Optional[int] = None)
             detail=f"Error al leer el archivo {formato}: {str(e)}"
         )
 
+def parse_dataframe(content: bytes, formato: str, nrows: Optional[int], file_size_bytes: int) -> pd.DataFrame:
+    """
+    Parsea el archivo descargado (se ejecuta en el pool de cómputo). Las cargas completas
+    se compactan con el esquema inferido: texto repetitivo como categoría y enteros reducidos.
+    """
+    df = read_dataframe(content, formato, nrows, file_size_bytes)
+    return typed_loader.compact(df) if nrows is None else df
+
+def read_dataframe(content: bytes, formato: str, nrows: Optional[int], file_size_bytes: int) -> pd.DataFrame:
+    if formato in ["xlsx", "xls"]:
+        return pd.read_excel(io.BytesIO(content), nrows=nrows)
+    dialect = stream_reader.sniff(content[:settings.SNIFF_BYTES])
+    if file_size_bytes > 10 * 1024 * 1024:  # >10MB
+        chunks = []
+        chunk_iter = stream_reader.read_csv_bytes(
+            content,
+            nrows=nrows,
+            dialect=dialect,
+            chunksize=settings.PANDAS_READ_CHUNKSIZE
+        )
+        for chunk in chunk_iter:
+            chunks.append(chunk)
+            if nrows and len(chunks) * settings.PANDAS_READ_CHUNKSIZE >= nrows:
+                break
+        df = pd.concat(chunks, ignore_index=True)
+        if nrows:
+            df = df.head(nrows)
+        return df
+    return stream_reader.read_csv_bytes(content, nrows=nrows, dialect=dialect)
+
+def frame_key(resource_id: str, version: str) -> tuple:
+    return ("frame", resource_id, version)
+
+async def load_resource_dataframe(resource_id: str, resource: Dict[str, Any], formato: str, nrows: Optional[int] = None, request: Optional[Request] = None) -> pd.DataFrame:
+    """
+    Carga un recurso: desde la caché de memoria, desde su snapshot columnar local o, si no
+    existe, parseándolo e ingiriéndolo. Una carga completa queda fijada en la caché hasta
+    que la solicitud llama a `release_resource_dataframe`.
+
+    Las cargas simultáneas de la misma versión con las mismas opciones se hacen una sola vez
+    y todos reciben el mismo DataFrame (no se debe modificar en sitio). La carga compartida no
+    depende de la conexión de ningún cliente: si uno se desconecta, deja de esperarla.
+    """
+    version = snapshot_store.resource_version(resource)
+    key = frame_key(resource_id, version)
+    if nrows is not None:
+        cached = memory_manager.manager.get(key)
+        if cached is not None:
+            return cached.head(nrows)
+    else:
+        cached = memory_manager.manager.acquire(key)
+        if cached is not None:
+            return cached
+    flight_key = (resource_id, resource.get("url"), version, formato, nrows)
+    load = _load_flight.do(flight_key, lambda: _load_resource_dataframe(resource_id, resource, version, formato, nrows))
+    # Las etapas internas (descarga, parseo) se atribuyen a quien inició la carga compartida
+    with metrics.span("load"):
+        df = await compute.wait(load, request)
+    if nrows is None and not memory_manager.manager.pin(key):
+        # Se descartó entre la carga y este punto: se vuelve a guardar, ya fijado
+        memory_manager.manager.put(key, df)
+        memory_manager.manager.pin(key)
+    return df
+
+def release_resource_dataframe(resource_id: str, resource: Dict[str, Any]) -> None:
+    """Suelta el DataFrame completo fijado por `load_resource_dataframe` (puede volver a descartarse)"""
+    memory_manager.manager.unpin(frame_key(resource_id, snapshot_store.resource_version(resource)))
+
+async def _load_resource_dataframe(resource_id: str, resource: Dict[str, Any], version: str, formato: str, nrows: Optional[int]) -> pd.DataFrame:
+    # Abrir el snapshot es un mmap sin copia: va al pool de hilos (en procesos se copiaría al devolverlo)
+    with metrics.span("snapshot"):
+        df = await run_in_threadpool(snapshot_store.read, resource_id, version, nrows=nrows)
+    if df is None and nrows is not None:
+        # Una vista parcial no sirve como snapshot del recurso completo
+        return await get_resource_dataframe(resource["url"], formato, nrows=nrows)
+    if df is None:
+        # Un solo worker parsea y publica el snapshot; los demás lo esperan y lo abren compartido
+        async with snapshot_store.apublishing(resource_id):
+            df = await run_in_threadpool(snapshot_store.read, resource_id, version)
+            if df is None:
+                df = await get_resource_dataframe(resource["url"], formato, version=version)
+                with metrics.span("snapshot"):
+                    df = await run_in_threadpool(snapshot_store.publish, resource_id, version, df)
+    if nrows is None:
+        memory_manager.manager.discard_stale(resource_id, version)
+        # Medir el uso profundo recorre las columnas de texto: se hace fuera del event loop
+        await run_in_threadpool(memory_manager.manager.put, frame_key(resource_id, version), df)
+    return df
+
+def estimate_cost(resource_id: str, resource: Dict[str, Any]) -> int:
+    """
+    Memoria estimada de analizar el recurso completo: solo el trabajo si el frame ya está en
+    memoria, el snapshot más el trabajo si hay que abrirlo (con las filas de cada uno), o el
+    parseo si hay que descargarlo (según el tamaño que informa CKAN o el de la descarga en caché).
+    """
+    version = snapshot_store.resource_version(resource)
+    key = frame_key(resource_id, version)
+    resident = memory_manager.manager.size_of(key)
+    if resident is not None:
+        frame = memory_manager.manager.peek(key)
+        return admission.work_cost(resident, len(frame) if isinstance(frame, pd.DataFrame) else 0)
+    mapped = snapshot_store.size(resource_id, version)
+    if mapped is not None:
+        return mapped + admission.work_cost(mapped, snapshot_store.num_rows(resource_id, version) or 0)
+    file_size = admission.file_size(resource)
+    if not resource.get("size") and download_cache.is_enabled():
+        cached = download_cache.cache.entry(resource.get("url", ""))
+        if cached is not None:
+            file_size = cached.size
+    return admission.parse_cost(file_size)
+
+async def admit_resource(request: Request, resource_id: str) -> AsyncIterator[None]:
+    """Dependencia de los endpoints pesados: espera turno en el control de admisión según el costo estimado"""
+    resource = await get_resource_metadata_cached(resource_id)
+    async with admission.controller.admit(estimate_cost(resource_id, resource), request):
+        yield
+
+async def warm_resource(resource_id: str) -> str:
+    """
+    Tarea de precarga: actualiza los metadatos y, si cambió la versión upstream, deja listo
+    el snapshot y los KPIs del recurso. Devuelve la versión vigente.
+    """
+    resource = await get_resource_metadata_cached(resource_id, refresh=True)
+    formato = resource.get("format", "").lower()
+    version = snapshot_store.resource_version(resource)
+    if kpi_engine.get_cached(resource_id, version) is None:
+        df = await load_resource_dataframe(resource_id, resource, formato)
+        try:
+            await compute.run(kpi_engine.compute, resource_id, version, df)
+        finally:
+            release_resource_dataframe(resource_id, resource)
+    return version
+
 @router.get("/resources/{resource_id}/preview", response_model=ResourcePreviewResponse)
 @limiter.limit("10/minute")
 async def get_resource_preview(
     request: Request,
     resource_id: str,
-    rows: int = Query(10, ge=1, le=100, description="Número de filas a devolver")
+    rows: int = Query(10, ge=1, le=100, description="Número de filas a devolver"),
+    format: str = Query("json", regex="^(json|columnar)$", description="Formato de respuesta: json (filas) o columnar")
 ):
     """
     Devuelve una vista previa de las primeras filas de un recurso tabular.
@@ -140,6 +293,7 @@ async def get_resource_preview(
     **Parámetros:**
     - `resource_id`: ID del recurso en CKAN.
     - `rows`: Número de filas a mostrar (máx: 100).
+    - `format`: "json" (lista de filas) o "columnar" ({"columns": [...], "data": {col: [...]}}).
 
     **Ejemplo de uso:**
     ```
@@ -152,17 +306,17 @@ async def get_resource_preview(
     - 413: El archivo es demasiado grande.
     - 429: Se excedió el rate limit.
     """
-    df = None
     try:
-        resource = get_resource_metadata_cached(resource_id)
-        url = resource["url"]
+        resource = await get_resource_metadata_cached(resource_id)
         formato = resource.get("format", "").lower()
         if not any(ext in formato for ext in ["csv", "xlsx", "xls"]):
             raise HTTPException(status_code=400, detail="Formato de archivo no soportado para vista previa")
-        df = get_resource_dataframe(url, formato, nrows=rows + 1)
+        df = await load_resource_dataframe(resource_id, resource, formato, nrows=rows + 1, request=request)
         total_rows = len(df)
         has_more = total_rows > rows
         df_preview = df.head(rows)
+        if format == "columnar":
+            return ColumnarResponse(df_preview, extra={"total_rows": total_rows, "has_more": has_more})
         return {
             "columns": df_preview.columns.tolist(),
             "rows": df_preview.replace({np.nan: None}).to_dict(orient="records"),
@@ -174,10 +328,6 @@ async def get_resource_preview(
     except Exception as e:
         logger.error(f"Error en get_resource_preview: {str(e)}")
         raise HTTPException(status_code=500, detail="Error al generar la vista previa")
-    finally:
-        if df is not None:
-            del df
-            gc.collect()
 
 @router.get("/resources/{resource_id}/columns", response_model=ResourceColumnsResponse)
 @limiter.limit("20/minute")
@@ -203,24 +353,55 @@ async def get_columns(
     - 404: El recurso no existe.
     - 429: Se excedió el rate limit.
     """
-    df = None
     try:
-        resource = get_resource_metadata_cached(resource_id)
-        url = resource["url"]
+        resource = await get_resource_metadata_cached(resource_id)
         formato = resource.get("format", "").lower()
-        df = get_resource_dataframe(url, formato, nrows=1)
+        df = await load_resource_dataframe(resource_id, resource, formato, nrows=1, request=request)
         return {"columns": df.columns.tolist()}
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error en get_columns: {str(e)}")
         raise HTTPException(status_code=500, detail="Error al obtener las columnas")
-    finally:
-        if df is not None:
-            del df
-            gc.collect()
 
-@router.get("/resources/{resource_id}/filter", response_model=ResourceFilterResponse)
+@router.get("/resources/{resource_id}/download")
+@limiter.limit("5/minute")
+async def download_resource(
+    request: Request,
+    resource_id: str
+):
+    """
+    Descarga el archivo original del recurso. Se reenvía desde CKAN a medida que llega
+    (sin guardarlo en memoria ni en disco), comprimido con gzip o brotli según Accept-Encoding.
+
+    **Advertencia:** Límite de 5 solicitudes por minuto por IP.
+
+    **Parámetros:**
+    - `resource_id`: ID del recurso en CKAN.
+
+    **Ejemplo de uso:**
+    ```
+    GET /resources/xxxx-agua-dataset-id/download
+    ```
+
+    **Errores comunes:**
+    - 400: La URL del recurso no es válida o no se pudo descargar.
+    - 404: El recurso no existe.
+    - 413: El archivo es demasiado grande.
+    - 429: Se excedió el rate limit.
+    """
+    resource = await get_resource_metadata_cached(resource_id)
+    url = resource.get("url", "")
+    if not validate_url(url):
+        raise HTTPException(status_code=400, detail="URL no permitida o inválida")
+    filename = os.path.basename(urlparse(url).path) or resource_id
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return await streaming.proxy_download(
+        url, request.headers.get("accept-encoding"), filename, media_type,
+        version=snapshot_store.resource_version(resource)
+    )
+
+@router.get("/resources/{resource_id}/filter", response_model=ResourceFilterResponse, dependencies=[Depends(admit_resource)])
 @limiter.limit("10/minute")
 async def filter_resource(
     request: Request,
@@ -229,10 +410,12 @@ async def filter_resource(
     page_size: int = Query(settings.CHUNK_SIZE, ge=1, le=100, description="Tamaño de página"),
     filters: Optional[str] = Query(None, description="Filtros en formato JSON: {\"columna\": \"valor\"}"),
     sort_by: Optional[str] = Query(None, description="Columna por la que ordenar"),
-    sort_order: str = Query("asc", regex="^(asc|desc)$", description="Orden: asc (ascendente) o desc (descendente)")
+    sort_order: str = Query("asc", regex="^(asc|desc)$", description="Orden: asc (ascendente) o desc (descendente)"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (next_cursor de la respuesta anterior)"),
+    format: str = Query("json", regex="^(json|columnar|csv|ndjson)$", description="Formato de respuesta: json (filas), columnar, o exportación csv / ndjson")
 ):
     """
-    Filtra y pagina los datos del recurso tabular.
+    Filtra y pagina los datos del recurso tabular, o exporta todas las filas filtradas.
 
     **Advertencia:** Límite de 10 solicitudes por minuto por IP.
 
@@ -243,52 +426,85 @@ async def filter_resource(
     - `filters`: Filtros en formato JSON, ej: {"columna": "valor"}.
     - `sort_by`: Columna para ordenar.
     - `sort_order`: "asc" o "desc".
+    - `cursor`: continúa desde `next_cursor` de la respuesta anterior con los mismos filtros y orden (ignora `page`).
+    - `format`: "json" (lista de filas), "columnar" ({"columns": [...], "data": {col: [...]}}),
+      o "csv" / "ndjson": exporta en streaming todas las filas filtradas y ordenadas (ignora `page`,
+      `page_size` y `cursor`), comprimidas con gzip o brotli según Accept-Encoding.
 
     **Ejemplo de uso:**
     ```
     GET /resources/xxxx-agua-dataset-id/filter?page=1&page_size=20&filters={"comuna":"1"}
+    GET /resources/xxxx-agua-dataset-id/filter?filters={"comuna":"1"}&sort_by=fecha&format=csv
     ```
 
     **Errores comunes:**
-    - 400: Filtros inválidos o recurso no tabular.
+    - 400: Filtros inválidos, cursor inválido o expirado, o recurso no tabular.
     - 404: El recurso no existe.
     - 429: Se excedió el rate limit.
     """
     df = None
     try:
-        resource = get_resource_metadata_cached(resource_id)
-        url = resource["url"]
+        resource = await get_resource_metadata_cached(resource_id)
         formato = resource.get("format", "").lower()
-        df = get_resource_dataframe(url, formato)
-        total_rows = len(df)
-        total_pages = math.ceil(total_rows / page_size)
+        df = await load_resource_dataframe(resource_id, resource, formato, request=request)
+        filter_dict = {}
         if filters:
             import json
             try:
                 filter_dict = json.loads(filters)
-                for col, val in filter_dict.items():
-                    if col in df.columns:
-                        if pd.api.types.is_numeric_dtype(df[col]):
-                            try:
-                                df = df[df[col] == float(val)]
-                            except (ValueError, TypeError):
-                                df = df[df[col].astype(str).str.contains(str(val), case=False, na=False)]
-                        else:
-                            df = df[df[col].astype(str).str.contains(str(val), case=False, na=False)]
             except json.JSONDecodeError:
                 raise HTTPException(status_code=400, detail="Formato de filtros inválido")
-        if sort_by and sort_by in df.columns:
-            df = df.sort_values(by=sort_by, ascending=(sort_order == "asc"))
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        df_page = df.iloc[start_idx:end_idx]
+        version = snapshot_store.resource_version(resource)
+        ascending = sort_order == "asc"
+        sort_by = sort_by if sort_by in df.columns else None
+        query_key = filter_index.query_key(filter_dict, sort_by, ascending)
+        after = None
+        if cursor and format not in streaming.EXPORT_MEDIA_TYPES:
+            try:
+                after = filter_index.decode_cursor(cursor, query_key)
+            except filter_index.CursorError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        with metrics.span("filter"):
+            try:
+                positions, start_idx = await compute.run(
+                    filter_index.select, resource_id, version, df, filter_dict, sort_by, ascending, after, request=request
+                )
+            except filter_index.CursorError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        if format in streaming.EXPORT_MEDIA_TYPES:
+            export = streaming.export_response(
+                df, positions, format, request.headers.get("accept-encoding"), filename=resource_id,
+                background=BackgroundTask(release_resource_dataframe, resource_id, resource)
+            )
+            df = None  # el frame se suelta cuando la respuesta termina de enviarse
+            return export
+        total_rows = len(positions)
+        total_pages = math.ceil(total_rows / page_size)
+        if after is not None:
+            page = start_idx // page_size + 1
+        else:
+            start_idx = (page - 1) * page_size
+        end_idx = min(start_idx + page_size, total_rows)
+        df_page = df.iloc[positions[start_idx:end_idx]]
+        next_cursor = None
+        if end_idx < total_rows:
+            next_cursor = filter_index.encode_cursor(df, query_key, sort_by, positions[end_idx - 1])
+        if format == "columnar":
+            return ColumnarResponse(df_page, extra={
+                "page": page,
+                "page_size": page_size,
+                "total_pages": total_pages,
+                "total": total_rows,
+                "next_cursor": next_cursor
+            })
         return {
             "columns": df.columns.tolist(),
             "rows": df_page.replace({np.nan: None}).to_dict(orient="records"),
             "page": page,
             "page_size": page_size,
             "total_pages": total_pages,
-            "total": total_rows
+            "total": total_rows,
+            "next_cursor": next_cursor
         }
     except HTTPException:
         raise
@@ -297,17 +513,18 @@ async def filter_resource(
         raise HTTPException(status_code=500, detail="Error al filtrar los datos")
     finally:
         if df is not None:
-            del df
-            gc.collect()
+            release_resource_dataframe(resource_id, resource)
 
-@router.get("/resources/{resource_id}/kpis", response_model=ResourceKPIsResponse)
+@router.get("/resources/{resource_id}/kpis", response_model=ResourceKPIsResponse, dependencies=[Depends(admit_resource)])
 @limiter.limit("5/minute")
 async def get_resource_kpis(
     request: Request,
     resource_id: str
 ):
     """
-    Calcula y devuelve KPIs automáticos para las columnas numéricas del recurso tabular.
+    Calcula y devuelve KPIs automáticos para las columnas numéricas del recurso tabular:
+    conteo, nulos, media, mínimo, máximo, suma, desviación estándar y percentiles 50/90/99.
+    Se calculan en una sola pasada y se guardan por versión del recurso.
 
     **Advertencia:** Límite de 5 solicitudes por minuto por IP.
 
@@ -326,24 +543,15 @@ async def get_resource_kpis(
     """
     df = None
     try:
-        resource = get_resource_metadata_cached(resource_id)
-        url = resource["url"]
+        resource = await get_resource_metadata_cached(resource_id)
         formato = resource.get("format", "").lower()
-        df = get_resource_dataframe(url, formato)
-        kpis = []
-        for col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                col_kpi = {
-                    "column": col,
-                    "count": int(df[col].count()),
-                    "mean": float(df[col].mean()) if not df[col].empty else None,
-                    "min": float(df[col].min()) if not df[col].empty else None,
-                    "max": float(df[col].max()) if not df[col].empty else None,
-                    "sum": float(df[col].sum()) if not df[col].empty else None,
-                    "std": float(df[col].std()) if len(df[col]) > 1 else None
-                }
-                kpis.append(ColumnKPI(**col_kpi))
-        return {"kpis": kpis}
+        version = snapshot_store.resource_version(resource)
+        state = kpi_engine.get_cached(resource_id, version)
+        if state is None:
+            df = await load_resource_dataframe(resource_id, resource, formato, request=request)
+            with metrics.span("aggregate"):
+                state = await compute.run(kpi_engine.compute, resource_id, version, df, request=request)
+        return {"kpis": [ColumnKPI(**col_kpi) for col_kpi in state.to_kpis()]}
     except HTTPException:
         raise
     except Exception as e:
@@ -351,17 +559,17 @@ async def get_resource_kpis(
         raise HTTPException(status_code=500, detail="Error al calcular los KPIs")
     finally:
         if df is not None:
-            del df
-            gc.collect()
+            release_resource_dataframe(resource_id, resource)
 
-@router.get("/resources/{resource_id}/chart", response_model=ResourceChartResponse)
+@router.get("/resources/{resource_id}/chart", response_model=ResourceChartResponse, dependencies=[Depends(admit_resource)])
 @limiter.limit("5/minute")
 async def get_chart_data(
     request: Request,
     resource_id: str,
     column: str,
     chart_type: str = Query("histogram", regex="^(histogram|bar|line|pie)$"),
-    bins: int = Query(10, ge=2, le=50, description="Número de bins para histograma")
+    bins: int = Query(10, ge=2, le=50, description="Número de bins para histograma"),
+    max_points: int = Query(settings.CHART_MAX_POINTS, ge=3, le=5000, description="Máximo de puntos para series de barras o líneas")
 ):
     """
     Genera datos agregados para gráficas a partir de una columna del recurso tabular.
@@ -373,6 +581,8 @@ async def get_chart_data(
     - `column`: Columna para graficar.
     - `chart_type`: Tipo de gráfica ("histogram", "bar", "line", "pie").
     - `bins`: Número de bins para histogramas (2-50).
+    - `max_points`: Máximo de puntos devueltos en "bar" y "line" sobre columnas numéricas. Las líneas
+      se reducen con LTTB (conserva picos y valles); las barras se agrupan en intervalos.
 
     **Ejemplo de uso:**
     ```
@@ -386,37 +596,25 @@ async def get_chart_data(
     """
     df = None
     try:
-        resource = get_resource_metadata_cached(resource_id)
-        url = resource["url"]
+        resource = await get_resource_metadata_cached(resource_id)
         formato = resource.get("format", "").lower()
-        df = get_resource_dataframe(url, formato)
-        if column not in df.columns:
-            raise HTTPException(status_code=404, detail=f"Columna '{column}' no encontrada")
-        data_points = []
-        if pd.api.types.is_numeric_dtype(df[column]):
-            if chart_type == "histogram":
-                hist, bin_edges = np.histogram(df[column].dropna(), bins=bins)
-                for i in range(len(hist)):
-                    label = f"{bin_edges[i]:.2f}-{bin_edges[i+1]:.2f}"
-                    data_points.append(ChartDataPoint(label=label, value=float(hist[i])))
-            else:
-                if chart_type == "pie":
-                    value_counts = df[column].value_counts().head(10)
-                    for val, count in value_counts.items():
-                        data_points.append(ChartDataPoint(label=str(val), value=float(count)))
-                else:
-                    unique_values = df[column].drop_duplicates().sort_values()
-                    for val in unique_values:
-                        count = (df[column] == val).sum()
-                        data_points.append(ChartDataPoint(label=str(val), value=float(count)))
-        else:
-            value_counts = df[column].value_counts().head(20)
-            for val, count in value_counts.items():
-                data_points.append(ChartDataPoint(label=str(val), value=float(count)))
+        version = snapshot_store.resource_version(resource)
+        counts = chart_engine.get_cached(resource_id, version, column)
+        if counts is None:
+            df = await load_resource_dataframe(resource_id, resource, formato, request=request)
+            if column not in df.columns:
+                raise HTTPException(status_code=404, detail=f"Columna '{column}' no encontrada")
+            with metrics.span("aggregate"):
+                counts = await compute.run(chart_engine.compute, resource_id, version, df, column, request=request)
+        with metrics.span("aggregate"):
+            points, total_points = await compute.run(
+                chart_engine.cached_points, resource_id, version, column, counts, chart_type, bins, max_points, request=request
+            )
         return {
             "column": column,
             "chart_type": chart_type,
-            "data": data_points
+            "data": [ChartDataPoint(**point) for point in points],
+            "total_points": total_points
         }
     except HTTPException:
         raise
@@ -425,5 +623,86 @@ async def get_chart_data(
         raise HTTPException(status_code=500, detail="Error al generar los datos del gráfico")
     finally:
         if df is not None:
-            del df
-            gc.collect()
\ No newline at end of file
+            release_resource_dataframe(resource_id, resource)
+
+@router.post("/resources/{resource_id}/query", response_model=ResourceQueryResponse, dependencies=[Depends(admit_resource)])
+@limiter.limit("10/minute")
+async def query_resource(
+    request: Request,
+    resource_id: str,
+    query: ResourceQueryRequest,
+    format: str = Query("json", regex="^(json|columnar)$", description="Formato de respuesta: json (filas) o columnar")
+):
+    """
+    Ejecuta una consulta estructurada (filtros, agrupación, agregados y orden) sobre el
+    snapshot local del recurso con DuckDB. No se acepta SQL libre: las columnas se validan
+    contra el recurso y los valores se envían como parámetros.
+
+    **Advertencia:** Límite de 10 solicitudes por minuto por IP. Se devuelven como máximo
+    QUERY_MAX_ROWS filas y la consulta se interrumpe a los QUERY_TIMEOUT_SECONDS segundos.
+
+    **Cuerpo:**
+    - `select`: columnas a devolver cuando no hay agregados (vacío: todas).
+    - `where`: condiciones `{"column", "op", "value"}` unidas con AND. Operadores: =, !=, <, <=, >, >=,
+      in, not_in, between ([desde, hasta]), contains (sin distinguir mayúsculas), is_null, not_null.
+    - `group_by`: columnas de agrupación.
+    - `aggregates`: `{"fn", "column", "alias"}` con fn en count, count_distinct, sum, avg, min, max, median, stddev.
+    - `order_by`: `{"column", "direction"}`; la columna puede ser un alias de agregado.
+    - `limit`: filas a devolver (máx: QUERY_MAX_ROWS).
+
+    **Ejemplo de uso:**
+    ```
+    POST /resources/xxxx-agua-dataset-id/query
+    {"where": [{"column": "consumo", "op": ">=", "value": 10}],
+     "group_by": ["comuna"],
+     "aggregates": [{"fn": "sum", "column": "consumo", "alias": "total"}, {"fn": "count"}],
+     "order_by": [{"column": "total", "direction": "desc"}],
+     "limit": 20}
+    ```
+
+    **Errores comunes:**
+    - 400: Consulta inválida (columna inexistente, operador o tipos incompatibles) o recurso no tabular.
+    - 404: El recurso no existe.
+    - 408: La consulta superó el tiempo máximo.
+    - 429: Se excedió el rate limit.
+    - 501: El motor de consultas no está instalado.
+    """
+    if not query_engine.is_available():
+        raise HTTPException(status_code=501, detail="El motor de consultas (duckdb) no está instalado")
+    df = None
+    try:
+        resource = await get_resource_metadata_cached(resource_id)
+        formato = resource.get("format", "").lower()
+        version = snapshot_store.resource_version(resource)
+        # La tabla Arrow del snapshot se consulta en su memory-map, sin pasar por pandas
+        source = await run_in_threadpool(snapshot_store.read_table, resource_id, version)
+        if source is not None:
+            columns = source.column_names
+        else:
+            df = await load_resource_dataframe(resource_id, resource, formato, request=request)
+            # El frame puede estar compartido con otras solicitudes: se renombra sobre una vista
+            source = df.rename(columns=str)
+            columns = source.columns.tolist()
+        try:
+            with metrics.span("query"):
+                result, truncated = await compute.run(query_engine.run_query, source, query.dict(), columns, request=request)
+        except query_engine.QueryError as e:
+            raise HTTPException(status_code=400, detail=f"Consulta inválida: {str(e)}")
+        except query_engine.QueryTimeout as e:
+            raise HTTPException(status_code=408, detail=str(e))
+        if format == "columnar":
+            return ColumnarResponse(result, extra={"row_count": len(result), "truncated": truncated})
+        return {
+            "columns": result.columns.tolist(),
+            "rows": result.astype(object).where(result.notna(), None).to_dict(orient="records"),
+            "row_count": len(result),
+            "truncated": truncated
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error en query_resource: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error al ejecutar la consulta")
+    finally:
+        if df is not None:
+            release_resource_dataframe(resource_id, resource)
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional
+
+from fastapi import HTTPException, Request
+
+from app.config import settings
+from app.services import dataset_store
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def work_cost(frame_bytes: int, rows: int = 0) -> int:
+    """
+    Memoria de trabajo de un análisis sobre un frame ya cargado: una parte proporcional al
+    frame (resultados, copias de columnas) y otra por fila (máscaras, posiciones, agrupaciones).
+    """
+    return int(frame_bytes * settings.ADMISSION_WORK_FACTOR + rows * settings.ADMISSION_ROW_BYTES)
+
+
+def parse_cost(file_bytes: int) -> int:
+    """Memoria de parsear un archivo de `file_bytes` bytes y analizarlo después"""
+    frame_bytes = file_bytes * settings.ADMISSION_PARSE_FACTOR
+    return int(frame_bytes + work_cost(frame_bytes))
+
+
+def file_size(resource: Dict[str, Any]) -> int:
+    """Tamaño del archivo de un recurso según CKAN; si no lo informa, el máximo permitido"""
+    try:
+        size = int(resource.get("size") or 0)
+    except (TypeError, ValueError):
+        size = 0
+    return size if size > 0 else settings.MAX_FILE_SIZE_MB * MB
+
+
+@dataclass
+class _Waiter:
+    cost: int
+    granted: "asyncio.Future[None]"
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class AdmissionController:
+    """
+    Control de admisión por costo para los endpoints pesados.
+
+    Cada solicitud declara su costo estimado en bytes de memoria y se admite si hay menos
+    de `max_concurrent` en curso y la suma de los costos reservados cabe en `budget_bytes`
+    (una sola solicitud siempre se admite, aunque su costo supere el presupuesto). Las
+    demás esperan en orden de llegada, como mucho `max_queue` a la vez y `queue_timeout`
+    segundos cada una; pasado eso se responde 503 con Retry-After estimado según lo que
+    tardan las solicitudes y cuántas hay delante.
+
+    El presupuesto es por proceso: con varios workers se reparte la memoria de la máquina.
+    """
+
+    def __init__(self, max_concurrent: int, budget_bytes: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.budget_bytes = budget_bytes
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._waiters: Deque[_Waiter] = deque()
+        self.running = 0
+        self.reserved_bytes = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        # Duración media de las solicitudes admitidas (media móvil), para el Retry-After
+        self.service_seconds = 1.0
+
+    def _fits(self, cost: int) -> bool:
+        if self.running >= self.max_concurrent:
+            return False
+        return self.running == 0 or self.reserved_bytes + cost <= self.budget_bytes
+
+    def _grant(self, cost: int) -> None:
+        self.running += 1
+        self.reserved_bytes += cost
+        self.admitted += 1
+
+    def _release(self, cost: int, started: Optional[float] = None) -> None:
+        self.running -= 1
+        self.reserved_bytes -= cost
+        if started is not None:
+            self.service_seconds = 0.8 * self.service_seconds + 0.2 * (time.monotonic() - started)
+        self._wake()
+
+    def _wake(self) -> None:
+        # En orden de llegada: una solicitud grande no queda relegada por las pequeñas
+        while self._waiters and self._fits(self._waiters[0].cost):
+            waiter = self._waiters.popleft()
+            if waiter.granted.done():
+                continue
+            self._grant(waiter.cost)
+            waiter.granted.set_result(None)
+
+    def retry_after(self) -> int:
+        ahead = len(self._waiters) + 1
+        return max(1, min(60, math.ceil(self.service_seconds * ahead / max(1, self.max_concurrent))))
+
+    def _saturated(self, detail: str) -> HTTPException:
+        return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(self.retry_after())})
+
+    @asynccontextmanager
+    async def admit(self, cost: int, request: Optional[Request] = None) -> AsyncIterator[None]:
+        """Reserva `cost` bytes mientras dura el bloque; con `request` deja la cola si el cliente se desconecta"""
+        cost = max(0, min(cost, self.budget_bytes))
+        if not self._waiters and self._fits(cost):
+            self._grant(cost)
+        else:
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise self._saturated("El servidor está al límite de su capacidad, intente de nuevo más tarde")
+            await self._wait_turn(cost, request)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(cost, started)
+
+    async def _wait_turn(self, cost: int, request: Optional[Request]) -> None:
+        waiter = _Waiter(cost=cost, granted=asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        deadline = waiter.enqueued_at + self.queue_timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timed_out += 1
+                    raise self._saturated("La solicitud esperó demasiado en la cola, intente de nuevo más tarde")
+                timeout = min(remaining, settings.COMPUTE_DISCONNECT_POLL_SECONDS) if request is not None else remaining
+                done, _ = await asyncio.wait({waiter.granted}, timeout=timeout)
+                if done:
+                    return
+                if request is not None and await request.is_disconnected():
+                    self.cancelled += 1
+                    raise HTTPException(status_code=499, detail="El cliente cerró la conexión")
+        except BaseException:
+            if waiter.granted.done() and not waiter.granted.cancelled():
+                # El turno llegó justo al salir: se devuelve para no perder la reserva
+                self._release(cost)
+            else:
+                waiter.granted.cancel()
+                self._forget(waiter)
+            raise
+
+    def _forget(self, waiter: _Waiter) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        # Quien esperaba delante pudo estar bloqueando a los siguientes
+        self._wake()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "running": self.running,
+            "max_concurrent": self.max_concurrent,
+            "reserved_mb": round(self.reserved_bytes / MB, 1),
+            "budget_mb": round(self.budget_bytes / MB, 1),
+            "queued": len(self._waiters),
+            "queued_mb": round(sum(w.cost for w in self._waiters) / MB, 1),
+            "oldest_wait_seconds": round(now - self._waiters[0].enqueued_at, 2) if self._waiters else 0,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+            "retry_after": self.retry_after(),
+        }
+
+
+controller = AdmissionController(
+    max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+    budget_bytes=settings.ADMISSION_MEMORY_MB * MB,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+)
+
+
+def admit_dataset(domain: str) -> Callable[[Request], AsyncIterator[None]]:
+    """
+    Dependencia de los análisis de los routers de dominio: cada solicitud reserva la memoria
+    de trabajo sobre el frame del dataset (o la de parsearlo, si todavía no está cargado).
+    """
+
+    async def dependency(request: Request) -> AsyncIterator[None]:
+        loaded = dataset_store.store.loaded_size(domain)
+        cost = work_cost(*loaded) if loaded is not None else parse_cost(settings.MAX_FILE_SIZE_MB * MB)
+        async with controller.admit(cost, request):
+            yield
+
+    return dependency
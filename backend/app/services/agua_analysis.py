@@ -1,51 +1,85 @@
+import numpy as np
 import pandas as pd
 from app.services.ckan_client import search_datasets
-from app.config import AGUA_DATASET_URL
+from app.responses import ColumnarResponse
+from app.services import consumo_cube, metrics
+from app.services.anomaly_engine import AnomalyEngine
+from app.services.dataset_store import get_frame, get_artifact, store
 from app.models.common import (
     TimeSeriesResponse, TimeSeriesItem, ZonasResponse, ZonaItem,
     SummaryResponse, SummaryKPIs, AnomaliesResponse, AnomalyItem,
-    ComparativaResponse, ComparativaItem, DatasetsResponse, DatasetInfo
+    ComparativaResponse, ComparativaItem, ComparativaMatrizResponse, ComparativaMatrizItem,
+    DatasetsResponse, DatasetInfo
 )
 
 def apply_filters(df, zonas=None, tipo_usuario=None, fecha_inicio=None, fecha_fin=None):
+    """Filtra filas; las fechas llegan como Timestamp (consumo_cube.parse_fecha) y se comparan con datetime64"""
     if zonas:
         df = df[df["zona"].isin(zonas)]
     if tipo_usuario:
         df = df[df["tipo_usuario"] == tipo_usuario]
-    if fecha_inicio:
+    if fecha_inicio is not None:
         df = df[df["fecha"] >= fecha_inicio]
-    if fecha_fin:
+    if fecha_fin is not None:
         df = df[df["fecha"] <= fecha_fin]
     return df
 
-def get_timeseries(zonas=None, tipo_usuario=None, fecha_inicio=None, fecha_fin=None):
-    df = pd.read_csv(AGUA_DATASET_URL, encoding="utf-8")
-    df = apply_filters(df, zonas, tipo_usuario, fecha_inicio, fecha_fin)
-    df["fecha"] = pd.to_datetime(df["fecha"])
-    df["mes"] = df["fecha"].dt.to_period("M").astype(str)
-    timeseries = df.groupby("mes")["consumo_m3"].sum().reset_index()
+store.add_builder("agua", "cubo", lambda frame: consumo_cube.build_cube(frame, "consumo_m3"))
+store.add_builder("agua", "anomalias", lambda frame: AnomalyEngine(frame, "consumo_m3"))
+
+def get_cube(fecha_inicio=None, fecha_fin=None):
+    """Cubo de agregados si puede responder el rango de fechas pedido, si no None"""
+    cube = get_artifact("agua", "cubo")
+    return cube if consumo_cube.can_answer(cube, fecha_inicio, fecha_fin) else None
+
+@metrics.timed("analysis")
+def get_timeseries(zonas=None, tipo_usuario=None, fecha_inicio=None, fecha_fin=None, format="json"):
+    cube = get_cube(fecha_inicio, fecha_fin)
+    if cube is not None:
+        cells = consumo_cube.filter_cells(cube, zonas, tipo_usuario, fecha_inicio, fecha_fin)
+        timeseries = consumo_cube.timeseries(cells).rename("consumo_m3").reset_index()
+    else:
+        df = get_frame("agua")
+        df = apply_filters(df, zonas, tipo_usuario, fecha_inicio, fecha_fin)
+        mes = df["fecha"].dt.to_period("M").astype(str).rename("mes")
+        timeseries = df.groupby(mes)["consumo_m3"].sum().rename("consumo_m3").reset_index()
+    if format == "columnar":
+        return ColumnarResponse(timeseries)
     return TimeSeriesResponse(
         series=[
-            TimeSeriesItem(mes=row["mes"], consumo_m3=row["consumo_m3"])
-            for _, row in timeseries.iterrows()
+            TimeSeriesItem(mes=mes, consumo_m3=valor)
+            for mes, valor in zip(timeseries["mes"].tolist(), timeseries["consumo_m3"].tolist())
         ]
     )
 
-def get_zonas(zonas=None, tipo_usuario=None, fecha_inicio=None, fecha_fin=None):
-    df = pd.read_csv(AGUA_DATASET_URL, encoding="utf-8")
-    df = apply_filters(df, zonas, tipo_usuario, fecha_inicio, fecha_fin)
-    df["zona"] = df["zona"].fillna("Desconocida")
-    zonas_df = df.groupby("zona")["consumo_m3"].sum().reset_index()
-    zonas_df = zonas_df.sort_values(by="consumo_m3", ascending=False)
+@metrics.timed("analysis")
+def get_zonas(zonas=None, tipo_usuario=None, fecha_inicio=None, fecha_fin=None, format="json"):
+    cube = get_cube(fecha_inicio, fecha_fin)
+    if cube is not None:
+        cells = consumo_cube.filter_cells(cube, zonas, tipo_usuario, fecha_inicio, fecha_fin)
+        zonas_df = consumo_cube.zonas(cells).rename("consumo_m3").reset_index()
+    else:
+        df = get_frame("agua")
+        df = apply_filters(df, zonas, tipo_usuario, fecha_inicio, fecha_fin)
+        zona = df["zona"].astype(object).fillna("Desconocida")
+        zonas_df = df.groupby(zona)["consumo_m3"].sum().rename("consumo_m3").reset_index()
+        zonas_df = zonas_df.sort_values(by="consumo_m3", ascending=False)
+    if format == "columnar":
+        return ColumnarResponse(zonas_df)
     return ZonasResponse(
         zonas=[
-            ZonaItem(zona=row["zona"], consumo_m3=row["consumo_m3"])
-            for _, row in zonas_df.iterrows()
+            ZonaItem(zona=zona, consumo_m3=valor)
+            for zona, valor in zip(zonas_df["zona"].tolist(), zonas_df["consumo_m3"].tolist())
         ]
     )
 
+@metrics.timed("analysis")
 def get_summary(zonas=None, tipo_usuario=None, fecha_inicio=None, fecha_fin=None):
-    df = pd.read_csv(AGUA_DATASET_URL, encoding="utf-8")
+    cube = get_cube(fecha_inicio, fecha_fin)
+    if cube is not None:
+        cells = consumo_cube.filter_cells(cube, zonas, tipo_usuario, fecha_inicio, fecha_fin)
+        return SummaryResponse(summary=SummaryKPIs(**consumo_cube.summary(cells)))
+    df = get_frame("agua")
     df = apply_filters(df, zonas, tipo_usuario, fecha_inicio, fecha_fin)
     total = float(df["consumo_m3"].sum())
     promedio = float(df["consumo_m3"].mean())
@@ -57,31 +91,89 @@ def get_summary(zonas=None, tipo_usuario=None, fecha_inicio=None, fecha_fin=None
         )
     )
 
-def get_anomalies(zonas=None, tipo_usuario=None, fecha_inicio=None, fecha_fin=None):
-    df = pd.read_csv(AGUA_DATASET_URL, encoding="utf-8")
-    df = apply_filters(df, zonas, tipo_usuario, fecha_inicio, fecha_fin)
-    mean = df["consumo_m3"].mean()
-    std = df["consumo_m3"].std()
-    df["z"] = (df["consumo_m3"] - mean) / std
-    anomalies = df[abs(df["z"]) > 2]
+def get_anomaly_engine():
+    engine = get_artifact("agua", "anomalias")
+    if engine is None:
+        engine = AnomalyEngine(get_frame("agua"), "consumo_m3")
+    return engine
+
+@metrics.timed("analysis")
+def get_anomalies(zonas=None, tipo_usuario=None, fecha_inicio=None, fecha_fin=None,
+                  metodo="zscore", umbral=2.0, page=1, page_size=100, format="json"):
+    engine = get_anomaly_engine()
+    # Las posiciones filtradas se guardan en el motor: cada página solo corta y copia sus filas
+    posiciones = engine.ranked(
+        metodo, umbral,
+        lambda candidatos: apply_filters(candidatos, zonas, tipo_usuario, fecha_inicio, fecha_fin),
+        clave=(tuple(zonas) if zonas else None, tipo_usuario, fecha_inicio, fecha_fin)
+    )
+    total = len(posiciones)
+    start = (page - 1) * page_size
+    pagina = engine.rows_at(metodo, posiciones[start:start + page_size])
+    anomalies_df = pd.DataFrame({
+        "fecha": pagina["fecha"].astype(str),
+        "valor": pagina["valor"],
+        "tipo": "outlier",
+        "direccion": np.where(pagina["score"] > 0, "alto", "bajo"),
+        "zona": pagina["zona"],
+        "tipo_usuario": pagina["tipo_usuario"],
+        "score": pagina["score"],
+    })
+    paginacion = {"metodo": metodo, "page": page, "page_size": page_size, "total": total}
+    if format == "columnar":
+        return ColumnarResponse(anomalies_df, extra=paginacion)
+    anomalies_df = anomalies_df.astype(object).where(anomalies_df.notna(), None)
     return AnomaliesResponse(
-        anomalies=[
-            AnomalyItem(fecha=str(row["fecha"]), valor=row["consumo_m3"], tipo="outlier")
-            for _, row in anomalies.iterrows()
-        ]
+        anomalies=[AnomalyItem(**item) for item in anomalies_df.to_dict(orient="records")],
+        **paginacion
     )
 
-def get_comparativa(zona1, zona2, tipo_usuario=None, fecha_inicio=None, fecha_fin=None):
-    df = pd.read_csv(AGUA_DATASET_URL, encoding="utf-8")
-    df = apply_filters(df, None, tipo_usuario, fecha_inicio, fecha_fin)
-    df["fecha"] = pd.to_datetime(df["fecha"])
-    df["mes"] = df["fecha"].dt.to_period("M").astype(str)
-    comp = []
-    for mes, group in df.groupby("mes"):
-        v1 = group[group["zona"] == zona1]["consumo_m3"].sum()
-        v2 = group[group["zona"] == zona2]["consumo_m3"].sum()
-        comp.append(ComparativaItem(periodo=mes, zona1=v1, zona2=v2))
-    return ComparativaResponse(comparativa=comp)
+@metrics.timed("analysis")
+def get_comparativa(zona1, zona2, tipo_usuario=None, fecha_inicio=None, fecha_fin=None, format="json"):
+    cube = get_cube(fecha_inicio, fecha_fin)
+    if cube is not None:
+        cells = consumo_cube.filter_cells(cube, None, tipo_usuario, fecha_inicio, fecha_fin)
+        matriz = consumo_cube.matriz_zonas(cells["mes"], cells["zona"], cells["suma"], [zona1, zona2])
+    else:
+        df = get_frame("agua")
+        df = apply_filters(df, None, tipo_usuario, fecha_inicio, fecha_fin)
+        meses = df["fecha"].dt.to_period("M").astype(str)
+        matriz = consumo_cube.matriz_zonas(meses, df["zona"], df["consumo_m3"], [zona1, zona2])
+    comp_df = pd.DataFrame({
+        "periodo": matriz.index,
+        "zona1": matriz.iloc[:, 0].to_numpy(),
+        "zona2": matriz.iloc[:, 1].to_numpy(),
+    })
+    if format == "columnar":
+        return ColumnarResponse(comp_df)
+    return ComparativaResponse(comparativa=[
+        ComparativaItem(periodo=periodo, zona1=v1, zona2=v2)
+        for periodo, v1, v2 in zip(comp_df["periodo"].tolist(), comp_df["zona1"].tolist(), comp_df["zona2"].tolist())
+    ])
+
+@metrics.timed("analysis")
+def get_comparativa_matriz(zonas=None, tipos_usuario=None, fecha_inicio=None, fecha_fin=None, format="json"):
+    cube = get_cube(fecha_inicio, fecha_fin)
+    if cube is not None:
+        cells = consumo_cube.filter_cells(cube, None, None, fecha_inicio, fecha_fin, tipos_usuario=tipos_usuario)
+        matriz = consumo_cube.matriz_zonas(cells["mes"], cells["zona"], cells["suma"], zonas)
+    else:
+        df = get_frame("agua")
+        df = apply_filters(df, None, None, fecha_inicio, fecha_fin)
+        if tipos_usuario:
+            df = df[df["tipo_usuario"].isin(tipos_usuario)]
+        meses = df["fecha"].dt.to_period("M").astype(str)
+        matriz = consumo_cube.matriz_zonas(meses, df["zona"], df["consumo_m3"], zonas)
+    columnas = [str(z) for z in matriz.columns]
+    if format == "columnar":
+        return ColumnarResponse(matriz.rename_axis("periodo").reset_index(), extra={"zonas": columnas})
+    return ComparativaMatrizResponse(
+        zonas=columnas,
+        comparativa=[
+            ComparativaMatrizItem(periodo=mes, valores=dict(zip(columnas, fila)))
+            for mes, fila in zip(matriz.index, matriz.to_numpy(dtype=float).tolist())
+        ]
+    )
 
 def seleccionar_recurso_principal(resources):
     # 1. Filtra por CSV
@@ -110,8 +202,8 @@ def seleccionar_recurso_principal(resources):
         return resources[0]
     return None
 
-def get_datasets():
-    ckan_results = search_datasets(query="agua", rows=10)
+async def get_datasets():
+    ckan_results = await search_datasets(query="agua", rows=10)
     #print("DEBUG ckan_results agua:", ckan_results)
     datasets = []
     for ds in ckan_results:
@@ -126,5 +218,5 @@ def get_datasets():
     return DatasetsResponse(datasets=datasets)
 
 
-def get_raw(zonas=None, tipo_usuario=None, fecha_inicio=None, fecha_fin=None):
-    return get_timeseries(zonas=zonas, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
\ No newline at end of file
+def get_raw(zonas=None, tipo_usuario=None, fecha_inicio=None, fecha_fin=None, format="json"):
+    return get_timeseries(zonas=zonas, tipo_usuario=tipo_usuario, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, format=format)
\ No newline at end of file
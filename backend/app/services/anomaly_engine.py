@@ -0,0 +1,117 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+METODOS = ("zscore", "mad", "seasonal")
+GRUPO = ["zona", "tipo_usuario"]
+# Consultas (método, umbral, filtros) recientes cuyas posiciones se guardan: paginar repite la misma
+RANKED_CACHE_SIZE = 32
+
+
+class AnomalyEngine:
+    """
+    Detector de anomalías con líneas base por (zona, tipo_usuario).
+
+    Los puntajes de todas las filas se calculan una vez por versión del dataset con
+    tres métodos:
+    - `zscore`: desviación respecto a la media y desviación estándar del grupo.
+    - `mad`: z-score robusto (0.6745 * desviación / MAD respecto a la mediana del grupo).
+    - `seasonal`: residuo tras restar la media del grupo para ese mes del año,
+      normalizado por la desviación estándar de los residuos del grupo.
+
+    Las filas quedan ordenadas por severidad (|puntaje|), así cada consulta solo
+    recorre las candidatas que superan el umbral. Las posiciones filtradas de cada
+    consulta se guardan y cada página solo corta posiciones y copia sus filas. Los
+    puntajes no cambian: una versión nueva del dataset construye un motor nuevo.
+    """
+
+    def __init__(self, frame: pd.DataFrame, value_col: str):
+        self.value_col = value_col
+        self.rows = self._normalize(frame)
+        self.scores: Dict[str, np.ndarray] = self._score()
+        self._rank()
+        self._ranked: "OrderedDict[Tuple[str, float, Hashable], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _normalize(self, frame: pd.DataFrame) -> pd.DataFrame:
+        return pd.DataFrame({
+            "fecha": frame["fecha"].array,
+            "zona": frame["zona"].array,
+            "tipo_usuario": frame["tipo_usuario"].array,
+            "valor": frame[self.value_col].to_numpy(dtype="float64"),
+        })
+
+    def _score(self) -> Dict[str, np.ndarray]:
+        """Líneas base por grupo y puntaje de cada fila con los tres métodos"""
+        sub = self.rows
+        valor = sub["valor"]
+        keys = [sub[c] for c in GRUPO]
+
+        grouped = valor.groupby(keys, dropna=False, observed=True)
+        zscore = (valor - grouped.transform("mean")) / grouped.transform("std")
+
+        mediana = grouped.transform("median")
+        desviacion = valor - mediana
+        mad = desviacion.abs().groupby(keys, dropna=False, observed=True).transform("median")
+        robusto = 0.6745 * desviacion / mad
+
+        mes = pd.to_datetime(sub["fecha"]).dt.month
+        estacional = valor.groupby(keys + [mes], dropna=False, observed=True).transform("mean")
+        residuo = valor - estacional
+        seasonal = residuo / residuo.groupby(keys, dropna=False, observed=True).transform("std")
+
+        scores = {}
+        for metodo, serie in (("zscore", zscore), ("mad", robusto), ("seasonal", seasonal)):
+            values = serie.to_numpy(dtype="float64", copy=True)
+            # Grupos sin dispersión (std o MAD en 0) no tienen anomalías definidas
+            values[~np.isfinite(values)] = np.nan
+            scores[metodo] = values
+        return scores
+
+    def _rank(self) -> None:
+        ranking = {}
+        for metodo, scores in self.scores.items():
+            severidad = np.where(np.isnan(scores), -1.0, np.abs(scores))
+            order = np.argsort(-severidad, kind="stable")
+            ranking[metodo] = (order, -severidad[order])
+        self._ranking = ranking
+
+    def ranked(
+        self, metodo: str, umbral: float,
+        filtrar: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None, clave: Hashable = None
+    ) -> np.ndarray:
+        """
+        Posiciones de las filas con |puntaje| > umbral, de mayor a menor severidad. `filtrar`
+        recibe las candidatas y devuelve las que se conservan (su índice es la posición);
+        `clave` identifica ese filtro para guardar el resultado entre páginas.
+        """
+        if metodo not in METODOS:
+            raise ValueError(f"Método de anomalías desconocido: {metodo}")
+        key = (metodo, float(umbral), clave)
+        with self._lock:
+            if key in self._ranked:
+                self._ranked.move_to_end(key)
+                return self._ranked[key]
+        order, severidad_negada = self._ranking[metodo]
+        count = int(np.searchsorted(severidad_negada, -umbral, side="left"))
+        positions = order[:count]
+        if filtrar is not None:
+            positions = filtrar(self.rows.iloc[positions]).index.to_numpy()
+        with self._lock:
+            self._ranked[key] = positions
+            if len(self._ranked) > RANKED_CACHE_SIZE:
+                self._ranked.popitem(last=False)
+        return positions
+
+    def rows_at(self, metodo: str, positions: np.ndarray) -> pd.DataFrame:
+        """Filas de `positions` con la columna `score` del método"""
+        result = self.rows.iloc[positions].copy()
+        result["score"] = self.scores[metodo][positions]
+        return result
+
+    def candidates(self, metodo: str, umbral: float) -> pd.DataFrame:
+        """Filas con |puntaje| > umbral, de mayor a menor severidad, con la columna `score`"""
+        return self.rows_at(metodo, self.ranked(metodo, umbral))
@@ -0,0 +1,127 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.memory_manager import manager
+
+PIE_TOP = 10
+CATEGORY_TOP = 20
+
+
+@dataclass
+class ValueCounts:
+    """
+    Frecuencia de cada valor de una columna, calculada en una sola pasada vectorizada.
+
+    En columnas numéricas `values` está ordenado de menor a mayor; en las demás, de mayor
+    a menor frecuencia. Los nulos no se cuentan. Los histogramas se derivan de aquí
+    (ponderando cada valor distinto por su frecuencia) y se guardan por número de bins.
+    """
+    values: np.ndarray
+    counts: np.ndarray
+    numeric: bool
+    histograms: Dict[int, Tuple[np.ndarray, np.ndarray]] = field(default_factory=dict)
+
+    @classmethod
+    def from_series(cls, serie: pd.Series) -> "ValueCounts":
+        if pd.api.types.is_numeric_dtype(serie):
+            values, counts = np.unique(serie.dropna().to_numpy(), return_counts=True)
+            return cls(values=values, counts=counts, numeric=True)
+        frecuencias = serie.value_counts()
+        # En categóricas value_counts incluye las categorías sin filas
+        frecuencias = frecuencias[frecuencias > 0]
+        return cls(values=frecuencias.index.to_numpy(), counts=frecuencias.to_numpy(), numeric=False)
+
+    @property
+    def nbytes(self) -> int:
+        # Los valores de texto se miden con su contenido, no solo con los punteros del array
+        values = pd.Series(self.values).memory_usage(deep=True, index=False)
+        histograms = sum(hist.nbytes + edges.nbytes for hist, edges in self.histograms.values())
+        return int(values + self.counts.nbytes + histograms)
+
+    def histogram(self, bins: int) -> Tuple[np.ndarray, np.ndarray]:
+        if bins not in self.histograms:
+            self.histograms[bins] = np.histogram(self.values.astype("float64"), bins=bins, weights=self.counts)
+        return self.histograms[bins]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Índices de los puntos elegidos por Largest-Triangle-Three-Buckets: conserva los
+    extremos y, en cada bucket, el punto que forma el triángulo de mayor área con el
+    punto elegido antes y el promedio del bucket siguiente (mantiene picos y valles).
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype("float64")
+    y = y.astype("float64")
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int(np.floor((i + 1) * every)) + 1
+        avg_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def chart_points(counts: ValueCounts, chart_type: str, bins: int, max_points: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Puntos de la gráfica y cantidad de puntos antes de reducirlos a `max_points`"""
+    if not counts.numeric:
+        top = min(CATEGORY_TOP, len(counts.values))
+        return _points(counts.values[:top], counts.counts[:top]), len(counts.values)
+    if chart_type == "histogram":
+        hist, edges = counts.histogram(bins)
+        labels = [f"{edges[i]:.2f}-{edges[i + 1]:.2f}" for i in range(len(hist))]
+        return [{"label": label, "value": float(value)} for label, value in zip(labels, hist)], len(hist)
+    if chart_type == "pie":
+        # Mayor frecuencia primero; ante empates, el menor valor
+        order = np.argsort(-counts.counts, kind="stable")[:PIE_TOP]
+        return _points(counts.values[order], counts.counts[order]), len(counts.values)
+    total = len(counts.values)
+    if total <= max_points:
+        return _points(counts.values, counts.counts), total
+    if chart_type == "line":
+        keep = lttb(counts.values, counts.counts, max_points)
+        return _points(counts.values[keep], counts.counts[keep]), total
+    # Barras con más valores distintos que el presupuesto: se agrupan en intervalos
+    hist, edges = counts.histogram(max_points)
+    labels = [f"{edges[i]:.2f}-{edges[i + 1]:.2f}" for i in range(len(hist))]
+    return [{"label": label, "value": float(value)} for label, value in zip(labels, hist)], total
+
+
+def _points(values: np.ndarray, counts: np.ndarray) -> List[Dict[str, Any]]:
+    return [{"label": str(value), "value": float(count)} for value, count in zip(values, counts)]
+
+
+def cached_points(
+    resource_id: str, version: str, column: str, counts: ValueCounts, chart_type: str, bins: int, max_points: int
+) -> Tuple[List[Dict[str, Any]], int]:
+    """`chart_points` sobre las frecuencias cacheadas; si se agregó un histograma, la entrada se vuelve a medir"""
+    histograms = len(counts.histograms)
+    result = chart_points(counts, chart_type, bins, max_points)
+    if len(counts.histograms) != histograms:
+        manager.resize(("chart", resource_id, version, column))
+    return result
+
+
+def get_cached(resource_id: str, version: str, column: str) -> Optional[ValueCounts]:
+    return manager.get(("chart", resource_id, version, column))
+
+
+def compute(resource_id: str, version: str, df: pd.DataFrame, column: str) -> ValueCounts:
+    """Frecuencias de una columna de una versión de recurso, guardadas para las siguientes gráficas"""
+    counts = ValueCounts.from_series(df[column])
+    manager.discard_stale(resource_id, version)
+    return manager.put(("chart", resource_id, version, column), counts)
@@ -1,9 +1,29 @@
-import requests
+import json
+import shutil
+import time
+from typing import Any, Dict, Optional
 
-CKAN_BASE_URL = "https://datos.cali.gov.co/api/3/action"
+import httpx
+from fastapi.concurrency import run_in_threadpool
 
-def search_datasets(query="", start=0, rows=10, format=None, theme=None):
-    """Busca datasets con paginación y filtros opcionales."""
+from app.config import settings
+from app.services import download_cache, http_client, metadata_cache, metrics, single_flight
+
+CKAN_BASE_URL = settings.CKAN_BASE_URL
+
+_probe_flight = single_flight.group("sonda_ckan")
+_last_probe: Optional[Dict[str, Any]] = None
+
+async def search_datasets(query="", start=0, rows=10, format=None, theme=None):
+    """Busca datasets con paginación y filtros opcionales (desde la caché de metadatos, con TTL de catálogo)."""
+    key = json.dumps([query, start, rows, format, theme])
+    with metrics.span("ckan_search"):
+        return await metadata_cache.cache.get(
+            "package_search", key, lambda: _search_datasets(query, start, rows, format, theme),
+            ttl=settings.CATALOG_TTL_SECONDS
+        )
+
+async def _search_datasets(query, start, rows, format, theme):
     url = f"{CKAN_BASE_URL}/package_search"
     # Construir el query CKAN
     q = query
@@ -14,7 +34,7 @@ def search_datasets(query="", start=0, rows=10, format=None, theme=None):
         "start": start,
         "rows": rows
     }
-    response = requests.get(url, params=params)
+    response = await http_client.get(url, params=params)
     response.raise_for_status()
     datasets = response.json()["result"]["results"]
 
@@ -27,25 +47,93 @@ def search_datasets(query="", start=0, rows=10, format=None, theme=None):
         ]
     return datasets
 
-def get_resource(resource_id):
-    """Obtiene detalles de un recurso por su ID."""
+class ResourceNotFound(ValueError):
+    """CKAN respondió que el recurso no existe"""
+
+class CkanError(Exception):
+    """CKAN respondió con un error que no es "no encontrado" (autorización, validación o una falla)"""
+
+async def get_resource(resource_id, refresh=False):
+    """Obtiene detalles de un recurso por su ID (desde la caché de metadatos; `refresh` fuerza la consulta)."""
+    with metrics.span("metadata"):
+        resource = await metadata_cache.cache.get(
+            "resource_show", resource_id, lambda: fetch_resource(resource_id), refresh=refresh
+        )
+    if resource is None:
+        raise ResourceNotFound(f"Recurso {resource_id} no encontrado en CKAN")
+    return resource
+
+async def fetch_resource(resource_id):
+    """
+    Consulta resource_show en CKAN, sin caché. Devuelve None solo si CKAN responde "Not found"
+    (eso se guarda como inexistente); cualquier otro error se lanza y no se guarda.
+    """
     url = f"{CKAN_BASE_URL}/resource_show"
     params = {"id": resource_id}
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-    return response.json()["result"]
+    response = await http_client.get(url, params=params)
+    try:
+        data = response.json()
+    except ValueError:
+        data = None
+    if response.status_code == 200 and isinstance(data, dict) and data.get("success"):
+        return data["result"]
+    error = data.get("error") if isinstance(data, dict) else None
+    error = error if isinstance(error, dict) else {}
+    if error.get("__type") == "Not Found Error":
+        return None
+    raise CkanError(f"resource_show {resource_id}: {error.get('message') or f'HTTP {response.status_code}'}")
 
-def download_csv(resource_url, dest_path):
-    """Descarga un recurso CSV dado su URL."""
-    response = requests.get(resource_url)
-    response.raise_for_status()
-    with open(dest_path, "wb") as f:
-        f.write(response.content)
-    return dest_path
+async def probe() -> Dict[str, Any]:
+    """
+    Latencia real de CKAN medida con status_show (un intento, sin reintentos ni cola por
+    host). El resultado se reutiliza HEALTH_PROBE_INTERVAL_SECONDS para no sondear en cada /health.
+    """
+    if _last_probe is not None and time.time() - _last_probe["checked_at"] < settings.HEALTH_PROBE_INTERVAL_SECONDS:
+        return _last_probe
+    return await _probe_flight.do("ckan", _probe)
+
+async def _probe():
+    global _last_probe
+    started = time.perf_counter()
+    error = None
+    try:
+        response = await http_client.get_client().get(
+            f"{CKAN_BASE_URL}/status_show", timeout=settings.HEALTH_PROBE_TIMEOUT_SECONDS
+        )
+        if response.status_code != 200:
+            error = f"HTTP {response.status_code}"
+    except httpx.HTTPError as e:
+        error = str(e) or e.__class__.__name__
+    _last_probe = {
+        "ok": error is None,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        "checked_at": time.time(),
+        "error": error,
+    }
+    return _last_probe
+
+def last_probe() -> Optional[Dict[str, Any]]:
+    """Último resultado de `probe` sin volver a sondear (None si aún no se sondeó)"""
+    return _last_probe
+
+async def download_csv(resource_url, dest_path):
+    """Descarga un recurso CSV dado su URL (desde la caché de descargas si está habilitada)."""
+    with metrics.span("download"):
+        if download_cache.is_enabled():
+            path = await download_cache.cache.fetch(resource_url)
+            await run_in_threadpool(shutil.copyfile, path, dest_path)
+            return dest_path
+        async with http_client.get_client().stream("GET", resource_url) as response:
+            response.raise_for_status()
+            with open(dest_path, "wb") as f:
+                async for chunk in response.aiter_bytes():
+                    metrics.count("downloaded_bytes", len(chunk))
+                    f.write(chunk)
+        return dest_path
 
 def get_curated_agua_resource():
     # Devuelve el recurso CKAN específico para agua
     return {
         "id": "xxxx-agua-dataset-id",
         "url": "https://datos.cali.gov.co/path/to/agua.csv"
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,146 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException, Request
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ComputePool:
+    """
+    Ejecuta el trabajo de pandas fuera del event loop en un pool acotado.
+
+    Como mucho `workers` tareas corren a la vez; las demás esperan turno hasta un
+    máximo de `max_queue` (después se responde 503). Si el cliente se desconecta
+    mientras su tarea espera turno, la tarea se descarta; si ya estaba corriendo,
+    su resultado se ignora y el hueco se libera al terminar.
+
+    Usa hilos: el parseo y las agregaciones de pandas/NumPy liberan el GIL, las tareas
+    reciben los frames compartidos (incluidos los del memory-map) sin copiarlos y sus
+    escrituras en las cachés (memory_manager, índices) quedan en este proceso.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="compute")
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.workers)
+            self._slots_loop = loop
+        return self._slots
+
+    async def run(self, fn: Callable[..., Any], *args, request: Optional[Request] = None, **kwargs) -> Any:
+        """Ejecuta `fn(*args, **kwargs)` en el pool; con `request` se cancela si el cliente se desconecta"""
+        slots = self._get_slots()
+        if not slots.locked():
+            # Hay un hueco libre: acquire() no suspende y la tarea no pasa por la cola
+            await slots.acquire()
+        else:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="El servidor está procesando demasiadas solicitudes, intente de nuevo en unos segundos",
+                    headers={"Retry-After": "5"}
+                )
+            self.queued += 1
+            try:
+                await self._acquire(slots, request)
+            finally:
+                self.queued -= 1
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        # El hilo corre con el contexto de la solicitud (spans y contadores de metrics)
+        job = self._get_executor().submit(contextvars.copy_context().run, functools.partial(fn, *args, **kwargs))
+        try:
+            result = await self._wait(asyncio.wrap_future(job), request)
+            self.completed += 1
+            return result
+        except HTTPException:
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            if job.done():
+                slots.release()
+            else:
+                # Una tarea abandonada sigue ocupando su hilo: el hueco se libera cuando termine
+                job.add_done_callback(lambda _: loop.call_soon_threadsafe(slots.release))
+
+    async def _acquire(self, slots: asyncio.Semaphore, request: Optional[Request]) -> None:
+        task = asyncio.ensure_future(slots.acquire())
+        try:
+            await self._wait(task, request)
+        except BaseException:
+            # Si el turno llegó justo al cancelar, se devuelve para no perder el hueco
+            if task.done() and not task.cancelled() and task.exception() is None:
+                slots.release()
+            raise
+
+    async def _wait(self, future: "asyncio.Future", request: Optional[Request]) -> Any:
+        if request is None:
+            return await future
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=settings.COMPUTE_DISCONNECT_POLL_SECONDS)
+            if done:
+                return future.result()
+            if await request.is_disconnected():
+                future.cancel()
+                self.cancelled += 1
+                logger.info(f"Cliente desconectado, se cancela la tarea en {request.url.path}")
+                raise HTTPException(status_code=499, detail="El cliente cerró la conexión")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pool = ComputePool(
+    workers=settings.COMPUTE_WORKERS,
+    max_queue=settings.COMPUTE_MAX_QUEUE,
+)
+
+
+async def run(fn: Callable[..., Any], *args, request: Optional[Request] = None, **kwargs) -> Any:
+    return await pool.run(fn, *args, request=request, **kwargs)
+
+
+async def wait(awaitable: Awaitable[Any], request: Optional[Request] = None) -> Any:
+    """Espera `awaitable` (p. ej. una carga compartida); con `request` deja de esperar si el cliente se desconecta"""
+    return await pool._wait(asyncio.ensure_future(awaitable), request)
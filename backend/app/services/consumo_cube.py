@@ -0,0 +1,143 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class ConsumoCube:
+    """
+    Agregados precalculados por (zona, tipo_usuario, mes) de una columna de consumo.
+
+    `cells` tiene una fila por combinación presente en los datos con las columnas
+    suma, conteo (valores no nulos), filas, minimo, maximo y suma_cuadrados.
+    `date_only` indica que ninguna fecha trae hora, condición para que los filtros
+    alineados a mes den exactamente el mismo resultado que filtrar filas.
+    """
+    cells: pd.DataFrame
+    date_only: bool
+
+
+def build_cube(frame: pd.DataFrame, value_col: str) -> ConsumoCube:
+    fechas = pd.to_datetime(frame["fecha"])
+    valores = frame[value_col].astype("float64")
+    keys = [
+        frame["zona"].rename("zona"),
+        frame["tipo_usuario"].rename("tipo_usuario"),
+        fechas.dt.to_period("M").astype(str).rename("mes"),
+    ]
+    grouped = valores.groupby(keys, dropna=False, observed=True)
+    cells = pd.DataFrame({
+        "suma": grouped.sum(),
+        "conteo": grouped.count(),
+        "filas": grouped.size(),
+        "minimo": grouped.min(),
+        "maximo": grouped.max(),
+        "suma_cuadrados": (valores ** 2).groupby(keys, dropna=False, observed=True).sum(),
+    }).reset_index()
+    if pd.api.types.is_datetime64_any_dtype(frame["fecha"]):
+        date_only = bool((fechas.dropna() == fechas.dropna().dt.normalize()).all())
+    else:
+        # Con hora, "2024-02-29 10:00" quedaría fuera de un filtro hasta el 2024-02-29
+        date_only = bool((frame["fecha"].dropna().astype(str).str.len() <= 10).all())
+    return ConsumoCube(cells=cells, date_only=date_only)
+
+
+def parse_fecha(fecha: Optional[str]) -> Optional[pd.Timestamp]:
+    """
+    Fecha de un filtro (fecha_inicio / fecha_fin) como Timestamp sin zona horaria, para
+    compararla con la columna datetime64. ValueError si el texto no es una fecha.
+    """
+    if not fecha:
+        return None
+    valor = pd.to_datetime(fecha, errors="raise")
+    if valor is pd.NaT:
+        raise ValueError(f"Fecha inválida: {fecha}")
+    if valor.tzinfo is not None:
+        valor = valor.tz_convert(None)
+    return valor
+
+
+def _mes_inicio(fecha_inicio: pd.Timestamp) -> Optional[str]:
+    if fecha_inicio != fecha_inicio.normalize() or fecha_inicio.day != 1:
+        return None
+    return fecha_inicio.strftime("%Y-%m")
+
+
+def _mes_fin(fecha_fin: pd.Timestamp) -> Optional[str]:
+    # "2024-03" es el 1 de marzo a las 00:00: sobre filas solo incluye ese día, el cubo no sirve
+    if not fecha_fin.is_month_end:
+        return None
+    return fecha_fin.strftime("%Y-%m")
+
+
+def can_answer(cube: Optional[ConsumoCube], fecha_inicio: Optional[pd.Timestamp] = None,
+               fecha_fin: Optional[pd.Timestamp] = None) -> bool:
+    """Indica si el cubo puede responder estos filtros sin tocar las filas originales"""
+    if cube is None:
+        return False
+    if fecha_inicio is None and fecha_fin is None:
+        return True
+    if not cube.date_only:
+        return False
+    if fecha_inicio is not None and _mes_inicio(fecha_inicio) is None:
+        return False
+    if fecha_fin is not None and _mes_fin(fecha_fin) is None:
+        return False
+    return True
+
+
+def filter_cells(cube: ConsumoCube, zonas: Optional[List[str]] = None, tipo_usuario: Optional[str] = None,
+                 fecha_inicio: Optional[pd.Timestamp] = None, fecha_fin: Optional[pd.Timestamp] = None,
+                 tipos_usuario: Optional[List[str]] = None) -> pd.DataFrame:
+    cells = cube.cells
+    mask = np.ones(len(cells), dtype=bool)
+    if zonas:
+        mask &= cells["zona"].isin(zonas).to_numpy()
+    if tipo_usuario:
+        mask &= (cells["tipo_usuario"] == tipo_usuario).to_numpy()
+    if tipos_usuario:
+        mask &= cells["tipo_usuario"].isin(tipos_usuario).to_numpy()
+    if fecha_inicio is not None or fecha_fin is not None:
+        # Las filas sin fecha nunca pasan un filtro de fechas
+        mask &= (cells["mes"] != "NaT").to_numpy()
+    if fecha_inicio is not None:
+        mask &= (cells["mes"] >= _mes_inicio(fecha_inicio)).to_numpy()
+    if fecha_fin is not None:
+        mask &= (cells["mes"] <= _mes_fin(fecha_fin)).to_numpy()
+    return cells[mask]
+
+
+def timeseries(cells: pd.DataFrame) -> pd.Series:
+    return cells.groupby("mes")["suma"].sum()
+
+
+def zonas(cells: pd.DataFrame) -> pd.Series:
+    totals = cells.groupby(cells["zona"].astype(object).fillna("Desconocida"))["suma"].sum()
+    return totals.sort_values(ascending=False)
+
+
+def summary(cells: pd.DataFrame) -> dict:
+    conteo = cells["conteo"].sum()
+    return {
+        "total": float(cells["suma"].sum()),
+        "promedio": float(cells["suma"].sum() / conteo) if conteo else float("nan"),
+        "maximo": float(cells["maximo"].max()),
+        "minimo": float(cells["minimo"].min()),
+    }
+
+
+def matriz_zonas(meses: pd.Series, zona: pd.Series, valores: pd.Series, zonas: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Matriz mes × zona con la suma de `valores`, calculada en una sola pasada agrupada.
+    Sirve tanto para celdas del cubo como para filas originales. Los meses son todos
+    los presentes en la entrada; las zonas pedidas sin datos quedan en 0.
+    """
+    todos_los_meses = pd.Index(sorted(meses.unique()), name="mes")
+    if zonas:
+        seleccion = zona.isin(zonas).to_numpy()
+        meses, zona, valores = meses[seleccion], zona[seleccion], valores[seleccion]
+    matriz = valores.groupby([meses.rename("mes"), zona.rename("zona")], observed=True).sum().unstack("zona")
+    matriz = matriz.reindex(index=todos_los_meses, columns=zonas if zonas else sorted(matriz.columns))
+    return matriz.fillna(0.0)
@@ -0,0 +1,274 @@
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+import requests
+from starlette.concurrency import run_in_threadpool
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.config import settings
+from app.services import metrics, snapshot_store
+from app.services.typed_loader import Schema, read_csv
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DatasetVersion:
+    """Una versión cargada de un dataset de dominio. El DataFrame es compartido: no se debe modificar."""
+    domain: str
+    url: str
+    frame: pd.DataFrame
+    version: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    loaded_at: float
+    # Memoria del frame (uso profundo), para estimar el costo de los análisis
+    nbytes: int = field(default=0, compare=False)
+    # Estructuras derivadas (cubos, índices...) construidas para esta versión del frame
+    artifacts: Dict[str, Any] = field(default_factory=dict, compare=False)
+
+
+class _Entry:
+    def __init__(self, url: str, schema: Schema):
+        self.url = url
+        self.schema = schema
+        self.lock = threading.Lock()
+        self.current: Optional[DatasetVersion] = None
+        self.checked_at: Optional[float] = None
+
+
+class DatasetStore:
+    """
+    Caché en proceso de los datasets de dominio (agua, energía).
+
+    Cada dataset se descarga y se parsea una sola vez. Pasado `revalidate_after`
+    segundos se revalida con una petición condicional (If-None-Match /
+    If-Modified-Since): un 304 mantiene la versión actual sin volver a parsear.
+
+    Con snapshots habilitados cada versión parseada se publica como snapshot Arrow y el
+    frame vigente es el leído por mmap desde él: los workers (y los reinicios) abren la
+    versión publicada sin copiarla y la revalidan con su ETag, en vez de descargarla y
+    parsearla cada uno. Un lock de archivo hace que solo un worker a la vez la publique.
+    """
+
+    def __init__(self, session: Optional[requests.Session] = None, revalidate_after: int = settings.DATASET_REVALIDATE_SECONDS):
+        self._session = session or _build_session()
+        self._revalidate_after = revalidate_after
+        self._entries: Dict[str, _Entry] = {}
+        self._builders: Dict[str, Dict[str, Callable[[pd.DataFrame], Any]]] = {}
+
+    def register(self, domain: str, url: str, schema: Optional[Schema] = None) -> None:
+        self._entries[domain] = _Entry(url, schema or Schema())
+
+    def add_builder(self, domain: str, name: str, builder: Callable[[pd.DataFrame], Any]) -> None:
+        """Registra una estructura derivada que se construye cada vez que se carga una nueva versión del dataset"""
+        self._builders.setdefault(domain, {})[name] = builder
+        current = self._entries[domain].current if domain in self._entries else None
+        if current is not None:
+            self._build_artifact(current, name, builder)
+
+    def get(self, domain: str) -> DatasetVersion:
+        """Devuelve la versión vigente del dataset, cargándolo o revalidándolo si hace falta"""
+        entry = self._entries.get(domain)
+        if entry is None:
+            raise KeyError(f"Dataset '{domain}' no registrado")
+        if self._is_fresh(entry):
+            return entry.current
+        with entry.lock:
+            # Otro hilo pudo haber revalidado mientras esperábamos el lock
+            if self._is_fresh(entry):
+                return entry.current
+            try:
+                return self._load(domain, entry)
+            except requests.RequestException as e:
+                if entry.current is None:
+                    raise
+                # Si CKAN falla seguimos sirviendo la última versión conocida
+                logger.warning(f"No se pudo revalidar el dataset {domain}, se usa la versión en caché: {str(e)}")
+            entry.checked_at = time.monotonic()
+            return entry.current
+
+    def refresh(self, domain: str) -> DatasetVersion:
+        """Revalida ya con CKAN; a diferencia de get, propaga el error si CKAN falla"""
+        entry = self._entries.get(domain)
+        if entry is None:
+            raise KeyError(f"Dataset '{domain}' no registrado")
+        with entry.lock:
+            return self._load(domain, entry)
+
+    def _load(self, domain: str, entry: _Entry) -> DatasetVersion:
+        loaded = self._fetch(domain, entry)
+        if loaded is not entry.current:
+            for name, builder in self._builders.get(domain, {}).items():
+                self._build_artifact(loaded, name, builder)
+        entry.current = loaded
+        entry.checked_at = time.monotonic()
+        return loaded
+
+    def loaded_size(self, domain: str) -> Optional[Tuple[int, int]]:
+        """(bytes, filas) del frame vigente sin cargarlo ni revalidarlo (None si aún no se cargó)"""
+        entry = self._entries.get(domain)
+        if entry is None or entry.current is None:
+            return None
+        return entry.current.nbytes, len(entry.current.frame)
+
+    def get_frame(self, domain: str) -> pd.DataFrame:
+        return self.get(domain).frame
+
+    def get_artifact(self, domain: str, name: str) -> Any:
+        """Estructura derivada de la versión vigente, o None si no se pudo construir"""
+        return self.get(domain).artifacts.get(name)
+
+    def invalidate(self, domain: Optional[str] = None) -> None:
+        """Fuerza la revalidación en el siguiente acceso (de un dominio o de todos)"""
+        entries = [self._entries[domain]] if domain else self._entries.values()
+        for entry in entries:
+            entry.checked_at = None
+
+    def _is_fresh(self, entry: _Entry) -> bool:
+        if entry.current is None or entry.checked_at is None:
+            return False
+        return time.monotonic() - entry.checked_at < self._revalidate_after
+
+    def _build_artifact(self, version: DatasetVersion, name: str, builder: Callable[[pd.DataFrame], Any]) -> None:
+        try:
+            version.artifacts[name] = builder(version.frame)
+        except Exception as e:
+            # Sin la estructura derivada los servicios calculan sobre las filas originales
+            logger.error(f"Error al construir '{name}' para el dataset {version.domain}: {str(e)}")
+
+    def _fetch(self, domain: str, entry: _Entry) -> DatasetVersion:
+        # Mientras un worker descarga y publica una versión, los demás esperan y luego la reutilizan
+        with snapshot_store.publishing(_snapshot_id(domain)):
+            return self._fetch_published(domain, entry)
+
+    def _fetch_published(self, domain: str, entry: _Entry) -> DatasetVersion:
+        headers = {}
+        current = self._attach(domain, entry) or entry.current
+        if current is not None:
+            if current.etag:
+                headers["If-None-Match"] = current.etag
+            if current.last_modified:
+                headers["If-Modified-Since"] = current.last_modified
+        try:
+            with metrics.span("download"):
+                response = self._session.get(entry.url, headers=headers, timeout=settings.REQUEST_TIMEOUT)
+            if response.status_code == 304 and current is not None:
+                return current
+            response.raise_for_status()
+        except requests.RequestException as e:
+            if current is None or current is entry.current:
+                raise
+            # CKAN falla pero hay una versión publicada por otro worker: mejor esa que ninguna
+            logger.warning(f"No se pudo revalidar el dataset {domain}, se usa el snapshot publicado: {str(e)}")
+            return current
+        content = response.content
+        metrics.count("downloaded_bytes", len(content))
+        with metrics.span("parse"):
+            frame = read_csv(content, entry.schema, encoding="utf-8")
+        metrics.count("parsed_rows", len(frame))
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        version = etag or last_modified or hashlib.sha1(content).hexdigest()
+        nbytes = int(frame.memory_usage(deep=True).sum())
+        logger.info(f"Dataset {domain} cargado ({len(frame)} filas, {nbytes / (1024 * 1024):.1f}MB, versión {version})")
+        with metrics.span("snapshot"):
+            frame = snapshot_store.publish(
+                _snapshot_id(domain), _snapshot_version(version), frame,
+                metadata={"url": entry.url, "version": version, "etag": etag or "", "last_modified": last_modified or ""},
+            )
+        return DatasetVersion(
+            domain=domain,
+            url=entry.url,
+            frame=frame,
+            version=version,
+            etag=etag,
+            last_modified=last_modified,
+            loaded_at=time.time(),
+            nbytes=nbytes,
+        )
+
+    def _attach(self, domain: str, entry: _Entry) -> Optional[DatasetVersion]:
+        """
+        Versión publicada como snapshot por otro worker (o antes de un reinicio) si es distinta
+        de la vigente; el frame se abre por mmap, sin descargar ni parsear.
+        """
+        snapshot_id = _snapshot_id(domain)
+        snapshot_version = snapshot_store.latest(snapshot_id)
+        if snapshot_version is None:
+            return None
+        current = entry.current
+        if current is not None and _snapshot_version(current.version) == snapshot_version:
+            return None
+        metadata = snapshot_store.read_metadata(snapshot_id, snapshot_version)
+        if metadata.get("url") != entry.url:
+            return None
+        with metrics.span("snapshot"):
+            frame = snapshot_store.read(snapshot_id, snapshot_version)
+        if frame is None:
+            return None
+        logger.info(f"Dataset {domain} abierto desde el snapshot publicado (versión {metadata['version']})")
+        return DatasetVersion(
+            domain=domain,
+            url=entry.url,
+            frame=frame,
+            version=metadata["version"],
+            etag=metadata.get("etag") or None,
+            last_modified=metadata.get("last_modified") or None,
+            loaded_at=time.time(),
+            nbytes=int(frame.memory_usage(deep=True).sum()),
+        )
+
+
+def _snapshot_id(domain: str) -> str:
+    return f"dominio-{domain}"
+
+
+def _snapshot_version(version: str) -> str:
+    # El ETag puede traer comillas o barras: el nombre del snapshot usa su hash
+    return hashlib.sha1(version.encode("utf-8")).hexdigest()[:16]
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    retries = Retry(
+        total=settings.MAX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=[500, 502, 503, 504]
+    )
+    session.mount('http://', HTTPAdapter(max_retries=retries))
+    session.mount('https://', HTTPAdapter(max_retries=retries))
+    return session
+
+
+DIMENSIONES = ("zona", "tipo_usuario")
+
+store = DatasetStore()
+store.register("agua", settings.AGUA_DATASET_URL,
+               Schema(categoricas=DIMENSIONES, fechas=("fecha",), numericas=("consumo_m3",)))
+store.register("energia", settings.ENERGIA_DATASET_URL,
+               Schema(categoricas=DIMENSIONES, fechas=("fecha",), numericas=("consumo_kwh",)))
+
+
+def get_dataset(domain: str) -> DatasetVersion:
+    return store.get(domain)
+
+
+def get_frame(domain: str) -> pd.DataFrame:
+    return store.get_frame(domain)
+
+
+def get_artifact(domain: str, name: str) -> Any:
+    return store.get_artifact(domain, name)
+
+
+async def refresh(domain: str) -> str:
+    """Tarea de precarga: revalida el dataset (y construye sus estructuras derivadas) fuera del event loop"""
+    dataset = await run_in_threadpool(store.refresh, domain)
+    return dataset.version
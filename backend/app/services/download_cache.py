@@ -0,0 +1,433 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Dict, Iterator, Optional, Set
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.services import http_client, metrics
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 1024 * 1024
+
+
+class DownloadTooLarge(ValueError):
+    """El cuerpo upstream supera MAX_FILE_SIZE_MB"""
+
+
+@dataclass
+class CacheEntry:
+    """Última versión conocida del cuerpo de una URL: validadores HTTP y hash del contenido"""
+    url: str
+    sha256: str
+    size: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    version: Optional[str] = None
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: str, data: Dict) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def file_blocks(path: str, limit: Optional[int] = None) -> Iterator[bytes]:
+    """Lee un archivo por bloques (hasta `limit` bytes si se indica)"""
+    remaining = limit
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            block = f.read(BLOCK_SIZE if remaining is None else min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+            yield block
+
+
+class Download:
+    """
+    Cuerpo de una URL: un archivo completo de la caché (`path`) o una respuesta upstream
+    en curso (`response`) que se va guardando en disco mientras se lee con `chunks()`.
+    """
+
+    def __init__(
+        self,
+        cache: "DownloadCache",
+        url: str,
+        version: Optional[str],
+        path: Optional[str] = None,
+        response: Optional[httpx.Response] = None,
+        part_path: Optional[str] = None,
+        resumed: int = 0,
+        max_bytes: Optional[int] = None,
+    ):
+        self.cache = cache
+        self.url = url
+        self.version = version
+        self.path = path
+        self.response = response
+        self.part_path = part_path
+        self.resumed = resumed
+        self.max_bytes = max_bytes if max_bytes is not None else settings.MAX_FILE_SIZE_MB * 1024 * 1024
+
+    @property
+    def cached(self) -> bool:
+        return self.path is not None
+
+    async def chunks(self, include_prefix: bool = True) -> AsyncIterator[bytes]:
+        """
+        Bytes del cuerpo. Si la descarga se retomó con Range, primero se entrega (y se
+        vuelve a hashear) la parte ya guardada; `include_prefix=False` solo la hashea.
+        Al llegar al final el archivo pasa a la caché; si se corta, la parte queda para retomarla.
+        """
+        max_bytes = self.max_bytes
+        hasher = hashlib.sha256()
+        total = self.resumed
+        completo = False
+        try:
+            if self.resumed:
+                prefix = file_blocks(self.part_path, limit=self.resumed)
+                try:
+                    while True:
+                        block = await run_in_threadpool(next, prefix, None)
+                        if block is None:
+                            break
+                        hasher.update(block)
+                        if include_prefix:
+                            yield block
+                finally:
+                    prefix.close()
+            if self.resumed + int(self.response.headers.get("content-length") or 0) > max_bytes:
+                raise DownloadTooLarge(f"El archivo supera el tamaño máximo de {max_bytes} bytes")
+            with open(self.part_path, "ab" if self.resumed else "wb") as part:
+                async for chunk in self.response.aiter_bytes():
+                    total += len(chunk)
+                    metrics.count("downloaded_bytes", len(chunk))
+                    if total > max_bytes:
+                        raise DownloadTooLarge(f"El archivo supera el tamaño máximo de {max_bytes} bytes")
+                    part.write(chunk)
+                    hasher.update(chunk)
+                    yield chunk
+            completo = True
+        except DownloadTooLarge:
+            self.cache._discard_part(self.part_path)
+            raise
+        finally:
+            await self.response.aclose()
+            if not completo:
+                self.cache._abandon(self.url, self.part_path)
+        self.path = await run_in_threadpool(
+            self.cache._commit, self.url, self.version, self.part_path, hasher.hexdigest(), total,
+            self.response.headers.get("etag"), self.response.headers.get("last-modified"),
+        )
+
+    async def aclose(self) -> None:
+        """Abandona una descarga que no se va a leer (la parte guardada se conserva)"""
+        if self.response is not None and not self.response.is_closed:
+            await self.response.aclose()
+            self.cache._abandon(self.url, self.part_path)
+
+
+class DownloadCache:
+    """
+    Caché en disco de los cuerpos de los recursos de CKAN.
+
+    El contenido se guarda una sola vez por hash (`objects/<sha256>`) y cada URL apunta a
+    su última versión con sus validadores (`index/<sha1(url)>.json`). Con la versión del
+    recurso según sus metadatos no hace falta consultar CKAN; sin ella se revalida con
+    If-None-Match / If-Modified-Since. Las descargas se escriben en `parts/` y pasan a la
+    caché con un rename atómico al terminar; si se cortan, la siguiente descarga de la URL
+    continúa desde donde quedó con Range + If-Range. Al superar la cuota de disco se borran
+    los archivos usados hace más tiempo.
+    """
+
+    def __init__(self, directory: str, quota_bytes: int):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        # Partes que está escribiendo una descarga en curso (otra descarga de la URL usa una parte propia)
+        self._writing: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self.resumed = 0
+        self.evictions = 0
+
+    def _dir(self, name: str) -> str:
+        path = os.path.join(self.directory, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self._dir("objects"), sha256)
+
+    def _index_path(self, url: str) -> str:
+        return os.path.join(self._dir("index"), f"{_url_key(url)}.json")
+
+    def _part_path(self, url: str) -> str:
+        return os.path.join(self._dir("parts"), f"{_url_key(url)}.part")
+
+    def entry(self, url: str) -> Optional[CacheEntry]:
+        data = _read_json(self._index_path(url))
+        if data is None:
+            return None
+        entry = CacheEntry(**data)
+        if not os.path.exists(self._object_path(entry.sha256)):
+            # El contenido se descartó por cuota: la entrada ya no sirve
+            _remove(self._index_path(url))
+            return None
+        return entry
+
+    async def open(self, url: str, version: Optional[str] = None, max_bytes: Optional[int] = None) -> Download:
+        """
+        Cuerpo de la URL desde la caché si sigue vigente; si no, una descarga que se guarda al
+        leerla. `max_bytes` (por defecto MAX_FILE_SIZE_MB) limita la descarga y el archivo guardado.
+        """
+        entry = self.entry(url)
+        if entry is not None and version is not None and entry.version == version:
+            download = self._hit(url, entry, version, max_bytes)
+            if download is not None:
+                return download
+            entry = None
+
+        part_path = self._part_path(url)
+        if part_path in self._writing:
+            fd, part_path = tempfile.mkstemp(dir=self._dir("parts"), suffix=".part")
+            os.close(fd)
+        self._writing.add(part_path)
+        response = None
+        try:
+            # Los rangos se cuentan sobre los bytes guardados: con gzip apuntarían al cuerpo codificado
+            headers = {"Accept-Encoding": "identity"}
+            if entry is not None:
+                if entry.etag:
+                    headers["If-None-Match"] = entry.etag
+                if entry.last_modified:
+                    headers["If-Modified-Since"] = entry.last_modified
+            offset = 0
+            validator = self._part_validator(part_path)
+            if validator is not None:
+                offset = os.path.getsize(part_path)
+                headers["Range"] = f"bytes={offset}-"
+                headers["If-Range"] = validator
+            try:
+                response = await http_client.open_stream(url, headers=headers)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 416:
+                    raise
+                # La parte guardada no corresponde al archivo actual: se descarta y se descarga completo
+                response = await self._restart(url, headers, part_path)
+                offset = 0
+            if response.status_code == 206 and (not offset or _range_start(response) != offset):
+                # Un rango que no empieza donde quedó la parte completaría mal el archivo
+                logger.warning(f"Rango inesperado al retomar {url} ({response.headers.get('content-range')}), se descarga completo")
+                await response.aclose()
+                response = await self._restart(url, headers, part_path)
+                offset = 0
+                if response.status_code == 206:
+                    await response.aclose()
+                    raise httpx.HTTPStatusError(
+                        f"Respuesta parcial sin pedir un rango al descargar {url}", request=response.request, response=response
+                    )
+            if response.status_code == 304 and entry is not None:
+                await response.aclose()
+                self._release(part_path)
+                download = self._hit(url, entry, version, max_bytes)
+                if download is not None:
+                    return download
+                # El archivo se descartó por cuota justo después de validarlo: se pide completo
+                return await self.open(url, version, max_bytes)
+            if response.status_code == 206:
+                self.resumed += 1
+                logger.info(f"Descarga de {url} retomada desde {offset} bytes")
+            else:
+                offset = 0
+            self.misses += 1
+            self._save_part_validator(part_path, response)
+            return Download(self, url, version, response=response, part_path=part_path, resumed=offset, max_bytes=max_bytes)
+        except BaseException:
+            self._release(part_path)
+            # Una respuesta abierta ocupa un lugar del límite por host hasta cerrarse
+            if response is not None and not response.is_closed:
+                await response.aclose()
+            raise
+
+    async def _restart(self, url: str, headers: Dict[str, str], part_path: str) -> httpx.Response:
+        """Descarta la parte guardada y vuelve a pedir el cuerpo completo (sin Range / If-Range)"""
+        self._discard_part(part_path)
+        headers.pop("Range", None)
+        headers.pop("If-Range", None)
+        return await http_client.open_stream(url, headers=headers)
+
+    async def fetch(self, url: str, version: Optional[str] = None, max_bytes: Optional[int] = None) -> str:
+        """Ruta del cuerpo completo en la caché; si la conexión se corta, reintenta retomando con Range"""
+        for attempt in range(settings.MAX_RETRIES + 1):
+            download = await self.open(url, version, max_bytes)
+            if download.cached:
+                return download.path
+            try:
+                async for _ in download.chunks(include_prefix=False):
+                    pass
+                return download.path
+            except httpx.TransportError as e:
+                if attempt == settings.MAX_RETRIES:
+                    raise
+                logger.warning(f"Descarga de {url} interrumpida ({str(e)}), se retoma (intento {attempt + 1})")
+
+    async def read(self, url: str, version: Optional[str] = None, max_bytes: Optional[int] = None) -> bytes:
+        path = await self.fetch(url, version, max_bytes)
+        return await run_in_threadpool(_read_file, path)
+
+    def _hit(self, url: str, entry: CacheEntry, version: Optional[str], max_bytes: Optional[int] = None) -> Optional[Download]:
+        """Cuerpo guardado de la URL, o None si el archivo se descartó por cuota mientras tanto"""
+        if max_bytes is not None and entry.size > max_bytes:
+            # Lo guardó otro llamador con un límite mayor
+            raise DownloadTooLarge(f"El archivo supera el tamaño máximo de {max_bytes} bytes")
+        path = self._object_path(entry.sha256)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            _remove(self._index_path(url))
+            return None
+        self.hits += 1
+        if version is not None and entry.version != version:
+            entry.version = version
+            _write_json(self._index_path(url), asdict(entry))
+        return Download(self, url, version, path=path)
+
+    def _part_validator(self, part_path: str) -> Optional[str]:
+        meta = _read_json(part_path + ".json")
+        if not meta or not os.path.exists(part_path) or os.path.getsize(part_path) == 0:
+            return None
+        # If-Range solo admite ETags fuertes o una fecha
+        etag = meta.get("etag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return meta.get("last_modified")
+
+    def _save_part_validator(self, part_path: str, response: httpx.Response) -> None:
+        if response.headers.get("content-encoding", "identity").lower() != "identity":
+            # El servidor ignoró Accept-Encoding: la parte guardada no se puede retomar con Range
+            _remove(part_path + ".json")
+            return
+        _write_json(part_path + ".json", {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+        })
+
+    def _release(self, part_path: str) -> None:
+        self._writing.discard(part_path)
+
+    def _abandon(self, url: str, part_path: str) -> None:
+        """Descarga incompleta: la parte de la URL se conserva para retomarla; una parte propia se borra"""
+        self._release(part_path)
+        if part_path != self._part_path(url):
+            self._discard_part(part_path)
+
+    def _discard_part(self, part_path: str) -> None:
+        _remove(part_path)
+        _remove(part_path + ".json")
+
+    def _commit(
+        self,
+        url: str,
+        version: Optional[str],
+        part_path: str,
+        sha256: str,
+        size: int,
+        etag: Optional[str],
+        last_modified: Optional[str],
+    ) -> str:
+        """Pasa la parte terminada a la caché (atómico) y actualiza la entrada de la URL"""
+        try:
+            path = self._object_path(sha256)
+            try:
+                # Mismo contenido ya guardado (otra URL o una versión anterior idéntica)
+                os.utime(path)
+                _remove(part_path)
+            except FileNotFoundError:
+                os.replace(part_path, path)
+            _remove(part_path + ".json")
+            entry = CacheEntry(url=url, sha256=sha256, size=size, etag=etag, last_modified=last_modified, version=version)
+            _write_json(self._index_path(url), asdict(entry))
+            logger.info(f"Descarga de {url} guardada en caché ({size / (1024 * 1024):.1f}MB)")
+        finally:
+            self._release(part_path)
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: str) -> None:
+        files = []
+        for name in ("objects", "parts"):
+            for entry in os.scandir(self._dir(name)):
+                if entry.is_file() and entry.path not in self._writing:
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.quota_bytes:
+                break
+            if path == keep:
+                continue
+            _remove(path)
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "resumed": self.resumed, "evictions": self.evictions}
+
+
+def _range_start(response: httpx.Response) -> Optional[int]:
+    # Content-Range: bytes 1000-1999/2000
+    content_range = response.headers.get("content-range", "")
+    try:
+        return int(content_range.split(" ", 1)[1].split("-", 1)[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def is_enabled() -> bool:
+    return settings.DOWNLOAD_CACHE_ENABLED
+
+
+cache = DownloadCache(
+    directory=settings.DOWNLOAD_CACHE_DIR,
+    quota_bytes=settings.DOWNLOAD_CACHE_MAX_MB * 1024 * 1024,
+)
+
+
+async def download(url: str, version: Optional[str] = None, max_bytes: Optional[int] = None) -> bytes:
+    """Cuerpo completo de la URL, desde la caché en disco si está habilitada"""
+    if not is_enabled():
+        return await http_client.download(url, max_bytes=max_bytes)
+    return await cache.read(url, version, max_bytes=max_bytes)
@@ -0,0 +1,333 @@
+import base64
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.memory_manager import manager
+
+# Resultados de filtros recientes que se guardan por columna (paginar repite el mismo filtro)
+MATCH_CACHE_SIZE = 32
+# Con pocos valores coincidentes se juntan sus listas de filas; con muchos se recorre la columna una vez
+SLICE_MAX_VALUES = 64
+
+
+class CursorError(ValueError):
+    """El cursor no corresponde a la consulta o no se puede ubicar en la columna de orden"""
+
+
+class ColumnIndex:
+    """
+    Índice invertido de una columna: cada valor distinto con las posiciones de sus filas.
+
+    Las comparaciones se evalúan sobre los valores distintos (no sobre todas las filas)
+    y el resultado se traduce a posiciones ordenadas. Los nulos nunca son iguales a un número
+    y contienen un texto solo si el astype(str) del filtrado por recorrido lo producía
+    (p. ej. "nan" o "None" en versiones de pandas que convierten los nulos a texto).
+    """
+
+    def __init__(self, serie: pd.Series):
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codes = serie.cat.codes.to_numpy()
+            uniques = serie.cat.categories
+        else:
+            codes, uniques = pd.factorize(serie)
+        self.numeric = pd.api.types.is_numeric_dtype(serie)
+        self.uniques = np.asarray(uniques)
+        self.codes = codes
+        nulos = int((codes < 0).sum())
+        # Filas agrupadas por valor; los nulos (código -1) quedan al inicio y se descartan
+        self.order = np.argsort(codes, kind="stable")[nulos:]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.uniques))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        # Filas nulas y su texto según astype(str) (NaN si la versión de pandas conserva el nulo)
+        self.nulls = np.flatnonzero(codes < 0)
+        self.null_labels = serie.iloc[self.nulls].astype(str).reset_index(drop=True)
+        self._labels: Optional[pd.Series] = None
+        self._matches: "OrderedDict[Tuple[str, Any], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        size = pd.Series(self.uniques).memory_usage(deep=True, index=False)
+        size += self.codes.nbytes + self.order.nbytes + self.offsets.nbytes + self.nulls.nbytes
+        size += self.null_labels.memory_usage(deep=True, index=False)
+        if self._labels is not None:
+            size += self._labels.memory_usage(deep=True, index=False)
+        return int(size + sum(positions.nbytes for positions in self._matches.values()))
+
+    @property
+    def labels(self) -> pd.Series:
+        # Texto de cada valor tal como lo produce astype(str) sobre la columna
+        if self._labels is None:
+            self._labels = pd.Series(self.uniques, dtype=object).astype(str)
+        return self._labels
+
+    def equals(self, value: float) -> np.ndarray:
+        """Posiciones de las filas iguales a `value`"""
+        return self._cached(("equals", value), lambda: self._rows(np.flatnonzero(self.uniques == value)))
+
+    def contains(self, text: str) -> np.ndarray:
+        """Posiciones de las filas que contienen `text` (sin distinguir mayúsculas, como str.contains)"""
+        def positions() -> np.ndarray:
+            rows = self._rows(np.flatnonzero(self.labels.str.contains(text, case=False, na=False).to_numpy()))
+            if len(self.nulls) == 0:
+                return rows
+            nulls = self.nulls[self.null_labels.str.contains(text, case=False, na=False).to_numpy()]
+            return rows if len(nulls) == 0 else np.union1d(rows, nulls)
+
+        return self._cached(("contains", text), positions)
+
+    def _cached(self, key: Tuple[str, Any], matching_rows) -> np.ndarray:
+        with self._lock:
+            if key in self._matches:
+                self._matches.move_to_end(key)
+                return self._matches[key]
+        positions = matching_rows()
+        with self._lock:
+            self._matches[key] = positions
+            if len(self._matches) > MATCH_CACHE_SIZE:
+                self._matches.popitem(last=False)
+        return positions
+
+    def _rows(self, values: np.ndarray) -> np.ndarray:
+        if len(values) == 0:
+            return np.empty(0, dtype=np.intp)
+        if len(values) <= SLICE_MAX_VALUES:
+            parts = [self.order[self.offsets[v]:self.offsets[v + 1]] for v in values]
+            return np.sort(np.concatenate(parts))
+        seleccion = np.zeros(len(self.uniques) + 1, dtype=bool)
+        seleccion[values] = True
+        # El código -1 de los nulos apunta a la última posición, siempre en False
+        return np.flatnonzero(seleccion[self.codes])
+
+
+def _sort_keys(codes: np.ndarray, ascending: bool) -> np.ndarray:
+    """Clave de orden de cada código (de factorize con sort=True), con los nulos (-1) al final"""
+    if ascending:
+        return np.where(codes < 0, np.int64(np.iinfo(np.int64).max), codes)
+    return np.where(codes < 0, 1, -codes)
+
+
+class ResourceIndex:
+    """
+    Índices de las columnas de una versión de un recurso, construidos al primer filtro sobre
+    cada una, y permutaciones de orden por (columna, dirección) compartidas entre páginas y filtros.
+    """
+
+    def __init__(self):
+        self._columns: Dict[str, ColumnIndex] = {}
+        self._sort_codes: Dict[str, Tuple[np.ndarray, pd.Index]] = {}
+        self._orders: Dict[Tuple[str, bool], np.ndarray] = {}
+        self._selections: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._grown = False
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            size = sum(index.nbytes for index in self._columns.values())
+            size += sum(codes.nbytes + uniques.memory_usage(deep=True) for codes, uniques in self._sort_codes.values())
+            size += sum(order.nbytes for order in self._orders.values())
+            return size + sum(positions.nbytes for positions in self._selections.values())
+
+    def column(self, df: pd.DataFrame, col: str) -> ColumnIndex:
+        with self._lock:
+            index = self._columns.get(col)
+            if index is None:
+                index = ColumnIndex(df[col])
+                self._columns[col] = index
+            return index
+
+    def positions(self, df: pd.DataFrame, filter_dict: Dict[str, Any]) -> Optional[np.ndarray]:
+        """
+        Posiciones (ordenadas) de las filas que cumplen todos los filtros, o None si ningún
+        filtro aplica. Columnas numéricas: igualdad si el valor es numérico; el resto, contiene.
+        """
+        result = None
+        for col, val in filter_dict.items():
+            if col not in df.columns:
+                continue
+            index = self.column(df, col)
+            rows = None
+            if index.numeric:
+                try:
+                    rows = index.equals(float(val))
+                except (ValueError, TypeError):
+                    pass
+            if rows is None:
+                rows = index.contains(str(val))
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
+
+    def sort_order(self, df: pd.DataFrame, col: str, ascending: bool) -> np.ndarray:
+        """Permutación que ordena todas las filas por `col` (nulos al final, como sort_values)"""
+        key = (col, ascending)
+        with self._lock:
+            if key in self._orders:
+                return self._orders[key]
+        codes, _ = self.sort_codes(df, col)
+        order = np.argsort(_sort_keys(codes, ascending), kind="stable")
+        with self._lock:
+            self._orders[key] = order
+        return order
+
+    def sort_codes(self, df: pd.DataFrame, col: str) -> Tuple[np.ndarray, pd.Index]:
+        """Código de cada fila en los valores distintos ordenados de `col` (-1 los nulos) y esos valores"""
+        with self._lock:
+            if col in self._sort_codes:
+                return self._sort_codes[col]
+        codes, uniques = pd.factorize(df[col], sort=True)
+        if len(uniques) < np.iinfo(np.int32).max:
+            codes = codes.astype(np.int32)
+        # Las categorías se comparan por su valor (el orden de factorize es el de las categorías)
+        entry = (codes, pd.Index(np.asarray(uniques)))
+        with self._lock:
+            return self._sort_codes.setdefault(col, entry)
+
+    def select(self, df: pd.DataFrame, filter_dict: Dict[str, Any], sort_by: Optional[str], ascending: bool) -> np.ndarray:
+        """
+        Posiciones de las filas que cumplen los filtros, en el orden pedido. La permutación
+        de orden se calcula una vez por columna y aquí solo se recorre para quedarse con las
+        filas filtradas; la selección completa se guarda para las páginas siguientes.
+        """
+        if sort_by not in df.columns:
+            sort_by = None
+        key = query_key(filter_dict, sort_by, ascending)
+        with self._lock:
+            if key in self._selections:
+                self._selections.move_to_end(key)
+                return self._selections[key]
+        positions = self.positions(df, filter_dict)
+        if sort_by is not None:
+            order = self.sort_order(df, sort_by, ascending)
+            if positions is not None:
+                seleccion = np.zeros(len(df), dtype=bool)
+                seleccion[positions] = True
+                order = order[seleccion[order]]
+            positions = order
+        elif positions is None:
+            positions = np.arange(len(df))
+        with self._lock:
+            self._selections[key] = positions
+            if len(self._selections) > MATCH_CACHE_SIZE:
+                self._selections.popitem(last=False)
+            # Solo una selección nueva pudo agregar índices de columna, órdenes o resultados
+            self._grown = True
+        return positions
+
+    def seek(self, df: pd.DataFrame, positions: np.ndarray, sort_by: Optional[str], ascending: bool, value: Any, row: int) -> int:
+        """
+        Offset en `positions` (resultado de `select`) de la primera fila que va después de
+        (`value`, `row`): el valor de orden y la fila de la última entregada. Búsqueda binaria
+        sobre la permutación cacheada, sin recorrer las filas anteriores. Si el valor ya no
+        existe (otra versión del recurso) se sigue desde los valores que van después de él.
+        CursorError si `value` no se puede comparar con la columna.
+        """
+        if sort_by not in df.columns:
+            return int(np.searchsorted(positions, row, side="right"))
+        codes, uniques = self.sort_codes(df, sort_by)
+        if value is None:
+            target = _sort_keys(np.int64(-1), ascending)
+        else:
+            try:
+                value = pd.Series([value]).astype(uniques.dtype).iloc[0]
+                if uniques.is_monotonic_increasing:
+                    i = int(uniques.searchsorted(value))
+                else:
+                    # Categorías ordenadas a mano: solo se ubican valores existentes
+                    i = int(uniques.get_indexer([value])[0])
+                    if i < 0:
+                        raise ValueError(f"valor de orden desconocido: {value!r}")
+            except (TypeError, ValueError, OverflowError) as e:
+                raise CursorError(f"Cursor inválido o expirado: {str(e)}")
+            if i < len(uniques) and uniques[i] == value:
+                target = _sort_keys(np.int64(i), ascending)
+            else:
+                target, row = (i - 0.5 if ascending else 0.5 - i), -1
+        lo, hi = 0, len(positions)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            p = int(positions[mid])
+            if (_sort_keys(codes[p], ascending), p) <= (target, row):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def take_grown(self) -> bool:
+        """True si el índice creció desde la última llamada (y hay que volver a medirlo)"""
+        with self._lock:
+            grown, self._grown = self._grown, False
+            return grown
+
+
+def query_key(filter_dict: Dict[str, Any], sort_by: Optional[str], ascending: bool) -> str:
+    return json.dumps({"filters": filter_dict, "sort_by": sort_by, "asc": ascending}, sort_keys=True, default=str)
+
+
+def _json_value(value: Any) -> Any:
+    if pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def encode_cursor(df: pd.DataFrame, key: str, sort_by: Optional[str], last_row: int) -> str:
+    """
+    Cursor opaco (keyset) de la página siguiente: huella de la consulta, valor de `sort_by`
+    de la última fila entregada y su posición. Al retomar se busca la primera fila posterior
+    a ese par en el orden de la consulta, sin depender del offset.
+    """
+    payload = {
+        "q": hashlib.sha1(key.encode()).hexdigest()[:12],
+        "k": _json_value(df[sort_by].iloc[last_row]) if sort_by in df.columns else None,
+        "r": int(last_row),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, default=str).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key: str) -> Tuple[Any, int]:
+    """(valor de orden, fila) de la última fila entregada; CursorError si el cursor no corresponde a esta consulta"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload["q"] == hashlib.sha1(key.encode()).hexdigest()[:12]:
+            return payload["k"], int(payload["r"])
+    except (ValueError, KeyError, TypeError):
+        pass
+    raise CursorError("Cursor inválido o expirado")
+
+
+def get_index(resource_id: str, version: str) -> ResourceIndex:
+    """Índices de una versión de recurso, guardados en la caché de memoria"""
+    # Los índices de versiones anteriores del recurso ya no corresponden a sus filas
+    manager.discard_stale(resource_id, version)
+    return manager.get_or_put(("index", resource_id, version), ResourceIndex)
+
+
+def select(
+    resource_id: str, version: str, df: pd.DataFrame, filter_dict: Dict[str, Any], sort_by: Optional[str],
+    ascending: bool, after: Optional[Tuple[Any, int]] = None
+) -> Tuple[np.ndarray, int]:
+    """
+    `ResourceIndex.select` sobre el índice cacheado de la versión (para correr en el pool de
+    cómputo) y el offset donde empieza la página: 0, o el de la fila siguiente a `after`
+    (valor de orden y fila de un cursor). Los índices crecen al filtrar y ordenar por nuevas
+    columnas: su tamaño se vuelve a medir solo cuando la consulta agregó algo, no en cada página.
+    """
+    index = get_index(resource_id, version)
+    positions = index.select(df, filter_dict, sort_by, ascending)
+    start = 0 if after is None else index.seek(df, positions, sort_by, ascending, *after)
+    if index.take_grown():
+        manager.resize(("index", resource_id, version))
+    return positions, start
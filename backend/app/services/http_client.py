@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from app.config import settings
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = {500, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Cliente HTTP asíncrono compartido (keep-alive y pool de conexiones).
+    Se crea uno por event loop: un cliente no se puede usar desde otro loop.
+    """
+    global _client, _client_loop, _host_limits
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS,
+        )
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.REQUEST_TIMEOUT, connect=settings.CONNECT_TIMEOUT),
+            limits=limits,
+            # Reintenta errores de conexión; los 5xx se reintentan en request()
+            transport=httpx.AsyncHTTPTransport(retries=settings.MAX_RETRIES, limits=limits),
+            follow_redirects=True,
+        )
+        _client_loop = loop
+        _host_limits = {}
+    return _client
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlparse(url).netloc
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(settings.HTTP_MAX_CONNECTIONS_PER_HOST)
+    return _host_limits[host]
+
+
+async def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Petición con límite de conexiones por host y reintentos con backoff ante 5xx y timeouts"""
+    client = get_client()
+    for attempt in range(settings.MAX_RETRIES + 1):
+        try:
+            async with _host_limit(url):
+                response = await client.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUS or attempt == settings.MAX_RETRIES:
+                return response
+        except httpx.TimeoutException:
+            if attempt == settings.MAX_RETRIES:
+                raise
+        delay = 0.5 * (2 ** attempt)
+        logger.warning(f"Reintentando {method} {url} en {delay}s (intento {attempt + 1})")
+        await asyncio.sleep(delay)
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+async def head(url: str, **kwargs) -> httpx.Response:
+    return await request("HEAD", url, **kwargs)
+
+
+async def download(url: str, max_bytes: Optional[int] = None) -> bytes:
+    """Descarga el cuerpo completo; aborta si supera `max_bytes` aunque el servidor no envíe Content-Length"""
+    async with _host_limit(url):
+        async with get_client().stream("GET", url) as response:
+            response.raise_for_status()
+            chunks = []
+            total = 0
+            async for chunk in response.aiter_bytes():
+                total += len(chunk)
+                metrics.count("downloaded_bytes", len(chunk))
+                if max_bytes is not None and total > max_bytes:
+                    raise ValueError(f"El archivo supera el tamaño máximo de {max_bytes} bytes")
+                chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class _PermitStream(httpx.AsyncByteStream):
+    """Cuerpo de una respuesta en streaming que devuelve el permiso del host al cerrarse"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                release, self._release = self._release, None
+                release()
+
+
+async def open_stream(url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    """
+    Abre una descarga en streaming y devuelve la respuesta con el cuerpo sin leer.
+    La descarga ocupa un lugar del límite por host hasta que se cierra: el llamador debe
+    cerrarla con `aclose()` (o leer el cuerpo completo) al terminar.
+    """
+    client = get_client()
+    limit = _host_limit(url)
+    await limit.acquire()
+    try:
+        response = await client.send(client.build_request("GET", url, headers=headers), stream=True)
+    except BaseException:
+        limit.release()
+        raise
+    if response.is_closed:
+        # El transporte ya entregó el cuerpo completo: no hay conexión que ocupar
+        limit.release()
+    else:
+        response.stream = _PermitStream(response.stream, limit.release)
+    if response.is_error:
+        await response.aclose()
+        response.raise_for_status()
+    return response
+
+
+async def aclose() -> None:
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
@@ -0,0 +1,170 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.memory_manager import manager
+
+PERCENTILES = (50, 90, 99)
+# Puntos por columna del resumen de cuantiles que se combina entre estados parciales
+SKETCH_SIZE = 1024
+
+
+@dataclass
+class KPIState:
+    """
+    Estado parcial de los KPIs de las columnas numéricas, combinable con `merge`.
+
+    Conteos, suma, mínimo, máximo y momentos (media y suma de cuadrados de las
+    desviaciones, algoritmo de Chan) se combinan de forma exacta. Los percentiles
+    son exactos para un estado construido de un solo bloque; al combinar se estiman
+    con un resumen de a lo sumo SKETCH_SIZE cuantiles ponderados por columna.
+    """
+    columns: List[str]
+    count: np.ndarray
+    nulls: np.ndarray
+    total: np.ndarray
+    mean: np.ndarray
+    m2: np.ndarray
+    minimo: np.ndarray
+    maximo: np.ndarray
+    sketches: List[Tuple[np.ndarray, np.ndarray]]
+    percentiles: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "KPIState":
+        """Calcula todas las estadísticas de las columnas numéricas sobre un único bloque 2-D"""
+        columns = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+        block = df[columns].to_numpy(dtype="float64", na_value=np.nan) if columns else np.empty((len(df), 0))
+        return cls.from_block(columns, block)
+
+    @classmethod
+    def from_block(cls, columns: List[str], block: np.ndarray) -> "KPIState":
+        count = (~np.isnan(block)).sum(axis=0)
+        # Un solo ordenamiento por columna da mínimo, máximo, percentiles y el resumen de cuantiles
+        ordered = np.sort(block, axis=0)  # los NaN quedan al final de cada columna
+        valores = [ordered[:count[i], i] for i in range(len(columns))]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            total = np.nansum(block, axis=0)
+            mean = np.where(count > 0, total / np.maximum(count, 1), 0.0)
+            m2 = np.nansum((block - mean) ** 2, axis=0)
+        return cls(
+            columns=list(columns),
+            count=count,
+            nulls=len(block) - count,
+            total=total,
+            mean=mean,
+            m2=m2,
+            minimo=np.array([v[0] if len(v) else np.nan for v in valores]),
+            maximo=np.array([v[-1] if len(v) else np.nan for v in valores]),
+            sketches=[_sketch(v) for v in valores],
+            percentiles=np.array([
+                [np.quantile(v, p / 100) if len(v) else np.nan for v in valores]
+                for p in PERCENTILES
+            ]).reshape(len(PERCENTILES), len(columns)),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.count, self.nulls, self.total, self.mean, self.m2, self.minimo, self.maximo]
+        if self.percentiles is not None:
+            arrays.append(self.percentiles)
+        arrays.extend(array for sketch in self.sketches for array in sketch)
+        return sum(array.nbytes for array in arrays)
+
+    def merge(self, other: "KPIState") -> "KPIState":
+        """Combina dos estados (por ejemplo, dos chunks o filas agregadas) sin volver a recorrer los datos"""
+        if other.columns != self.columns:
+            raise ValueError("Los estados de KPIs deben tener las mismas columnas")
+        count = self.count + other.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = other.mean - self.mean
+            mean = np.where(count > 0, self.mean + delta * other.count / count, 0.0)
+            m2 = np.where(count > 0, self.m2 + other.m2 + delta ** 2 * self.count * other.count / count, 0.0)
+        return KPIState(
+            columns=self.columns,
+            count=count,
+            nulls=self.nulls + other.nulls,
+            total=self.total + other.total,
+            mean=mean,
+            m2=m2,
+            minimo=np.fmin(self.minimo, other.minimo),
+            maximo=np.fmax(self.maximo, other.maximo),
+            sketches=[_merge_sketches(a, b) for a, b in zip(self.sketches, other.sketches)],
+        )
+
+    def to_kpis(self) -> List[Dict[str, Any]]:
+        kpis = []
+        for i, col in enumerate(self.columns):
+            count = int(self.count[i])
+            if self.percentiles is not None:
+                percentiles = self.percentiles[:, i]
+            else:
+                percentiles = [_quantile(self.sketches[i], p / 100) for p in PERCENTILES]
+            kpi = {
+                "column": col,
+                "count": count,
+                "nulls": int(self.nulls[i]),
+                "mean": _float(self.mean[i]) if count else None,
+                "min": _float(self.minimo[i]),
+                "max": _float(self.maximo[i]),
+                "sum": _float(self.total[i]) if count else None,
+                "std": _float(np.sqrt(self.m2[i] / (count - 1))) if count > 1 else None,
+            }
+            for p, value in zip(PERCENTILES, percentiles):
+                kpi[f"p{p}"] = _float(value)
+            kpis.append(kpi)
+        return kpis
+
+
+def _float(value: float) -> Optional[float]:
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def _sketch(sorted_values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Resumen (valores, pesos): los valores tal cual si caben, si no SKETCH_SIZE cuantiles equiponderados"""
+    n = len(sorted_values)
+    if n <= SKETCH_SIZE:
+        return sorted_values, np.ones(n)
+    qs = (np.arange(SKETCH_SIZE) + 0.5) / SKETCH_SIZE
+    return np.quantile(sorted_values, qs), np.full(SKETCH_SIZE, n / SKETCH_SIZE)
+
+
+def _merge_sketches(a: Tuple[np.ndarray, np.ndarray], b: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    values = np.concatenate([a[0], b[0]])
+    weights = np.concatenate([a[1], b[1]])
+    order = np.argsort(values, kind="stable")
+    values, weights = values[order], weights[order]
+    if len(values) <= SKETCH_SIZE:
+        return values, weights
+    total = weights.sum()
+    qs = (np.arange(SKETCH_SIZE) + 0.5) / SKETCH_SIZE
+    return _weighted_quantiles(values, weights, qs), np.full(SKETCH_SIZE, total / SKETCH_SIZE)
+
+
+def _weighted_quantiles(values: np.ndarray, weights: np.ndarray, qs: np.ndarray) -> np.ndarray:
+    # Cada punto representa el centro de su masa; se interpola entre centros
+    centers = (np.cumsum(weights) - weights / 2) / weights.sum()
+    return np.interp(qs, centers, values)
+
+
+def _quantile(sketch: Tuple[np.ndarray, np.ndarray], q: float) -> float:
+    values, weights = sketch
+    if len(values) == 0:
+        return np.nan
+    if np.all(weights == 1):
+        return float(np.quantile(values, q))
+    return float(_weighted_quantiles(values, weights, np.array([q]))[0])
+
+
+def get_cached(resource_id: str, version: str) -> Optional[KPIState]:
+    return manager.get(("kpis", resource_id, version))
+
+
+def compute(resource_id: str, version: str, df: pd.DataFrame) -> KPIState:
+    """KPIs de una versión de recurso; se guardan para no recorrer el frame en las siguientes consultas"""
+    state = KPIState.from_frame(df)
+    manager.discard_stale(resource_id, version)
+    return manager.put(("kpis", resource_id, version), state)
@@ -0,0 +1,208 @@
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import pandas as pd
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def sizeof(value: Any) -> int:
+    """
+    Bytes que ocupa un valor en memoria: uso profundo en DataFrames y Series (incluye el
+    texto de las columnas object), `nbytes` en arrays y en las estructuras que lo definen.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True, index=True))
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes)
+    return sys.getsizeof(value)
+
+
+@dataclass
+class _Entry:
+    value: Any
+    size: int
+    pins: int = 0
+    discarded: bool = False  # descartada mientras estaba fijada: se elimina al soltarla
+
+
+class MemoryManager:
+    """
+    Caché LRU con presupuesto en bytes para los DataFrames cargados y sus estructuras
+    derivadas (KPIs, frecuencias, índices de filtrado).
+
+    Al superar el presupuesto se descartan primero las entradas usadas hace más tiempo.
+    Una entrada fijada con `pin` (porque una solicitud la está usando) no se descarta
+    hasta soltarla con `unpin`: mientras tanto el total puede superar el presupuesto.
+    Lo mismo vale para `discard`: una entrada fijada sigue ocupando memoria (y contando
+    en `used_bytes`) hasta que la suelta la última solicitud que la usa.
+    Un valor más grande que todo el presupuesto no se guarda.
+
+    Las claves son tuplas (tipo, resource_id, versión, ...) para poder descartar de una
+    vez todo lo de las versiones anteriores de un recurso.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Valor de una entrada sin tocar su posición LRU ni los contadores (None si no está)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry.value
+
+    def size_of(self, key: Hashable) -> Optional[int]:
+        """Bytes de una entrada sin tocar su posición LRU ni los contadores (None si no está)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry.size
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> Any:
+        """Guarda `value` (midiendo su tamaño si no se indica) y devuelve el mismo valor"""
+        size = sizeof(value) if size is None else size
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            pins = 0
+            if previous is not None:
+                self.used_bytes -= previous.size
+                pins = previous.pins
+            if size > self.budget_bytes and not pins:
+                self.rejected += 1
+                logger.info(f"{key!r} ({size / (1024 * 1024):.1f}MB) no cabe en el presupuesto de memoria")
+                return value
+            self._entries[key] = _Entry(value=value, size=size, pins=pins)
+            self.used_bytes += size
+            self._evict()
+        return value
+
+    def get_or_put(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Valor de la entrada o, si no está, el que devuelve `factory` (se crea una sola vez)"""
+        with self._lock:
+            value = self.get(key)
+            if value is None:
+                value = self.put(key, factory())
+            return value
+
+    def resize(self, key: Hashable) -> None:
+        """Vuelve a medir una entrada que crece con el uso (p. ej. índices construidos a demanda)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            size = sizeof(entry.value)
+            self.used_bytes += size - entry.size
+            entry.size = size
+            self._evict()
+
+    def pin(self, key: Hashable) -> bool:
+        """Impide que la entrada se descarte; devuelve False si no está en la caché"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            entry.pins += 1
+            return True
+
+    def acquire(self, key: Hashable) -> Optional[Any]:
+        """Como `get`, pero deja la entrada fijada hasta el `unpin` correspondiente"""
+        with self._lock:
+            value = self.get(key)
+            if value is not None:
+                self._entries[key].pins += 1
+            return value
+
+    def unpin(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.pins == 0:
+                return
+            entry.pins -= 1
+            if entry.pins == 0:
+                if entry.discarded:
+                    del self._entries[key]
+                    self.used_bytes -= entry.size
+                self._evict()
+
+    def discard(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Elimina las entradas cuya clave cumple `predicate`; las fijadas quedan marcadas y se
+        eliminan al soltarlas. Devuelve cuántas entradas se descartaron.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key) and not self._entries[key].discarded]
+            for key in keys:
+                entry = self._entries[key]
+                if entry.pins:
+                    entry.discarded = True
+                else:
+                    del self._entries[key]
+                    self.used_bytes -= entry.size
+            return len(keys)
+
+    def discard_stale(self, resource_id: str, version: str) -> int:
+        """Elimina todo lo guardado de las versiones de `resource_id` distintas de `version`"""
+        return self.discard(lambda key: key[1] == resource_id and key[2] != version)
+
+    def _evict(self) -> None:
+        if self.used_bytes <= self.budget_bytes:
+            return
+        for key in list(self._entries):
+            if self.used_bytes <= self.budget_bytes:
+                break
+            entry = self._entries[key]
+            if entry.pins:
+                continue
+            del self._entries[key]
+            self.used_bytes -= entry.size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            por_tipo: Dict[str, int] = {}
+            for key in self._entries:
+                kind = key[0] if isinstance(key, tuple) else "otros"
+                por_tipo[kind] = por_tipo.get(kind, 0) + 1
+            return {
+                "budget_mb": round(self.budget_bytes / (1024 * 1024), 1),
+                "used_mb": round(self.used_bytes / (1024 * 1024), 1),
+                "entries": por_tipo,
+                "pinned": sum(1 for entry in self._entries.values() if entry.pins),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+            }
+
+
+manager = MemoryManager(budget_bytes=settings.MEMORY_BUDGET_MB * 1024 * 1024)
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.services import single_flight
+
+logger = logging.getLogger(__name__)
+
+MEMORY_ENTRIES = 512
+
+
+@dataclass
+class Entry:
+    """Respuesta de CKAN guardada; `value` None indica que CKAN respondió "no encontrado"."""
+    value: Any
+    fetched_at: float
+
+
+class MetadataCache:
+    """
+    Caché de metadatos y búsquedas de CKAN en SQLite, compartida por los workers y
+    persistente entre reinicios, con una copia de las entradas recientes en memoria.
+
+    Una entrada es fresca durante `ttl` segundos y se sirve sin consultar CKAN. Durante
+    los `stale_seconds` siguientes se sigue sirviendo mientras se revalida en segundo
+    plano (stale-while-revalidate). Pasado ese plazo se vuelve a consultar antes de
+    responder; si CKAN falla y hay una copia vieja, se sirve esa. Los "no encontrado"
+    (`fetch` devuelve None) se guardan `negative_ttl` segundos.
+    """
+
+    def __init__(self, path: str, ttl: float, stale_seconds: float, negative_ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self.negative_ttl = negative_ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[Tuple[str, str], Entry]" = OrderedDict()
+        self._flight = single_flight.group("metadatos")
+        self._revalidations: Set["asyncio.Future[Any]"] = set()
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.negative = 0
+        self.errors = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            # WAL: las lecturas de un worker no esperan a las escrituras de otro
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT, fetched_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _read(self, namespace: str, key: str) -> Optional[Entry]:
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT value, fetched_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudo leer la caché de metadatos {self.path}: {str(e)}")
+            return None
+        if row is None:
+            return None
+        return Entry(value=None if row[0] is None else json.loads(row[0]), fetched_at=row[1])
+
+    def _write(self, namespace: str, key: str, entry: Entry) -> None:
+        value = None if entry.value is None else json.dumps(entry.value)
+        try:
+            with self._lock:
+                self._connect().execute(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, fetched_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, value, entry.fetched_at),
+                )
+        except sqlite3.Error as e:
+            # Sin disco la caché sigue funcionando en memoria
+            logger.warning(f"No se pudo guardar en la caché de metadatos {self.path}: {str(e)}")
+
+    def _remember(self, namespace: str, key: str, entry: Entry) -> None:
+        self._memory[(namespace, key)] = entry
+        self._memory.move_to_end((namespace, key))
+        while len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def _age_limits(self, entry: Entry, ttl: float) -> Tuple[float, float]:
+        if entry.value is None:
+            return self.negative_ttl, self.negative_ttl
+        return ttl, ttl + self.stale_seconds
+
+    def entry(self, namespace: str, key: str, ttl: Optional[float] = None) -> Optional[Entry]:
+        """Entrada vigente más reciente: la de memoria si es fresca, si no la de SQLite (otro worker pudo renovarla)"""
+        ttl = self.ttl if ttl is None else ttl
+        cached = self._memory.get((namespace, key))
+        if cached is not None and time.time() - cached.fetched_at < self._age_limits(cached, ttl)[0]:
+            self._memory.move_to_end((namespace, key))
+            return cached
+        stored = self._read(namespace, key)
+        if stored is not None and (cached is None or stored.fetched_at > cached.fetched_at):
+            self._remember(namespace, key, stored)
+            return stored
+        return cached
+
+    async def get(
+        self,
+        namespace: str,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        refresh: bool = False,
+    ) -> Any:
+        """
+        Valor de (`namespace`, `key`), consultando CKAN con `fetch` solo si no hay una entrada
+        utilizable; `refresh` fuerza la consulta. Devuelve None si CKAN no encontró el objeto.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        cached = self.entry(namespace, key, ttl)
+        if cached is not None and not refresh:
+            fresh_for, usable_for = self._age_limits(cached, ttl)
+            age = time.time() - cached.fetched_at
+            if age < fresh_for:
+                self.hits += 1
+                if cached.value is None:
+                    self.negative += 1
+                return cached.value
+            if age < usable_for:
+                self.stale += 1
+                self._revalidate(namespace, key, fetch, cached)
+                return cached.value
+        self.misses += 1
+        return await self._flight.do((namespace, key), lambda: self._fetch(namespace, key, fetch, cached))
+
+    def _revalidate(self, namespace: str, key: str, fetch: Callable[[], Awaitable[Any]], cached: Entry) -> None:
+        task = asyncio.ensure_future(self._flight.do((namespace, key), lambda: self._fetch(namespace, key, fetch, cached)))
+        # Se guarda la referencia para que la tarea no se recolecte antes de terminar
+        self._revalidations.add(task)
+        task.add_done_callback(self._revalidated)
+
+    def _revalidated(self, task: "asyncio.Future[Any]") -> None:
+        self._revalidations.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"No se pudo revalidar la caché de metadatos: {task.exception()!r}")
+
+    async def _fetch(self, namespace: str, key: str, fetch: Callable[[], Awaitable[Any]], cached: Optional[Entry]) -> Any:
+        try:
+            value = await fetch()
+        except Exception as e:
+            if cached is None or cached.value is None:
+                raise
+            # CKAN no responde: mejor la copia vieja que un error
+            self.errors += 1
+            detail = getattr(e, "detail", None) or str(e) or e.__class__.__name__
+            logger.warning(f"CKAN falló al renovar {namespace} {key}, se sirve la copia guardada: {detail}")
+            return cached.value
+        entry = Entry(value=value, fetched_at=time.time())
+        self._remember(namespace, key, entry)
+        await run_in_threadpool(self._write, namespace, key, entry)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "stale": self.stale,
+            "misses": self.misses,
+            "negative": self.negative,
+            "errors": self.errors,
+        }
+
+
+cache = MetadataCache(
+    settings.METADATA_CACHE_PATH,
+    ttl=settings.METADATA_TTL_SECONDS,
+    stale_seconds=settings.METADATA_STALE_SECONDS,
+    negative_ttl=settings.METADATA_NEGATIVE_TTL_SECONDS,
+)
@@ -0,0 +1,263 @@
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 4, 16, 64, 128, 256, 512, 1024, 2048))
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):  # sin sysconf (Windows) no se mide la memoria por solicitud
+    _PAGE_SIZE = None
+
+
+def rss_bytes() -> Optional[int]:
+    """Memoria residente actual del proceso (Linux, /proc/self/statm); None si no se puede leer"""
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._values: Dict[Labels, List[float]] = {}  # conteos por bucket, luego suma y total
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, values in sorted(self._values.items()):
+                for bound, count in zip(self.buckets + (float("inf"),), values[:len(self.buckets)] + [values[-1]]):
+                    bucket_labels = labels + (("le", _format_value(float(bound))),)
+                    lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(float(values[-2]))}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {values[-1]}")
+        return lines
+
+
+requests_duration = Histogram(
+    "monita_request_duration_seconds", "Duración de las solicitudes HTTP por ruta", LATENCY_BUCKETS
+)
+stage_duration = Histogram(
+    "monita_stage_duration_seconds", "Duración de cada etapa (metadatos, descarga, parseo, agregación...)", LATENCY_BUCKETS
+)
+request_peak_memory = Histogram(
+    "monita_request_peak_memory_bytes", "Crecimiento máximo de la memoria residente durante la solicitud", MEMORY_BUCKETS
+)
+downloaded_bytes = Counter("monita_downloaded_bytes_total", "Bytes descargados de CKAN")
+parsed_rows = Counter("monita_parsed_rows_total", "Filas parseadas de archivos descargados")
+
+_COUNTERS = {"downloaded_bytes": downloaded_bytes, "parsed_rows": parsed_rows}
+
+
+@dataclass
+class RequestMetrics:
+    """Tiempos por etapa y contadores de una solicitud (compartido con los hilos que la atienden)"""
+    started: float = field(default_factory=time.perf_counter)
+    rss_start: Optional[int] = field(default_factory=rss_bytes)
+    rss_peak: Optional[int] = None
+    spans: Dict[str, float] = field(default_factory=dict)
+    counters: Dict[str, int] = field(default_factory=dict)
+
+    def sample_memory(self) -> None:
+        rss = rss_bytes()
+        if rss is not None and (self.rss_peak is None or rss > self.rss_peak):
+            self.rss_peak = rss
+
+    @property
+    def peak_memory(self) -> Optional[int]:
+        if self.rss_start is None or self.rss_peak is None:
+            return None
+        return max(0, self.rss_peak - self.rss_start)
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        peak = self.peak_memory
+        if peak is not None:
+            parts.append(f'mem;desc="+{peak / (1024 * 1024):.1f}MB"')
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar("monita_request_metrics", default=None)
+
+
+def current() -> Optional[RequestMetrics]:
+    return _current.get()
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Mide una etapa: la suma a la solicitud en curso (Server-Timing) y al histograma global.
+    Sirve en código síncrono y alrededor de `await` (el contexto viaja a los hilos del pool).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.observe(elapsed, stage=stage)
+        request = _current.get()
+        if request is not None:
+            request.spans[stage] = request.spans.get(stage, 0.0) + elapsed
+            request.sample_memory()
+
+
+def timed(stage: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorador: mide cada llamada a la función como la etapa `stage`"""
+
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, value: int) -> None:
+    """Suma a un contador (`downloaded_bytes` o `parsed_rows`) global y de la solicitud en curso"""
+    _COUNTERS[name].inc(value)
+    request = _current.get()
+    if request is not None:
+        request.counters[name] = request.counters.get(name, 0) + value
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse que mide la serialización del cuerpo como etapa `serialize`"""
+
+    def render(self, content: Any) -> bytes:
+        with span("serialize"):
+            return super().render(content)
+
+
+def _route_path(scope: Dict[str, Any]) -> str:
+    # La plantilla de la ruta (/resources/{resource_id}/kpis) mantiene acotadas las etiquetas
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "sin_ruta"
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: abre las métricas de cada solicitud, agrega el encabezado Server-Timing
+    (etapas medidas hasta enviar los encabezados, total y crecimiento de memoria) y al
+    terminar registra la duración y el pico de memoria por ruta.
+    """
+
+    def __init__(self, app: Callable[..., Any]):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable[..., Any], send: Callable[..., Any]) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = RequestMetrics()
+        token = _current.set(request)
+        status = 500
+
+        async def send_with_timing(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                request.sample_memory()
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", request.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = _route_path(scope)
+            requests_duration.observe(
+                time.perf_counter() - request.started, route=route, method=scope["method"], status=str(status)
+            )
+            request.sample_memory()
+            if request.peak_memory is not None:
+                request_peak_memory.observe(request.peak_memory, route=route)
+
+
+def render(extra: Iterable[Tuple[str, str, str, Dict[Labels, float]]] = ()) -> str:
+    """
+    Texto en formato de exposición de Prometheus con las métricas registradas y las de
+    `extra`: (nombre, tipo, ayuda, {etiquetas: valor}) tomadas de los stats de cada servicio.
+    """
+    lines: List[str] = []
+    for metric in (requests_duration, stage_duration, request_peak_memory, downloaded_bytes, parsed_rows):
+        lines.extend(metric.render())
+    for name, kind, help, samples in extra:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples.items():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
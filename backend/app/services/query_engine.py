@@ -0,0 +1,180 @@
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Tuple, Union
+
+import pandas as pd
+
+from app.config import settings
+
+try:
+    import duckdb
+except ImportError:  # duckdb es opcional: sin él el endpoint de consultas responde 501
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+TABLE = "recurso"
+SOURCE = "origen"
+ALIAS_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]{0,63}$")
+
+AGGREGATES = {
+    "count": "count({})",
+    "count_distinct": "count(DISTINCT {})",
+    "sum": "sum({})",
+    "avg": "avg({})",
+    "min": "min({})",
+    "max": "max({})",
+    "median": "median({})",
+    "stddev": "stddev_samp({})",
+}
+COMPARISONS = {"=": "=", "!=": "<>", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+class QueryError(ValueError):
+    """La consulta no cumple la gramática permitida"""
+
+
+class QueryTimeout(Exception):
+    """La consulta superó QUERY_TIMEOUT_SECONDS"""
+
+
+def is_available() -> bool:
+    return duckdb is not None
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def build_sql(spec: Dict[str, Any], columns: List[str], max_rows: int) -> Tuple[str, List[Any], int]:
+    """
+    Traduce la consulta estructurada a SQL. Los identificadores solo pueden ser columnas del
+    recurso (o alias validados) y todos los valores viajan como parámetros, nunca en el texto.
+    Devuelve el SQL, sus parámetros y el límite de filas efectivo.
+    """
+    existentes = set(columns)
+
+    def column(name: str) -> str:
+        if name not in existentes:
+            raise QueryError(f"Columna '{name}' no encontrada")
+        return _quote(name)
+
+    params: List[Any] = []
+    select = []
+    aliases = set()
+    group_by = [column(name) for name in spec.get("group_by") or []]
+    aggregates = spec.get("aggregates") or []
+    if aggregates or group_by:
+        if spec.get("select"):
+            raise QueryError("Con group_by o aggregates las columnas devueltas son las de group_by y los agregados")
+        select.extend(group_by)
+        for agg in aggregates:
+            fn = agg["fn"]
+            if agg.get("column") is None:
+                if fn != "count":
+                    raise QueryError(f"El agregado '{fn}' requiere una columna")
+                expr = "count(*)"
+            else:
+                expr = AGGREGATES[fn].format(column(agg["column"]))
+            alias = agg.get("alias") or (f"{fn}_{agg['column']}" if agg.get("column") else fn)
+            if not ALIAS_PATTERN.match(alias) or alias in aliases:
+                raise QueryError(f"Alias inválido o repetido: '{alias}'")
+            aliases.add(alias)
+            select.append(f"{expr} AS {_quote(alias)}")
+    else:
+        select = [column(name) for name in spec.get("select") or []] or ["*"]
+
+    where = []
+    for cond in spec.get("where") or []:
+        where.append(_condition(column(cond["column"]), cond["op"], cond.get("value"), params))
+
+    order_by = []
+    for order in spec.get("order_by") or []:
+        name = order["column"]
+        target = _quote(name) if name in aliases else column(name)
+        order_by.append(f"{target} {'DESC' if order.get('direction') == 'desc' else 'ASC'} NULLS LAST")
+
+    limit = min(spec.get("limit") or max_rows, max_rows)
+    sql = f"SELECT {', '.join(select)} FROM {TABLE}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if group_by:
+        sql += " GROUP BY " + ", ".join(group_by)
+    if order_by:
+        sql += " ORDER BY " + ", ".join(order_by)
+    # Una fila extra permite saber si el resultado se cortó
+    sql += f" LIMIT {int(limit) + 1}"
+    return sql, params, limit
+
+
+def _condition(target: str, op: str, value: Union[List[Any], Any], params: List[Any]) -> str:
+    if op == "is_null":
+        return f"{target} IS NULL"
+    if op == "not_null":
+        return f"{target} IS NOT NULL"
+    if op in ("in", "not_in"):
+        if not isinstance(value, list) or not value:
+            raise QueryError(f"El operador '{op}' requiere una lista de valores")
+        params.extend(value)
+        placeholders = ", ".join("?" for _ in value)
+        return f"{target} {'NOT IN' if op == 'not_in' else 'IN'} ({placeholders})"
+    if op == "between":
+        if not isinstance(value, list) or len(value) != 2:
+            raise QueryError("El operador 'between' requiere [desde, hasta]")
+        params.extend(value)
+        return f"{target} BETWEEN ? AND ?"
+    if value is None or isinstance(value, list):
+        raise QueryError(f"El operador '{op}' requiere un único valor")
+    if op == "contains":
+        escaped = str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{escaped}%")
+        return f"CAST({target} AS VARCHAR) ILIKE ? ESCAPE '\\'"
+    params.append(value)
+    return f"{target} {COMPARISONS[op]} ?"
+
+
+def _null_nan_columns(con: Any) -> str:
+    """
+    Columnas del origen con los NaN de las columnas float como NULL: los snapshots guardan
+    los NaN como valores (para leerlos sin copia) y pandas los trata como faltantes, así que
+    sum/avg/is_null deben ignorarlos igual que sobre el DataFrame.
+    """
+    columnas = []
+    for name, tipo, *_ in con.execute(f"DESCRIBE {SOURCE}").fetchall():
+        quoted = _quote(name)
+        if tipo in ("DOUBLE", "FLOAT"):
+            columnas.append(f"CASE WHEN isnan({quoted}) THEN NULL ELSE {quoted} END AS {quoted}")
+        else:
+            columnas.append(quoted)
+    return ", ".join(columnas)
+
+
+def run_query(source: Any, spec: Dict[str, Any], columns: List[str]) -> Tuple[pd.DataFrame, bool]:
+    """
+    Ejecuta la consulta sobre `source` (tabla Arrow del snapshot o DataFrame) con DuckDB,
+    sin copiar los datos. Devuelve el resultado y si se cortó en el límite de filas.
+    """
+    sql, params, limit = build_sql(spec, columns, settings.QUERY_MAX_ROWS)
+    con = duckdb.connect(database=":memory:")
+    # Corta la consulta si se pasa del tiempo máximo
+    timer = threading.Timer(settings.QUERY_TIMEOUT_SECONDS, con.interrupt)
+    try:
+        con.execute(f"SET threads TO {int(settings.QUERY_THREADS)}")
+        con.execute(f"SET memory_limit = '{int(settings.QUERY_MEMORY_LIMIT_MB)}MB'")
+        con.register(SOURCE, source)
+        con.execute(f"CREATE VIEW {TABLE} AS SELECT {_null_nan_columns(con)} FROM {SOURCE}")
+        # Sin acceso a archivos ni red desde SQL: solo la tabla registrada
+        con.execute("SET enable_external_access = false")
+        timer.start()
+        result = con.execute(sql, params).df()
+    except duckdb.InterruptException:
+        raise QueryTimeout(f"La consulta superó el tiempo máximo de {settings.QUERY_TIMEOUT_SECONDS} segundos")
+    except duckdb.Error as e:
+        # Errores de tipos (p. ej. sumar texto) o de binder: son errores de la consulta
+        raise QueryError(str(e).split("\n")[0])
+    finally:
+        timer.cancel()
+        con.close()
+    truncated = len(result) > limit
+    return result.head(limit), truncated
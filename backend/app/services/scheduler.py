@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JobStatus:
+    """Resultado de la última ejecución de una tarea de precarga"""
+    version: Optional[str] = None
+    last_run: Optional[float] = None
+    last_success: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+class Scheduler:
+    """
+    Precarga los datasets configurados al iniciar y los refresca cada `interval` segundos.
+
+    Cada tarea es una corrutina que carga (o revalida) un dataset y devuelve su versión
+    upstream; si la versión no cambió, la tarea no vuelve a parsear nada. Las tareas corren
+    en secuencia en una sola tarea de fondo para no competir entre sí por CPU y ancho de banda.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.jobs: Dict[str, Callable[[], Awaitable[Optional[str]]]] = {}
+        self.status: Dict[str, JobStatus] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.warmed_up = False
+
+    def add_job(self, name: str, job: Callable[[], Awaitable[Optional[str]]]) -> None:
+        self.jobs[name] = job
+        self.status[name] = JobStatus()
+
+    def start(self) -> None:
+        if self._task is None and self.jobs:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self) -> None:
+        for name, job in self.jobs.items():
+            await self._run_job(name, job)
+
+    async def _loop(self) -> None:
+        while True:
+            await self.run_once()
+            self.warmed_up = True
+            await asyncio.sleep(self.interval)
+
+    async def _run_job(self, name: str, job: Callable[[], Awaitable[Optional[str]]]) -> None:
+        status = self.status[name]
+        status.last_run = time.time()
+        started = time.monotonic()
+        try:
+            version = await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e) or e.__class__.__name__
+            status.last_error = str(detail)
+            logger.warning(f"No se pudo precargar {name}: {status.last_error}")
+            return
+        if status.version is not None and version != status.version:
+            logger.info(f"{name}: nueva versión upstream {version}")
+        status.version = version
+        status.last_success = time.time()
+        status.last_error = None
+        logger.info(f"{name} precargado en {time.monotonic() - started:.2f}s (versión {version})")
+
+    def is_ready(self) -> bool:
+        """
+        Listo cuando terminó la primera ronda de precarga. Un dataset que falló no bloquea
+        la disponibilidad (se cargará bajo demanda): aparece con su error en `report`.
+        """
+        return self.warmed_up or not self.jobs
+
+    def report(self) -> Dict[str, Any]:
+        now = time.time()
+        datasets = {}
+        for name, status in self.status.items():
+            datasets[name] = {
+                "version": status.version,
+                "last_refresh": status.last_success,
+                "age_seconds": round(now - status.last_success, 1) if status.last_success else None,
+                "last_error": status.last_error,
+            }
+        return datasets
+
+    def upstream_status(self) -> str:
+        """Estado de CKAN según la última ejecución de las tareas: ok, fail o unknown"""
+        ejecutadas = [status for status in self.status.values() if status.last_run is not None]
+        if not ejecutadas:
+            return "unknown"
+        return "fail" if any(status.last_error for status in ejecutadas) else "ok"
+
+
+scheduler = Scheduler(interval=settings.REFRESH_INTERVAL_SECONDS)
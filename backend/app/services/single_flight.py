@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Agrupa las llamadas concurrentes con la misma clave en una sola ejecución.
+
+    La primera llamada con una clave lanza `fn()` como tarea; las que llegan mientras
+    sigue en curso esperan esa misma tarea y reciben su resultado (o su excepción).
+    Al terminar la clave se libera: la siguiente llamada vuelve a ejecutar `fn`, así que
+    el resultado no se guarda (de eso se encargan las cachés de cada servicio).
+
+    Cada llamador espera la tarea protegida con `shield`: si uno se cancela, los demás
+    siguen esperando y la carga no se interrumpe. El resultado es el mismo objeto para
+    todos, por lo que no se debe modificar en sitio.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, "asyncio.Task[Any]"] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        task = self._calls.get(key)
+        # Una tarea de otro event loop (p. ej. entre tests) no se puede esperar desde este
+        if task is None or task.get_loop() is not loop:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.leaders += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Si todos los llamadores se cancelaron nadie recoge el error: se registra aquí
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Carga compartida {self.name} {key!r} falló: {task.exception()!r}")
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": self.in_flight(), "leaders": self.leaders, "shared": self.shared}
+
+
+_groups: Dict[str, SingleFlight] = {}
+
+
+def group(name: str) -> SingleFlight:
+    """Grupo de llamadas con nombre; los contadores de todos los grupos se exponen en /health"""
+    if name not in _groups:
+        _groups[name] = SingleFlight(name)
+    return _groups[name]
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    return {name: flight.stats() for name, flight in _groups.items()}
@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.config import settings
+
+try:
+    import fcntl
+except ImportError:  # sin fcntl (Windows) cada worker publica su propio snapshot
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow es opcional: sin él se vuelve a parsear el archivo en cada carga
+    pa = None
+    feather = None
+
+logger = logging.getLogger(__name__)
+
+METADATA_KEY = b"monita"
+LOCK_POLL_SECONDS = 0.1
+
+
+def is_enabled() -> bool:
+    return pa is not None and settings.SNAPSHOTS_ENABLED
+
+
+def resource_version(resource: Dict[str, Any]) -> str:
+    """Versión upstream de un recurso CKAN según sus metadatos"""
+    parts = [
+        resource.get("url", ""),
+        resource.get("last_modified") or "",
+        resource.get("metadata_modified") or "",
+        resource.get("hash") or "",
+        str(resource.get("size") or ""),
+    ]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _safe_id(resource_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]", "_", resource_id)
+
+
+def snapshot_path(resource_id: str, version: str) -> str:
+    return os.path.join(settings.SNAPSHOT_DIR, f"{_safe_id(resource_id)}-{version}.arrow")
+
+
+def _versions(resource_id: str) -> List[Tuple[str, str]]:
+    """(versión, ruta) de los snapshots existentes de un recurso"""
+    if not os.path.isdir(settings.SNAPSHOT_DIR):
+        return []
+    # La versión son 16 hex: así "abc" no toma los snapshots de "abc-def"
+    pattern = re.compile(re.escape(_safe_id(resource_id)) + r"-([0-9a-f]{16})\.arrow$")
+    found = []
+    for name in os.listdir(settings.SNAPSHOT_DIR):
+        match = pattern.match(name)
+        if match:
+            found.append((match.group(1), os.path.join(settings.SNAPSHOT_DIR, name)))
+    return found
+
+
+def size(resource_id: str, version: str) -> Optional[int]:
+    """Bytes del snapshot de una versión (None si no existe)"""
+    if not is_enabled():
+        return None
+    try:
+        return os.path.getsize(snapshot_path(resource_id, version))
+    except OSError:
+        return None
+
+
+def num_rows(resource_id: str, version: str) -> Optional[int]:
+    """Filas del snapshot de una versión, leídas del archivo mapeado sin cargar las columnas"""
+    table = read_table(resource_id, version)
+    return None if table is None else table.num_rows
+
+
+def read_table(resource_id: str, version: str) -> Optional["pa.Table"]:
+    """
+    Abre el snapshot Arrow IPC de un recurso mediante memory-map, sin copiar los datos:
+    los workers que abren el mismo snapshot comparten las páginas en la caché del sistema.
+    Devuelve None si no existe snapshot para esa versión.
+    """
+    if not is_enabled():
+        return None
+    path = snapshot_path(resource_id, version)
+    if not os.path.exists(path):
+        return None
+    try:
+        source = pa.memory_map(path, "r")
+        return pa.ipc.open_file(source).read_all()
+    except Exception as e:
+        logger.warning(f"Snapshot inválido para {resource_id} ({path}): {str(e)}")
+        _remove(path)
+        return None
+
+
+def read(resource_id: str, version: str, nrows: Optional[int] = None) -> Optional[pd.DataFrame]:
+    """
+    Lee el snapshot de un recurso como DataFrame (None si no existe para esa versión).
+    Las columnas numéricas, de texto y categóricas sin nulos quedan apuntando al mmap (solo
+    lectura: pandas copia al modificar); un bloque por columna evita consolidarlas en una copia.
+    """
+    table = read_table(resource_id, version)
+    if table is None:
+        return None
+    if nrows is not None:
+        table = table.slice(0, nrows)
+    return table.to_pandas(split_blocks=True)
+
+
+def read_metadata(resource_id: str, version: str) -> Dict[str, str]:
+    """Metadatos guardados con `write` (p. ej. ETag del dataset), sin leer los datos"""
+    path = snapshot_path(resource_id, version)
+    try:
+        with pa.memory_map(path, "r") as source:
+            schema = pa.ipc.open_file(source).schema
+    except Exception:
+        return {}
+    raw = (schema.metadata or {}).get(METADATA_KEY)
+    return json.loads(raw) if raw else {}
+
+
+def latest(resource_id: str) -> Optional[str]:
+    """Versión del snapshot más reciente de un recurso (p. ej. para arrancar un worker sin volver a parsear)"""
+    if not is_enabled():
+        return None
+    found = _versions(resource_id)
+    if not found:
+        return None
+    try:
+        return max(found, key=lambda item: os.path.getmtime(item[1]))[0]
+    except OSError:
+        return None
+
+
+def _to_table(df: pd.DataFrame) -> "pa.Table":
+    """
+    Tabla de un solo lote y con los NaN de las columnas float como valores (no como nulos):
+    así `read` puede entregar cada columna sin copiarla.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i in range(df.shape[1]):
+        column = df.iloc[:, i]
+        if isinstance(column.dtype, np.dtype) and column.dtype.kind == "f" and table.column(i).null_count:
+            table = table.set_column(i, table.field(i), pa.array(column.to_numpy(), from_pandas=False))
+    return table.combine_chunks()
+
+
+def write(resource_id: str, version: str, df: pd.DataFrame, metadata: Optional[Dict[str, str]] = None) -> Optional[str]:
+    """
+    Guarda el DataFrame como snapshot Arrow IPC sin comprimir y en un solo lote (apto para
+    mmap sin copia). La escritura es atómica y elimina los snapshots de versiones anteriores
+    (los workers que aún los tengan abiertos siguen leyéndolos hasta soltarlos).
+    """
+    if not is_enabled():
+        return None
+    path = snapshot_path(resource_id, version)
+    os.makedirs(settings.SNAPSHOT_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=settings.SNAPSHOT_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        table = _to_table(df)
+        if metadata:
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), METADATA_KEY: json.dumps(metadata)})
+        feather.write_feather(table, tmp_path, compression="uncompressed", chunksize=max(table.num_rows, 1))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        # Columnas con tipos mixtos que Arrow no sabe convertir: se sigue sin snapshot
+        logger.warning(f"No se pudo crear el snapshot de {resource_id}: {str(e)}")
+        _remove(tmp_path)
+        return None
+    _remove_stale(resource_id, keep=path)
+    return path
+
+
+def publish(resource_id: str, version: str, df: pd.DataFrame, metadata: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """
+    Guarda el snapshot y devuelve el DataFrame leído desde él: la copia privada recién
+    parseada se libera y queda solo la del mmap, compartida con los demás workers.
+    Si no se pudo guardar devuelve `df` tal cual.
+    """
+    if write(resource_id, version, df, metadata) is None:
+        return df
+    mapped = read(resource_id, version)
+    return df if mapped is None else mapped
+
+
+def _open_lock(resource_id: str):
+    os.makedirs(settings.SNAPSHOT_DIR, exist_ok=True)
+    return open(os.path.join(settings.SNAPSHOT_DIR, f"{_safe_id(resource_id)}.lock"), "a")
+
+
+@contextmanager
+def publishing(resource_id: str) -> Iterator[None]:
+    """
+    Exclusión entre procesos mientras se publica un snapshot: un solo worker descarga y
+    parsea, los demás esperan y después abren el snapshot. Bloquea el hilo que espera.
+    """
+    if fcntl is None or not is_enabled():
+        yield
+        return
+    with _open_lock(resource_id) as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+
+
+@asynccontextmanager
+async def apublishing(resource_id: str) -> AsyncIterator[None]:
+    """Igual que `publishing` pero esperando sin bloquear el event loop (y cancelable)"""
+    if fcntl is None or not is_enabled():
+        yield
+        return
+    with _open_lock(resource_id) as handle:
+        while True:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(LOCK_POLL_SECONDS)
+        # Cerrar el archivo suelta el lock
+        yield
+
+
+def _remove_stale(resource_id: str, keep: str) -> None:
+    for _, path in _versions(resource_id):
+        if path != keep:
+            _remove(path)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,94 @@
+import codecs
+import csv
+import io
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+
+from app.config import settings
+from app.services import http_client, metrics
+
+logger = logging.getLogger(__name__)
+
+DELIMITERS = ",;\t|"
+
+
+@dataclass(frozen=True)
+class CsvDialect:
+    encoding: str
+    sep: str
+
+
+def sniff(sample: bytes) -> CsvDialect:
+    """Detecta codificación y separador a partir de los primeros KB del archivo"""
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    else:
+        # Se descarta la última línea: puede venir cortada a mitad de un carácter multibyte
+        body = sample[:sample.rfind(b"\n") + 1] or sample
+        try:
+            body.decode("utf-8")
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = "latin-1"
+    text = sample.decode(encoding, errors="ignore")
+    lines = text.splitlines()
+    if len(lines) > 1:
+        # Sin la última línea, posiblemente incompleta
+        text = "\n".join(lines[:-1])
+    try:
+        sep = csv.Sniffer().sniff(text, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        first = lines[0] if lines else ""
+        sep = max(DELIMITERS, key=first.count) if first and any(d in first for d in DELIMITERS) else ","
+    return CsvDialect(encoding=encoding, sep=sep)
+
+
+def read_csv_bytes(content: bytes, nrows: Optional[int] = None, dialect: Optional[CsvDialect] = None, **kwargs) -> pd.DataFrame:
+    if not content.strip():
+        # Un recurso vacío no tiene columnas: pandas lanzaría EmptyDataError
+        return pd.DataFrame()
+    dialect = dialect or sniff(content[:settings.SNIFF_BYTES])
+    return pd.read_csv(
+        io.BytesIO(content),
+        nrows=nrows,
+        sep=dialect.sep,
+        encoding=dialect.encoding,
+        encoding_errors='replace',
+        **kwargs
+    )
+
+
+async def read_csv_head(url: str, nrows: int) -> pd.DataFrame:
+    """
+    Lee solo la cabecera y las primeras `nrows` filas de un CSV remoto.
+
+    Descarga el cuerpo por partes y cierra la conexión en cuanto hay suficientes
+    líneas completas, así una vista previa de un archivo de 100 MB transfiere
+    unos pocos KB. Si hay campos entre comillas con saltos de línea, el conteo de
+    líneas se queda corto y se sigue leyendo hasta que pandas obtiene las filas pedidas.
+    """
+    buffer = bytearray()
+    needed_lines = nrows + 1
+    dialect = None
+    async with http_client.get_client().stream("GET", url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            metrics.count("downloaded_bytes", len(chunk))
+            buffer.extend(chunk)
+            if len(buffer) > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
+                raise ValueError(f"El archivo supera el tamaño máximo de {settings.MAX_FILE_SIZE_MB}MB")
+            if dialect is None and len(buffer) >= settings.SNIFF_BYTES:
+                dialect = sniff(bytes(buffer[:settings.SNIFF_BYTES]))
+            if buffer.count(b"\n") < needed_lines:
+                continue
+            complete = bytes(buffer[:buffer.rfind(b"\n") + 1])
+            df = read_csv_bytes(complete, nrows=nrows, dialect=dialect or sniff(complete[:settings.SNIFF_BYTES]))
+            if len(df) >= nrows:
+                logger.info(f"Lectura parcial de {url}: {len(buffer)} bytes para {nrows} filas")
+                return df
+            needed_lines *= 2
+    # Fin del archivo antes de completar las filas pedidas
+    return read_csv_bytes(bytes(buffer), nrows=nrows, dialect=dialect)
@@ -0,0 +1,114 @@
+import io
+import logging
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Una columna de texto se guarda como categórica si tiene a lo sumo esta proporción de valores distintos
+CATEGORY_MAX_RATIO = 0.5
+
+
+@dataclass(frozen=True)
+class Schema:
+    """
+    Tipos de un dataset: dimensiones categóricas, fechas y columnas numéricas.
+
+    Las columnas del esquema que no existan en el archivo se ignoran.
+    """
+    categoricas: Tuple[str, ...] = ()
+    fechas: Tuple[str, ...] = ()
+    numericas: Tuple[str, ...] = ()
+
+
+def read_csv(content: bytes, schema: Schema, **kwargs) -> pd.DataFrame:
+    """Lee un CSV aplicando el esquema; las categóricas se construyen durante el parseo"""
+    dtype = {col: "category" for col in schema.categoricas}
+    frame = pd.read_csv(io.BytesIO(content), dtype=dtype, **kwargs)
+    return apply_schema(frame, schema)
+
+
+def apply_schema(frame: pd.DataFrame, schema: Schema) -> pd.DataFrame:
+    """Convierte las columnas del esquema: categorías, fechas a datetime64 y números al tipo más pequeño"""
+    columns = {}
+    for col in schema.categoricas:
+        if col in frame.columns and not isinstance(frame[col].dtype, pd.CategoricalDtype):
+            columns[col] = frame[col].astype("category")
+    for col in schema.fechas:
+        if col in frame.columns and not pd.api.types.is_datetime64_any_dtype(frame[col]):
+            columns[col] = parse_dates(frame[col])
+    for col in schema.numericas:
+        if col in frame.columns:
+            columns[col] = downcast(frame[col])
+    if not columns:
+        return frame
+    return frame.assign(**columns)
+
+
+def parse_dates(serie: pd.Series) -> pd.Series:
+    """
+    Convierte texto a datetime64. pandas infiere el formato del primer valor y deja NaT en
+    los que no lo siguen: esos se vuelven a parsear uno a uno (format="mixed"). Los que
+    tampoco son fechas quedan NaT y se registran, porque salen de los agregados por fecha.
+    """
+    fechas = pd.to_datetime(serie, errors="coerce")
+    fallidas = fechas.isna() & serie.notna()
+    if not fallidas.any():
+        return fechas
+    try:
+        otras = pd.to_datetime(serie[fallidas], errors="coerce", format="mixed")
+    except (ValueError, TypeError):
+        # p. ej. zonas horarias distintas entre valores
+        otras = None
+    if otras is not None and pd.api.types.is_datetime64_any_dtype(otras) and otras.dt.tz is None:
+        fechas = fechas.mask(fallidas, otras.astype(fechas.dtype))
+        fallidas = fechas.isna() & serie.notna()
+    if fallidas.any():
+        ejemplos = ", ".join(repr(v) for v in serie[fallidas].astype(str).unique()[:3])
+        logger.warning(
+            f"{int(fallidas.sum())} valores de la columna {serie.name} no son fechas y quedan vacíos (p. ej. {ejemplos})"
+        )
+    return fechas
+
+
+def infer_schema(frame: pd.DataFrame) -> Schema:
+    """Esquema para un recurso arbitrario: texto repetitivo como categoría y números reducidos"""
+    categoricas = []
+    numericas = []
+    limite = len(frame) * CATEGORY_MAX_RATIO
+    for col in frame.columns:
+        serie = frame[col]
+        if pd.api.types.is_bool_dtype(serie):
+            continue
+        if pd.api.types.is_numeric_dtype(serie):
+            numericas.append(col)
+        elif pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie):
+            if len(frame) > 1 and serie.nunique(dropna=True) <= limite:
+                categoricas.append(col)
+    return Schema(categoricas=tuple(categoricas), numericas=tuple(numericas))
+
+
+def compact(frame: pd.DataFrame) -> pd.DataFrame:
+    """Reduce la memoria de un DataFrame con el esquema inferido de sus datos"""
+    if frame.empty:
+        return frame
+    return apply_schema(frame, infer_schema(frame))
+
+
+def downcast(serie: pd.Series) -> pd.Series:
+    """
+    Enteros al tipo más pequeño que los contiene. Los reales solo se convierten si todos
+    son enteros exactos: pasar a float32 cambiaría los valores y las sumas reportadas.
+    """
+    if pd.api.types.is_bool_dtype(serie) or not pd.api.types.is_numeric_dtype(serie):
+        return serie
+    if pd.api.types.is_integer_dtype(serie):
+        return pd.to_numeric(serie, downcast="integer")
+    if pd.api.types.is_float_dtype(serie) and len(serie):
+        values = serie.to_numpy()
+        if np.isfinite(values).all() and (values == np.round(values)).all():
+            return pd.to_numeric(serie, downcast="integer")
+    return serie
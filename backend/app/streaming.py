@@ -0,0 +1,211 @@
+import logging
+import zlib
+from typing import AsyncIterator, Dict, Iterable, Iterator, Optional
+
+import httpx
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.config import settings
+from app.services import download_cache, http_client, metrics
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se negocia gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Codificación para la respuesta según Accept-Encoding: br (si está instalado), gzip o ninguna"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+class Compressor:
+    """Compresión incremental: cada bloque se comprime y se entrega sin esperar al resto"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=settings.STREAM_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(settings.STREAM_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk)
+        return self._compressor.compress(chunk)
+
+    def flush(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    if encoding is None:
+        yield from chunks
+        return
+    compressor = Compressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def acompress_chunks(chunks: AsyncIterator[bytes], encoding: Optional[str]) -> AsyncIterator[bytes]:
+    if encoding is None:
+        async for chunk in chunks:
+            yield chunk
+        return
+    compressor = Compressor(encoding)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _encoding_headers(encoding: Optional[str]) -> Dict[str, str]:
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return headers
+
+
+def csv_chunks(df: pd.DataFrame, positions: np.ndarray, batch_rows: int) -> Iterator[bytes]:
+    """Filas `positions` del frame como CSV, de a `batch_rows` filas (la memoria no depende del total)"""
+    yield df.iloc[:0].to_csv(index=False).encode("utf-8")
+    for start in range(0, len(positions), batch_rows):
+        batch = df.iloc[positions[start:start + batch_rows]]
+        yield batch.to_csv(index=False, header=False).encode("utf-8")
+
+
+def ndjson_chunks(df: pd.DataFrame, positions: np.ndarray, batch_rows: int) -> Iterator[bytes]:
+    """Filas `positions` del frame como JSON por línea (NaN como null, fechas en ISO 8601)"""
+    for start in range(0, len(positions), batch_rows):
+        batch = df.iloc[positions[start:start + batch_rows]]
+        text = batch.to_json(orient="records", lines=True, date_format="iso", force_ascii=False)
+        if text and not text.endswith("\n"):
+            text += "\n"
+        yield text.encode("utf-8")
+
+
+def export_response(
+    df: pd.DataFrame,
+    positions: np.ndarray,
+    fmt: str,
+    accept_encoding: Optional[str],
+    filename: str,
+    background: Optional[BackgroundTask] = None,
+) -> StreamingResponse:
+    """
+    Exporta las filas seleccionadas en streaming como CSV o NDJSON, comprimidas si el
+    cliente lo acepta. Los lotes se serializan en el pool de hilos de Starlette.
+    """
+    chunks = csv_chunks if fmt == "csv" else ndjson_chunks
+    encoding = negotiate_encoding(accept_encoding)
+    headers = _encoding_headers(encoding)
+    headers["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return StreamingResponse(
+        compress_chunks(chunks(df, positions, settings.CHUNK_SIZE), encoding),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers=headers,
+        background=background,
+    )
+
+
+async def proxy_download(
+    url: str, accept_encoding: Optional[str], filename: str, media_type: str, version: Optional[str] = None
+) -> StreamingResponse:
+    """
+    Reenvía el archivo upstream al cliente a medida que llega, sin acumularlo en memoria.
+    Con la caché de descargas habilitada se sirve desde disco si sigue vigente (según
+    `version` o revalidando con CKAN); si no, se
+    guarda mientras se reenvía (y una descarga cortada se retoma en la siguiente solicitud).
+    Sin caché, si el upstream ya viene comprimido con una codificación que el cliente acepta,
+    los bytes pasan tal cual. Se corta al superar MAX_FILE_SIZE_MB.
+    """
+    max_bytes = settings.MAX_FILE_SIZE_MB * 1024 * 1024
+    encoding = negotiate_encoding(accept_encoding)
+    headers = _encoding_headers(encoding)
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    if download_cache.is_enabled():
+        try:
+            download = await download_cache.cache.open(url, version)
+        except httpx.HTTPError as e:
+            logger.error(f"Error al descargar {url}: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"No se pudo descargar el archivo: {str(e)}")
+        if not download.cached and download.resumed + int(download.response.headers.get("content-length") or 0) > max_bytes:
+            await download.aclose()
+            raise HTTPException(
+                status_code=413,
+                detail=f"El archivo es demasiado grande. Tamaño máximo permitido: {settings.MAX_FILE_SIZE_MB}MB"
+            )
+        if download.cached:
+            return StreamingResponse(
+                compress_chunks(download_cache.file_blocks(download.path), encoding), media_type=media_type, headers=headers
+            )
+        return StreamingResponse(
+            acompress_chunks(download.chunks(), encoding), media_type=media_type, headers=headers,
+            background=BackgroundTask(download.aclose)
+        )
+
+    try:
+        upstream = await http_client.open_stream(url)
+    except httpx.HTTPError as e:
+        logger.error(f"Error al descargar {url}: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"No se pudo descargar el archivo: {str(e)}")
+    if int(upstream.headers.get("content-length") or 0) > max_bytes:
+        await upstream.aclose()
+        raise HTTPException(
+            status_code=413,
+            detail=f"El archivo es demasiado grande. Tamaño máximo permitido: {settings.MAX_FILE_SIZE_MB}MB"
+        )
+
+    upstream_encoding = upstream.headers.get("content-encoding", "").lower() or None
+    passthrough = upstream_encoding is not None and upstream_encoding == encoding
+
+    async def body() -> AsyncIterator[bytes]:
+        total = 0
+        chunks = upstream.aiter_raw() if passthrough else upstream.aiter_bytes()
+        try:
+            async for chunk in chunks:
+                total += len(chunk)
+                metrics.count("downloaded_bytes", len(chunk))
+                if total > max_bytes:
+                    # Los encabezados ya se enviaron: solo queda cortar la respuesta
+                    logger.warning(f"Descarga de {url} cortada al superar {settings.MAX_FILE_SIZE_MB}MB")
+                    break
+                yield chunk
+        finally:
+            await upstream.aclose()
+
+    if passthrough and upstream.headers.get("content-length"):
+        headers["Content-Length"] = upstream.headers["content-length"]
+    content = body() if passthrough else acompress_chunks(body(), encoding)
+    # Si el cliente se desconecta antes de empezar, el cierre en segundo plano libera la conexión
+    return StreamingResponse(content, media_type=media_type, headers=headers, background=BackgroundTask(upstream.aclose))
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+import requests
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.routers import agua
+from app.services import admission, dataset_store
+from app.services.admission import AdmissionController
+from app.services.dataset_store import DatasetStore
+
+MB = 1024 * 1024
+
+
+async def ocupar(controller, costo, inicio, fin, orden, nombre):
+    async with controller.admit(costo):
+        orden.append(nombre)
+        inicio.set()
+        await fin.wait()
+
+
+@pytest.mark.asyncio
+async def test_requests_wait_until_their_cost_fits_in_the_budget():
+    controller = AdmissionController(max_concurrent=4, budget_bytes=100 * MB, max_queue=10, queue_timeout=5)
+    orden = []
+    eventos = [(asyncio.Event(), asyncio.Event()) for _ in range(3)]
+    grande = asyncio.ensure_future(ocupar(controller, 80 * MB, *eventos[0], orden, "grande"))
+    await eventos[0][0].wait()
+    # 80 + 30 no cabe: espera aunque haya huecos de concurrencia
+    mediana = asyncio.ensure_future(ocupar(controller, 30 * MB, *eventos[1], orden, "mediana"))
+    pequena = asyncio.ensure_future(ocupar(controller, 1 * MB, *eventos[2], orden, "pequeña"))
+    await asyncio.sleep(0.01)
+    assert orden == ["grande"]
+    assert controller.stats()["queued"] == 2
+
+    # Al terminar la grande entran en orden de llegada
+    eventos[0][1].set()
+    await eventos[2][0].wait()
+    assert orden == ["grande", "mediana", "pequeña"]
+    for _, fin in eventos[1:]:
+        fin.set()
+    await asyncio.gather(grande, mediana, pequena)
+    assert controller.stats()["reserved_mb"] == 0
+    assert controller.running == 0
+
+
+@pytest.mark.asyncio
+async def test_saturated_controller_answers_503_with_retry_after():
+    controller = AdmissionController(max_concurrent=1, budget_bytes=100 * MB, max_queue=1, queue_timeout=0.05)
+    inicio, fin = asyncio.Event(), asyncio.Event()
+    ocupada = asyncio.ensure_future(ocupar(controller, MB, inicio, fin, [], "ocupada"))
+    await inicio.wait()
+
+    # Con la cola llena se rechaza de inmediato; en la cola, al vencer el plazo
+    en_cola = asyncio.ensure_future(controller.admit(MB).__aenter__())
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as rechazo:
+        async with controller.admit(MB):
+            pass
+    assert rechazo.value.status_code == 503
+    assert int(rechazo.value.headers["Retry-After"]) >= 1
+    with pytest.raises(HTTPException) as vencida:
+        await en_cola
+    assert vencida.value.status_code == 503
+    assert controller.stats()["rejected"] == 1
+    assert controller.stats()["timed_out"] == 1
+
+    fin.set()
+    await ocupada
+    assert controller.stats()["queued"] == 0
+    assert controller.running == 0
+
+
+def test_work_cost_counts_rows_as_well_as_frame_bytes(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_WORK_FACTOR", 0.5)
+    monkeypatch.setattr(settings, "ADMISSION_ROW_BYTES", 32)
+    assert admission.work_cost(100 * MB) == 50 * MB
+    # Mismo tamaño con el doble de filas (columnas más angostas) reserva más
+    assert admission.work_cost(100 * MB, rows=2_000_000) == 50 * MB + 64_000_000
+
+
+class FakeSession:
+    def get(self, url, headers=None, timeout=None):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"fecha,zona,tipo_usuario,consumo_m3\n2024-01-05,Norte,residencial,10\n"
+        return response
+
+
+def test_only_analysis_endpoints_wait_for_admission(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_DIR", str(tmp_path))
+    store = DatasetStore(session=FakeSession(), revalidate_after=3600)
+    store.register("agua", "https://datos.cali.gov.co/agua.csv")
+    monkeypatch.setattr(dataset_store, "store", store)
+    # Sin lugar ni cola: todo lo que pase por la admisión recibe 503
+    monkeypatch.setattr(admission, "controller", AdmissionController(
+        max_concurrent=0, budget_bytes=100 * MB, max_queue=0, queue_timeout=1
+    ))
+    app = FastAPI()
+    app.include_router(agua.router)
+    client = TestClient(app)
+
+    assert client.get("/agua/zonas/distinct").json() == {"zonas": ["Norte"]}
+    assert client.get("/agua/tipos_usuario/distinct").status_code == 200
+    response = client.get("/agua/consumo/summary")
+    assert response.status_code == 503
+    assert "retry-after" in response.headers
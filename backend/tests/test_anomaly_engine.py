@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.anomaly_engine import AnomalyEngine
+
+
+def make_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    fechas = pd.date_range("2022-01-01", "2024-12-31", freq="D")
+    partes = []
+    # Dos zonas con niveles muy distintos y estacionalidad propia
+    for zona, nivel in (("Norte", 10.0), ("Sur", 100.0)):
+        estacion = 1 + 0.3 * np.sin(2 * np.pi * fechas.month / 12)
+        partes.append(pd.DataFrame({
+            "fecha": fechas.strftime("%Y-%m-%d"),
+            "zona": zona,
+            "tipo_usuario": "residencial",
+            "consumo_m3": nivel * estacion + rng.normal(0, 0.5, len(fechas)),
+        }))
+    df = pd.concat(partes, ignore_index=True)
+    df.loc[100, "consumo_m3"] = 30.0  # pico en la zona de consumo bajo
+    return df
+
+
+def test_baselines_are_per_zone():
+    engine = AnomalyEngine(make_frame(), "consumo_m3")
+    candidatos = engine.candidates("mad", 5.0)
+    assert candidatos.index[0] == 100
+    assert set(candidatos["zona"]) == {"Norte"}
+    # Con una línea base global, toda la zona Sur quedaría por encima de la media
+    assert len(candidatos) < 10
+
+
+@pytest.mark.parametrize("metodo", ["zscore", "mad", "seasonal"])
+def test_candidates_are_sorted_by_severity(metodo):
+    engine = AnomalyEngine(make_frame(), "consumo_m3")
+    scores = engine.candidates(metodo, 2.0)["score"].abs().to_numpy()
+    assert (scores > 2.0).all()
+    assert (np.diff(scores) <= 0).all()
+
+
+
+def test_ranked_positions_are_cached_per_query():
+    engine = AnomalyEngine(make_frame(), "consumo_m3")
+    llamadas = []
+
+    def solo_sur(candidatos):
+        llamadas.append(len(candidatos))
+        return candidatos[candidatos["zona"] == "Sur"]
+
+    posiciones = engine.ranked("zscore", 2.0, solo_sur, clave="Sur")
+    esperado = engine.candidates("zscore", 2.0)
+    esperado = esperado[esperado["zona"] == "Sur"]
+    assert posiciones.tolist() == esperado.index.tolist()
+    # La página siguiente reutiliza las posiciones sin volver a filtrar
+    assert engine.ranked("zscore", 2.0, solo_sur, clave="Sur") is posiciones
+    assert len(llamadas) == 1
+    pagina = engine.rows_at("zscore", posiciones[2:4])
+    pd.testing.assert_frame_equal(pagina, esperado.iloc[2:4])
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from app.services import chart_engine
+from app.services.chart_engine import ValueCounts, chart_points, lttb
+from app.services.memory_manager import MemoryManager
+
+
+def test_counts_and_histogram_match_pandas():
+    rng = np.random.default_rng(0)
+    serie = pd.Series(np.where(rng.random(5000) < 0.05, np.nan, rng.integers(0, 40, 5000)))
+    counts = ValueCounts.from_series(serie)
+    points, total = chart_points(counts, "bar", 10, 500)
+    expected = serie.value_counts().sort_index()
+    assert total == len(expected)
+    assert [p["value"] for p in points] == expected.astype(float).tolist()
+
+    hist, edges = counts.histogram(7)
+    expected_hist, expected_edges = np.histogram(serie.dropna(), bins=7)
+    assert np.array_equal(hist, expected_hist)
+    assert np.allclose(edges, expected_edges)
+
+
+def test_line_is_downsampled_keeping_peaks():
+    x = np.arange(100_000)
+    y = np.sin(x / 5000.0)
+    y[43_210] = 50.0
+    keep = lttb(x, y, 300)
+    assert len(keep) == 300
+    assert keep[0] == 0 and keep[-1] == len(x) - 1
+    assert np.all(np.diff(keep) > 0)
+    assert 43_210 in keep
+
+    counts = ValueCounts(values=x, counts=y, numeric=True)
+    points, total = chart_points(counts, "line", 10, 300)
+    assert len(points) == 300
+    assert total == len(x)
+
+
+def test_categorical_columns_skip_empty_categories():
+    serie = pd.Series(["a", "b", "a", None], dtype="category").cat.add_categories(["sin_filas"])
+    points, total = chart_points(ValueCounts.from_series(serie), "bar", 10, 500)
+    assert points == [{"label": "a", "value": 2.0}, {"label": "b", "value": 1.0}]
+    assert total == 2
+
+
+def test_histograms_are_counted_in_the_memory_budget(monkeypatch):
+    memory = MemoryManager(budget_bytes=1 << 30)
+    monkeypatch.setattr(chart_engine, "manager", memory)
+    df = pd.DataFrame({"consumo": np.arange(10_000.0)})
+    counts = chart_engine.compute("r1", "v1", df, "consumo")
+    antes = memory.used_bytes
+    chart_engine.cached_points("r1", "v1", "consumo", counts, "histogram", 50, 500)
+    assert memory.used_bytes == antes + 50 * 8 + 51 * 8
+    assert memory.size_of(("chart", "r1", "v1", "consumo")) == counts.nbytes
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.compute import ComputePool
+
+
+@pytest.mark.asyncio
+async def test_pool_bounds_concurrency():
+    pool = ComputePool(workers=2, max_queue=10)
+    lock = threading.Lock()
+    state = {"current": 0, "peak": 0}
+
+    def job():
+        with lock:
+            state["current"] += 1
+            state["peak"] = max(state["peak"], state["current"])
+        time.sleep(0.05)
+        with lock:
+            state["current"] -= 1
+        return True
+
+    results = await asyncio.gather(*(pool.run(job) for _ in range(6)))
+    assert all(results)
+    assert state["peak"] == 2
+    assert pool.stats()["completed"] == 6
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_pool_rejects_when_queue_is_full():
+    pool = ComputePool(workers=1, max_queue=1)
+    tasks = [asyncio.ensure_future(pool.run(time.sleep, 0.1)) for _ in range(3)]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+    assert len(rejected) == 1
+    assert rejected[0].status_code == 503
+    assert pool.stats()["rejected"] == 1
+    pool.shutdown()
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.routers import agua
+from app.services import consumo_cube, dataset_store
+from app.services.agua_analysis import apply_filters
+from app.services.dataset_store import DatasetStore
+from app.services.typed_loader import Schema, apply_schema
+
+SCHEMA = Schema(categoricas=("zona", "tipo_usuario"), fechas=("fecha",), numericas=("consumo_m3",))
+
+
+def make_frame(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    fechas = pd.date_range("2023-01-01", "2024-12-31", freq="D")
+    return pd.DataFrame({
+        "fecha": pd.DatetimeIndex(rng.choice(fechas, n)).strftime("%Y-%m-%d"),
+        "zona": rng.choice(["Comuna 1", "Comuna 2", "Comuna 3", None], n),
+        "tipo_usuario": rng.choice(["residencial", "comercial"], n),
+        "consumo_m3": rng.gamma(2.0, 10.0, n),
+    })
+
+
+def con_fechas(filtros):
+    """Filtros como los deja el router: fechas convertidas a Timestamp"""
+    return {
+        **filtros,
+        **{k: consumo_cube.parse_fecha(v) for k, v in filtros.items() if k in ("fecha_inicio", "fecha_fin")},
+    }
+
+
+@pytest.mark.parametrize("filtros", [
+    {},
+    {"zonas": ["Comuna 1", "Comuna 3"]},
+    {"tipo_usuario": "comercial", "fecha_inicio": "2023-03-01", "fecha_fin": "2024-02-29"},
+    {"zonas": ["Comuna 2"], "fecha_inicio": "2024-01"},
+])
+@pytest.mark.parametrize("typed", [False, True])
+def test_cube_matches_raw_aggregation(filtros, typed):
+    df = make_frame()
+    filtros = con_fechas(filtros)
+    # El cubo del frame tipado (categorías y datetime64) debe coincidir con las filas originales
+    cube = consumo_cube.build_cube(apply_schema(df, SCHEMA) if typed else df, "consumo_m3")
+    assert consumo_cube.can_answer(cube, filtros.get("fecha_inicio"), filtros.get("fecha_fin"))
+    cells = consumo_cube.filter_cells(cube, **filtros)
+    raw = apply_filters(apply_schema(df, SCHEMA), **filtros)
+
+    meses = pd.to_datetime(raw["fecha"]).dt.to_period("M").astype(str)
+    expected_ts = raw.groupby(meses)["consumo_m3"].sum()
+    pd.testing.assert_series_equal(consumo_cube.timeseries(cells), expected_ts, check_names=False)
+
+    expected_zonas = raw.groupby(raw["zona"].astype(object).fillna("Desconocida"))["consumo_m3"].sum()
+    pd.testing.assert_series_equal(consumo_cube.zonas(cells).sort_index(), expected_zonas, check_names=False)
+
+    summary = consumo_cube.summary(cells)
+    assert summary["total"] == pytest.approx(raw["consumo_m3"].sum())
+    assert summary["promedio"] == pytest.approx(raw["consumo_m3"].mean())
+    assert summary["maximo"] == raw["consumo_m3"].max()
+    assert summary["minimo"] == raw["consumo_m3"].min()
+
+
+def test_cube_rejects_ranges_not_aligned_to_month():
+    cube = consumo_cube.build_cube(make_frame(), "consumo_m3")
+    fecha = consumo_cube.parse_fecha
+    assert not consumo_cube.can_answer(cube, fecha("2024-01-15"), None)
+    assert not consumo_cube.can_answer(cube, None, fecha("2024-03-30"))
+    assert not consumo_cube.can_answer(cube, None, fecha("2024-03"))
+
+
+def test_cube_rejects_date_filters_when_dates_have_time():
+    df = make_frame()
+    df["fecha"] = df["fecha"] + " 10:00"
+    cube = consumo_cube.build_cube(df, "consumo_m3")
+    assert consumo_cube.can_answer(cube)
+    assert not consumo_cube.can_answer(cube, consumo_cube.parse_fecha("2024-01-01"), None)
+
+
+def test_matriz_zonas_from_cube_matches_raw_rows():
+    df = make_frame()
+    zonas = ["Comuna 3", "Comuna 1", "Comuna 9"]
+    cells = consumo_cube.filter_cells(consumo_cube.build_cube(df, "consumo_m3"), tipos_usuario=["residencial"])
+    desde_cubo = consumo_cube.matriz_zonas(cells["mes"], cells["zona"], cells["suma"], zonas)
+
+    raw = df[df["tipo_usuario"] == "residencial"]
+    meses = pd.to_datetime(raw["fecha"]).dt.to_period("M").astype(str)
+    desde_filas = consumo_cube.matriz_zonas(meses, raw["zona"], raw["consumo_m3"], zonas)
+
+    assert list(desde_cubo.columns) == zonas
+    assert (desde_cubo["Comuna 9"] == 0).all()
+    pd.testing.assert_frame_equal(desde_cubo, desde_filas, check_names=False)
+
+
+class FakeSession:
+    def get(self, url, headers=None, timeout=None):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = (
+            b"fecha,zona,tipo_usuario,consumo_m3\n"
+            b"2024-01-05,Norte,residencial,10\n2024-02-05,Sur,comercial,20\n"
+        )
+        return response
+
+
+def test_invalid_dates_return_400_and_valid_ones_filter_datetime_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_DIR", str(tmp_path))
+    store = DatasetStore(session=FakeSession(), revalidate_after=3600)
+    store.register("agua", "https://datos.cali.gov.co/agua.csv", SCHEMA)
+    monkeypatch.setattr(dataset_store, "store", store)
+    app = FastAPI()
+    app.include_router(agua.router)
+    client = TestClient(app)
+
+    response = client.get("/agua/consumo/summary?fecha_inicio=abc")
+    assert response.status_code == 400
+    assert "Fecha inválida" in response.json()["detail"]
+    assert client.get("/agua/consumo/timeseries?fecha_fin=2024-13-01").status_code == 400
+
+    # Rango no alineado a mes: se filtran las filas datetime64 con Timestamps
+    response = client.get("/agua/consumo/summary?fecha_inicio=2024-02-01T00:00&fecha_fin=2024-02-20")
+    assert response.status_code == 200
+    assert response.json()["summary"]["total"] == 20
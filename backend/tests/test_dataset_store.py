@@ -0,0 +1,61 @@
+from app.config import settings
+from app.services.dataset_store import DatasetStore
+
+CSV = b"fecha,zona,tipo_usuario,consumo_m3\n2024-01-05,Norte,residencial,10\n2024-02-05,Sur,comercial,20\n"
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.calls.append(headers or {})
+        if headers and headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, CSV, {"ETag": '"v1"'})
+
+
+def test_dataset_is_loaded_once_and_revalidated_with_etag(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_DIR", str(tmp_path))
+    session = FakeSession()
+    store = DatasetStore(session=session, revalidate_after=3600)
+    store.register("agua", "https://datos.cali.gov.co/agua.csv")
+
+    first = store.get("agua")
+    second = store.get("agua")
+    assert first is second
+    assert len(session.calls) == 1
+    assert len(first.frame) == 2
+
+    store.invalidate("agua")
+    third = store.get("agua")
+    assert third is first
+    assert session.calls[-1]["If-None-Match"] == '"v1"'
+
+
+def test_workers_share_the_published_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_DIR", str(tmp_path))
+    url = "https://datos.cali.gov.co/agua.csv"
+    primero = DatasetStore(session=FakeSession(), revalidate_after=3600)
+    primero.register("agua", url)
+    publicado = primero.get("agua")
+
+    # Otro worker abre la versión publicada por mmap y solo la revalida con su ETag
+    session = FakeSession()
+    segundo = DatasetStore(session=session, revalidate_after=3600)
+    segundo.register("agua", url)
+    abierto = segundo.get("agua")
+    assert session.calls == [{"If-None-Match": '"v1"'}]
+    assert abierto.version == publicado.version
+    assert abierto.frame.equals(publicado.frame)
+    assert not abierto.frame["consumo_m3"].to_numpy().flags.writeable
@@ -0,0 +1,207 @@
+import gzip
+import os
+
+import httpx
+import pytest
+
+from app.services import http_client
+from app.services.download_cache import DownloadCache, DownloadTooLarge
+
+URL = "https://datos.cali.gov.co/r/consumo.csv"
+BODY = b"zona,consumo\n" + b"".join(f"Sur,{i}\n".encode() for i in range(5000))
+ETAG = '"v1"'
+
+
+class CortaStream(httpx.AsyncByteStream):
+    """Cuerpo que se corta con un error de red después de `limite` bytes"""
+
+    def __init__(self, body, limite):
+        self.body = body
+        self.limite = limite
+
+    async def __aiter__(self):
+        yield self.body[:self.limite]
+        raise httpx.ReadError("conexión cerrada por el servidor")
+
+
+class Upstream:
+    def __init__(self, cortar_en=None):
+        self.cortar_en = cortar_en
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        if request.headers.get("if-none-match") == ETAG:
+            return httpx.Response(304, headers={"etag": ETAG})
+        rango = request.headers.get("range")
+        if rango and request.headers.get("if-range") == ETAG:
+            start = int(rango.split("=")[1].rstrip("-"))
+            return httpx.Response(206, content=BODY[start:], headers={
+                "etag": ETAG, "content-range": f"bytes {start}-{len(BODY) - 1}/{len(BODY)}"
+            })
+        if self.cortar_en is not None:
+            limite, self.cortar_en = self.cortar_en, None
+            return httpx.Response(200, stream=CortaStream(BODY, limite), headers={"etag": ETAG})
+        return httpx.Response(200, content=BODY, headers={"etag": ETAG})
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    servidor = Upstream()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(servidor))
+    monkeypatch.setattr(http_client, "get_client", lambda: client)
+    return servidor
+
+
+@pytest.mark.asyncio
+async def test_cached_body_is_reused_and_revalidated(tmp_path, upstream):
+    cache = DownloadCache(str(tmp_path), quota_bytes=10 * 1024 * 1024)
+    path = await cache.fetch(URL, version="abc")
+    with open(path, "rb") as f:
+        assert f.read() == BODY
+
+    # Con la misma versión del recurso no se consulta CKAN
+    assert await cache.fetch(URL, version="abc") == path
+    assert len(upstream.requests) == 1
+
+    # Sin versión se revalida con el ETag y un 304 reutiliza el archivo
+    assert await cache.fetch(URL) == path
+    assert upstream.requests[-1].headers["if-none-match"] == ETAG
+    assert cache.stats()["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_interrupted_download_resumes_with_range(tmp_path, upstream):
+    upstream.cortar_en = 20000
+    cache = DownloadCache(str(tmp_path), quota_bytes=10 * 1024 * 1024)
+    path = await cache.fetch(URL)
+    with open(path, "rb") as f:
+        assert f.read() == BODY
+    assert upstream.requests[-1].headers["range"] == "bytes=20000-"
+    assert cache.stats()["resumed"] == 1
+    assert os.listdir(tmp_path / "parts") == []
+
+
+@pytest.mark.asyncio
+async def test_same_content_is_stored_once_and_lru_evicted_under_quota(tmp_path, upstream, monkeypatch):
+    cache = DownloadCache(str(tmp_path), quota_bytes=int(len(BODY) * 1.5))
+    primero = await cache.fetch(URL)
+    # Mismo contenido en otra URL: apunta al mismo archivo
+    assert await cache.fetch(URL + "?copia=1") == primero
+    os.utime(primero, (0, 0))
+
+    otro = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=BODY[::-1])))
+    monkeypatch.setattr(http_client, "get_client", lambda: otro)
+    segundo = await cache.fetch(URL + "?otro=1")
+    assert os.path.exists(segundo)
+    assert not os.path.exists(primero)
+    assert cache.entry(URL) is None
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_mismatched_range_restarts_the_full_download(tmp_path, upstream, monkeypatch):
+    upstream.cortar_en = 20000
+    cache = DownloadCache(str(tmp_path), quota_bytes=10 * 1024 * 1024)
+    download = await cache.open(URL)
+    with pytest.raises(httpx.ReadError):
+        async for _ in download.chunks():
+            pass
+
+    # El servidor ignora el inicio pedido y responde otro rango
+    def rango_equivocado(request):
+        upstream.requests.append(request)
+        if request.headers.get("range"):
+            return httpx.Response(206, content=BODY[100:], headers={
+                "etag": ETAG, "content-range": f"bytes 100-{len(BODY) - 1}/{len(BODY)}"
+            })
+        return httpx.Response(200, content=BODY, headers={"etag": ETAG})
+
+    otro = httpx.AsyncClient(transport=httpx.MockTransport(rango_equivocado))
+    monkeypatch.setattr(http_client, "get_client", lambda: otro)
+    path = await cache.fetch(URL)
+    with open(path, "rb") as f:
+        assert f.read() == BODY
+    assert upstream.requests[-2].headers["range"] == "bytes=20000-"
+    assert "range" not in upstream.requests[-1].headers
+    assert cache.stats()["resumed"] == 0
+
+
+@pytest.mark.asyncio
+async def test_caller_size_limit_applies_to_cached_files(tmp_path, upstream):
+    cache = DownloadCache(str(tmp_path), quota_bytes=10 * 1024 * 1024)
+    with pytest.raises(DownloadTooLarge):
+        await cache.read(URL, version="abc", max_bytes=1000)
+    assert await cache.read(URL, version="abc") == BODY
+    # Ya guardado con el límite general, un llamador más estricto igual lo rechaza
+    with pytest.raises(DownloadTooLarge):
+        await cache.read(URL, version="abc", max_bytes=1000)
+
+
+@pytest.mark.asyncio
+async def test_resumable_downloads_ask_for_the_identity_encoding(tmp_path, monkeypatch):
+    comprimido = gzip.compress(BODY)
+    pedidos = []
+    cortar = [True]
+
+    def servidor(request):
+        # Sirve gzip si el cliente lo acepta; los rangos se cuentan sobre el cuerpo que envía
+        pedidos.append(request)
+        gz = "gzip" in request.headers.get("accept-encoding", "")
+        cuerpo = comprimido if gz else BODY
+        headers = {"etag": ETAG, **({"content-encoding": "gzip"} if gz else {})}
+        rango = request.headers.get("range")
+        if rango:
+            start = int(rango.split("=")[1].rstrip("-"))
+            headers["content-range"] = f"bytes {start}-{len(cuerpo) - 1}/{len(cuerpo)}"
+            return httpx.Response(206, content=cuerpo[start:], headers=headers)
+        if cortar:
+            cortar.clear()
+            return httpx.Response(200, stream=CortaStream(cuerpo, 20000), headers=headers)
+        return httpx.Response(200, content=cuerpo, headers=headers)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(servidor))
+    monkeypatch.setattr(http_client, "get_client", lambda: client)
+    cache = DownloadCache(str(tmp_path), quota_bytes=10 * 1024 * 1024)
+    path = await cache.fetch(URL)
+    with open(path, "rb") as f:
+        assert f.read() == BODY
+    assert all(r.headers["accept-encoding"] == "identity" for r in pedidos)
+    assert pedidos[-1].headers["range"] == "bytes=20000-"
+
+
+@pytest.mark.asyncio
+async def test_encoded_parts_are_not_resumed(tmp_path, monkeypatch):
+    comprimido = gzip.compress(BODY)
+    pedidos = []
+    cortar = [True]
+
+    def servidor(request):
+        # Ignora Accept-Encoding y siempre comprime
+        pedidos.append(request)
+        headers = {"etag": ETAG, "content-encoding": "gzip"}
+        if cortar:
+            cortar.clear()
+            return httpx.Response(200, stream=CortaStream(comprimido, len(comprimido) // 2), headers=headers)
+        return httpx.Response(200, content=comprimido, headers=headers)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(servidor))
+    monkeypatch.setattr(http_client, "get_client", lambda: client)
+    cache = DownloadCache(str(tmp_path), quota_bytes=10 * 1024 * 1024)
+    path = await cache.fetch(URL)
+    with open(path, "rb") as f:
+        assert f.read() == BODY
+    assert len(pedidos) == 2 and "range" not in pedidos[-1].headers
+    assert cache.stats()["resumed"] == 0
+
+
+@pytest.mark.asyncio
+async def test_object_evicted_before_the_hit_is_downloaded_again(tmp_path, upstream):
+    cache = DownloadCache(str(tmp_path), quota_bytes=10 * 1024 * 1024)
+    path = await cache.fetch(URL, version="abc")
+    entry = cache.entry(URL)
+    os.remove(path)
+    # Otro llamador ya había leído la entrada antes de que se borrara el archivo
+    assert cache._hit(URL, entry, "abc") is None
+    assert await cache.read(URL, version="abc") == BODY
+    assert len(upstream.requests) == 2
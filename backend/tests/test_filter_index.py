@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import filter_index
+from app.services.filter_index import ColumnIndex, CursorError, ResourceIndex, decode_cursor, encode_cursor, query_key
+from app.services.memory_manager import MemoryManager
+from app.services.typed_loader import compact
+
+
+def make_frame(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "barrio": rng.choice(["Centro", "San Fernando", "El Peñón", "Granada", None], n),
+        "codigo": [f"C-{i:05d}" for i in rng.integers(0, 3000, n)],
+        "estrato": rng.integers(1, 7, n),
+        "consumo": rng.gamma(2.0, 10.0, n).round(1),
+    })
+
+
+def scan(df, filter_dict):
+    # Filtrado original: recorre la columna completa por cada filtro
+    for col, val in filter_dict.items():
+        if col in df.columns:
+            if pd.api.types.is_numeric_dtype(df[col]):
+                try:
+                    df = df[df[col] == float(val)]
+                    continue
+                except (ValueError, TypeError):
+                    pass
+            df = df[df[col].astype(str).str.contains(str(val), case=False, na=False)]
+    return df
+
+
+@pytest.mark.parametrize("filter_dict", [
+    {"barrio": "peñ"},
+    {"barrio": "an", "estrato": "3"},
+    {"codigo": "c-00"},
+    {"codigo": "C-01", "barrio": "centro", "estrato": 2},
+    {"consumo": "20.5"},
+    {"estrato": "no-numerico"},
+    {"barrio": "no existe"},
+    {"columna_inexistente": "x"},
+])
+@pytest.mark.parametrize("compacted", [False, True])
+def test_index_matches_full_scan(filter_dict, compacted):
+    df = make_frame()
+    if compacted:
+        df = compact(df)
+    index = ResourceIndex()
+    positions = index.positions(df, filter_dict)
+    result = df if positions is None else df.iloc[positions]
+    pd.testing.assert_frame_equal(result, scan(df, filter_dict))
+    # La segunda consulta sale de la caché de resultados y debe coincidir
+    again = index.positions(df, filter_dict)
+    assert positions is None or np.array_equal(positions, again)
+
+
+@pytest.mark.parametrize("text", ["nan", "none", "a"])
+def test_nulls_match_as_their_astype_str_text(text):
+    # El texto de los nulos depende de la versión de pandas: el índice sigue a astype(str)
+    df = pd.DataFrame({
+        "texto": pd.Series(["Cali", None, np.nan, "Palmira"], dtype=object),
+        "numero": [1.0, np.nan, 3.0, np.nan],
+    })
+    for col in df.columns:
+        positions = ResourceIndex().positions(df, {col: text})
+        pd.testing.assert_frame_equal(df.iloc[positions], scan(df, {col: text}))
+    # Un nulo nunca es igual a un número
+    assert ResourceIndex().positions(df, {"numero": "nan"}).tolist() == scan(df, {"numero": "nan"}).index.tolist() == []
+
+
+def test_nulls_converted_to_text_are_matched_by_contains():
+    # pandas 2 convierte los nulos de object a "None"/"nan" con astype(str); pandas 3 los conserva
+    index = ColumnIndex(pd.Series(["Cali", None, np.nan, "Nariño"], dtype=object))
+    index.null_labels = pd.Series(["None", "nan"])
+    assert index.contains("none").tolist() == [1]
+    assert index.contains("n").tolist() == [1, 2, 3]
+    assert index.equals(float("nan")).tolist() == []
+
+
+@pytest.mark.parametrize("sort_by", ["barrio", "consumo", "codigo"])
+@pytest.mark.parametrize("ascending", [True, False])
+def test_select_matches_sort_values(sort_by, ascending):
+    df = compact(make_frame())
+    filter_dict = {"estrato": "3"}
+    index = ResourceIndex()
+    result = df.iloc[index.select(df, filter_dict, sort_by, ascending)]
+    expected = scan(df, filter_dict).sort_values(by=sort_by, ascending=ascending, kind="stable")
+    assert result[sort_by].astype(object).tolist() == expected[sort_by].astype(object).tolist()
+    # La permutación de la columna se reutiliza con otros filtros
+    index.select(df, {"estrato": "4"}, sort_by, ascending)
+    assert list(index._orders) == [(sort_by, ascending)]
+
+
+def paginar(index, df, filter_dict, sort_by, ascending, page_size=7):
+    """Recorre todas las páginas siguiendo los cursores, como un cliente"""
+    key = query_key(filter_dict, sort_by, ascending)
+    positions = index.select(df, filter_dict, sort_by, ascending)
+    filas, start = [], 0
+    while start < len(positions):
+        pagina = positions[start:start + page_size]
+        filas.extend(pagina.tolist())
+        cursor = encode_cursor(df, key, sort_by, pagina[-1])
+        start = index.seek(df, positions, sort_by, ascending, *decode_cursor(cursor, key))
+    return filas
+
+
+@pytest.mark.parametrize("sort_by", ["barrio", "consumo", "codigo", None])
+@pytest.mark.parametrize("ascending", [True, False])
+@pytest.mark.parametrize("compacted", [False, True])
+def test_keyset_cursor_walks_every_row_once(sort_by, ascending, compacted):
+    df = make_frame(n=400)
+    if compacted:
+        df = compact(df)
+    index = ResourceIndex()
+    expected = index.select(df, {"estrato": "3"}, sort_by, ascending).tolist()
+    assert paginar(index, df, {"estrato": "3"}, sort_by, ascending) == expected
+
+
+def test_keyset_cursor_seeks_by_value_in_a_new_version():
+    df = pd.DataFrame({"consumo": [5.0, 1.0, 3.0, 2.0, 4.0]})
+    key = query_key({}, "consumo", True)
+    index = ResourceIndex()
+    positions = index.select(df, {}, "consumo", True)
+    cursor = encode_cursor(df, key, "consumo", positions[1])  # última fila entregada: consumo 2.0
+    # En la versión nueva hay filas antes del cursor y el 2.0 ya no existe: se sigue desde 3.0
+    nuevo = pd.DataFrame({"consumo": [0.5, 5.0, 1.5, 3.0, 4.0, 0.1]})
+    nuevo_index = ResourceIndex()
+    nuevas = nuevo_index.select(nuevo, {}, "consumo", True)
+    start = nuevo_index.seek(nuevo, nuevas, "consumo", True, *decode_cursor(cursor, key))
+    assert nuevo["consumo"].iloc[nuevas[start:]].tolist() == [3.0, 4.0, 5.0]
+    descendente = nuevo_index.select(nuevo, {}, "consumo", False)
+    start = nuevo_index.seek(nuevo, descendente, "consumo", False, 2.0, 0)
+    assert nuevo["consumo"].iloc[descendente[start:]].tolist() == [1.5, 0.5, 0.1]
+
+
+def test_cursor_rejects_other_queries_and_foreign_values():
+    df = make_frame()
+    index = ResourceIndex()
+    positions = index.select(df, {"barrio": "centro"}, "consumo", False)
+    key = query_key({"barrio": "centro"}, "consumo", False)
+    cursor = encode_cursor(df, key, "consumo", positions[19])
+    assert index.seek(df, positions, "consumo", False, *decode_cursor(cursor, key)) == 20
+    with pytest.raises(CursorError):
+        decode_cursor(cursor, query_key({}, "consumo", False))
+    with pytest.raises(CursorError):
+        decode_cursor("no-es-un-cursor", key)
+    with pytest.raises(CursorError):
+        index.seek(df, positions, "consumo", False, "no-numerico", 0)
+
+
+def test_index_is_measured_again_only_when_it_grows(monkeypatch):
+    memory = MemoryManager(budget_bytes=1 << 30)
+    monkeypatch.setattr(filter_index, "manager", memory)
+    medidas = []
+    resize = memory.resize
+    monkeypatch.setattr(memory, "resize", lambda key: (medidas.append(key), resize(key)))
+    df = make_frame()
+
+    positions, start = filter_index.select("r1", "v1", df, {"barrio": "centro"}, "consumo", True)
+    assert start == 0 and len(medidas) == 1
+    assert memory.size_of(("index", "r1", "v1")) == filter_index.get_index("r1", "v1").nbytes
+    # Las páginas siguientes de la misma consulta salen de la caché y no vuelven a medir
+    for _ in range(3):
+        positions, start = filter_index.select("r1", "v1", df, {"barrio": "centro"}, "consumo", True)
+    assert start == 0 and len(medidas) == 1
+    filter_index.select("r1", "v1", df, {"estrato": "2"}, None, True)
+    assert len(medidas) == 2
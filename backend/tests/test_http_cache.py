@@ -0,0 +1,109 @@
+import inspect
+
+import slowapi.extension
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.testclient import TestClient
+from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from slowapi.util import get_remote_address
+
+from app.http_cache import cached_route, no_cache
+
+VERSION = {"agua": "v1"}
+LLAMADAS = []
+
+
+async def version(request: Request):
+    return "agua-test", VERSION["agua"]
+
+
+router = APIRouter(route_class=cached_route(version))
+limiter = Limiter(key_func=get_remote_address)
+
+
+@router.get("/summary")
+def summary(zonas: str = ""):
+    LLAMADAS.append(zonas)
+    return {"zonas": zonas, "version": VERSION["agua"]}
+
+
+@router.get("/kpis")
+@limiter.limit("3/minute")
+def kpis(request: Request):
+    LLAMADAS.append("kpis")
+    return {"version": VERSION["agua"]}
+
+
+@router.get("/datasets")
+@no_cache
+def datasets():
+    LLAMADAS.append("datasets")
+    return {"datasets": []}
+
+
+app = FastAPI()
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app.include_router(router)
+client = TestClient(app)
+
+
+def test_repeated_queries_are_served_from_cache_with_etag():
+    LLAMADAS.clear()
+    first = client.get("/summary?zonas=Norte&x=1")
+    assert first.status_code == 200
+    assert first.headers["x-cache"] == "MISS"
+    assert first.headers["cache-control"].startswith("public, max-age=")
+    etag = first.headers["etag"]
+
+    # Los mismos parámetros en otro orden son la misma consulta
+    second = client.get("/summary?x=1&zonas=Norte")
+    assert second.headers["x-cache"] == "HIT"
+    assert second.headers["etag"] == etag
+    assert second.json() == first.json()
+
+    not_modified = client.get("/summary?zonas=Norte&x=1", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert LLAMADAS == ["Norte"]
+
+
+def test_new_dataset_version_invalidates_cached_responses():
+    LLAMADAS.clear()
+    etag = client.get("/summary?zonas=Sur").headers["etag"]
+    VERSION["agua"] = "v2"
+    try:
+        response = client.get("/summary?zonas=Sur", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["version"] == "v2"
+        assert response.headers["etag"] != etag
+        assert LLAMADAS == ["Sur", "Sur"]
+    finally:
+        VERSION["agua"] = "v1"
+
+
+def test_excluded_endpoints_are_not_cached():
+    LLAMADAS.clear()
+    client.get("/datasets")
+    response = client.get("/datasets")
+    assert "etag" not in response.headers
+    assert LLAMADAS == ["datasets", "datasets"]
+
+
+def test_cache_hits_still_count_against_the_rate_limit():
+    LLAMADAS.clear()
+    first = client.get("/kpis")
+    assert first.headers["x-cache"] == "MISS"
+    assert client.get("/kpis").headers["x-cache"] == "HIT"
+    assert client.get("/kpis", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+    # El MISS contó una sola vez aunque también pasó por el decorador del endpoint
+    assert client.get("/kpis").status_code == 429
+    assert LLAMADAS == ["kpis"]
+
+
+def test_slowapi_private_api_used_by_the_cache_is_still_there():
+    # http_cache aplica el límite con la API privada de slowapi (fijada en requirements.txt):
+    # si una versión nueva la cambia, este test lo avisa antes que los 429 perdidos
+    params = list(inspect.signature(Limiter._check_request_limit).parameters)
+    assert params == ["self", "request", "endpoint_func", "in_middleware"]
+    assert "_rate_limiting_complete" in inspect.getsource(slowapi.extension)
@@ -0,0 +1,116 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import http_client
+
+URL = "https://datos.cali.gov.co/r/consumo.csv"
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Instala un handler de httpx.MockTransport como servidor de CKAN"""
+    monkeypatch.setattr(http_client, "_host_limits", {})
+
+    def instalar(handler):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(http_client, "get_client", lambda: client)
+        return client
+
+    return instalar
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    """Registra los backoff de los reintentos sin esperarlos"""
+    registradas = []
+    sleep = asyncio.sleep
+
+    async def sin_esperar(delay, *args, **kwargs):
+        registradas.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", sin_esperar)
+    return registradas
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_respect_the_per_host_limit(upstream, monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_MAX_CONNECTIONS_PER_HOST", 2)
+    en_curso = {"ahora": 0, "maximo": 0}
+
+    async def servidor(request):
+        en_curso["ahora"] += 1
+        en_curso["maximo"] = max(en_curso["maximo"], en_curso["ahora"])
+        await asyncio.sleep(0.01)
+        en_curso["ahora"] -= 1
+        return httpx.Response(200, text="ok")
+
+    upstream(servidor)
+    respuestas = await asyncio.gather(*[http_client.get(URL) for _ in range(6)])
+    assert all(r.status_code == 200 for r in respuestas)
+    assert en_curso["maximo"] == 2
+
+
+@pytest.mark.asyncio
+async def test_5xx_and_timeouts_are_retried_with_backoff(upstream, esperas, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_RETRIES", 3)
+    respuestas = [httpx.ReadTimeout("lento"), httpx.Response(503), httpx.Response(502), httpx.Response(200, text="ok")]
+
+    def servidor(request):
+        respuesta = respuestas.pop(0)
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        return respuesta
+
+    upstream(servidor)
+    response = await http_client.get(URL)
+    assert response.status_code == 200
+    assert esperas == [0.5, 1.0, 2.0]
+
+    # Un 4xx no se reintenta y al agotar los intentos se devuelve el último 5xx
+    respuestas[:] = [httpx.Response(404)]
+    assert (await http_client.get(URL)).status_code == 404
+    respuestas[:] = [httpx.Response(500)] * 4
+    assert (await http_client.get(URL)).status_code == 500
+    assert respuestas == []
+
+
+@pytest.mark.asyncio
+async def test_open_stream_holds_the_host_permit_until_closed(upstream, monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_MAX_CONNECTIONS_PER_HOST", 1)
+
+    class Cuerpo(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            for _ in range(10):
+                yield b"x" * 100
+
+    upstream(lambda request: httpx.Response(200, stream=Cuerpo()))
+
+    primera = await http_client.open_stream(URL)
+    segunda = asyncio.ensure_future(http_client.open_stream(URL))
+    await asyncio.sleep(0.05)
+    # Mientras se lee el cuerpo de la primera, la segunda espera su turno
+    assert not segunda.done()
+
+    assert b"".join([chunk async for chunk in primera.aiter_bytes()]) == b"x" * 1000
+    respuesta = await asyncio.wait_for(segunda, timeout=1)
+    await respuesta.aclose()
+    await respuesta.aclose()
+    assert not http_client._host_limit(URL).locked()
+
+
+def test_one_client_per_event_loop(monkeypatch):
+    monkeypatch.setattr(http_client, "_client", None)
+
+    async def clientes():
+        primero, segundo = http_client.get_client(), http_client.get_client()
+        await http_client.aclose()
+        return primero, segundo
+
+    a1, a2 = asyncio.run(clientes())
+    b1, _ = asyncio.run(clientes())
+    assert a1 is a2
+    assert b1 is not a1
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.kpi_engine import KPIState
+
+
+def make_frame(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "consumo": np.where(rng.random(n) < 0.1, np.nan, rng.gamma(2.0, 10.0, n)),
+        "estrato": rng.integers(1, 7, n).astype("int8"),
+        "barrio": rng.choice(["Centro", "Granada"], n),
+        "vacia": np.nan,
+    })
+
+
+def test_kpis_match_pandas():
+    df = make_frame()
+    kpis = {k["column"]: k for k in KPIState.from_frame(df).to_kpis()}
+    assert set(kpis) == {"consumo", "estrato", "vacia"}
+    for col in ["consumo", "estrato"]:
+        serie = df[col]
+        kpi = kpis[col]
+        assert kpi["count"] == serie.count()
+        assert kpi["nulls"] == serie.isna().sum()
+        assert kpi["mean"] == pytest.approx(serie.mean())
+        assert kpi["std"] == pytest.approx(serie.std())
+        assert kpi["sum"] == pytest.approx(serie.sum())
+        assert kpi["min"] == serie.min()
+        assert kpi["max"] == serie.max()
+        for p in (50, 90, 99):
+            assert kpi[f"p{p}"] == pytest.approx(serie.quantile(p / 100))
+    assert kpis["vacia"]["count"] == 0
+    assert kpis["vacia"]["mean"] is None
+
+
+def test_merged_states_match_full_frame():
+    df = make_frame(20000)
+    partes = [df.iloc[i:i + 3000] for i in range(0, len(df), 3000)]
+    state = KPIState.from_frame(partes[0])
+    for parte in partes[1:]:
+        state = state.merge(KPIState.from_frame(parte))
+    merged = {k["column"]: k for k in state.to_kpis()}
+    full = {k["column"]: k for k in KPIState.from_frame(df).to_kpis()}
+    for col in ["consumo", "estrato"]:
+        for stat in ["count", "nulls", "min", "max"]:
+            assert merged[col][stat] == full[col][stat]
+        for stat in ["mean", "std", "sum"]:
+            assert merged[col][stat] == pytest.approx(full[col][stat])
+        # Los percentiles combinados se estiman con el resumen de cuantiles
+        rango = full[col]["max"] - full[col]["min"]
+        for p in (50, 90, 99):
+            assert abs(merged[col][f"p{p}"] - full[col][f"p{p}"]) <= 0.01 * rango
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from app.services.memory_manager import MemoryManager, sizeof
+
+
+def test_sizeof_counts_text_content():
+    df = pd.DataFrame({"barrio": pd.Series(["San Fernando" * 10] * 100, dtype=object), "consumo": np.arange(100.0)})
+    shallow = int(df.memory_usage(index=True).sum())
+    assert sizeof(df) > shallow
+    assert sizeof(np.zeros(10)) == 80
+
+
+def test_lru_eviction_within_budget():
+    memory = MemoryManager(budget_bytes=250)
+    memory.put(("frame", "a", "v1"), np.zeros(10))
+    memory.put(("frame", "b", "v1"), np.zeros(10))
+    assert memory.get(("frame", "a", "v1")) is not None  # "a" pasa a ser la más reciente
+    memory.put(("frame", "c", "v1"), np.zeros(10))
+    assert memory.used_bytes == 240
+
+    memory.put(("frame", "d", "v1"), np.zeros(10))
+    assert memory.get(("frame", "b", "v1")) is None
+    assert memory.get(("frame", "a", "v1")) is not None
+    stats = memory.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2 and stats["misses"] == 1
+
+    # Lo que no cabe en todo el presupuesto no se guarda ni desplaza a nadie
+    memory.put(("frame", "e", "v1"), np.zeros(100))
+    assert memory.get(("frame", "e", "v1")) is None
+    assert memory.stats()["rejected"] == 1
+    assert memory.used_bytes == 240
+
+
+def test_pinned_entries_survive_until_released():
+    memory = MemoryManager(budget_bytes=200)
+    key = ("frame", "a", "v1")
+    memory.put(key, np.zeros(10))
+    assert memory.acquire(key) is not None
+    memory.put(("frame", "b", "v1"), np.zeros(10))
+    memory.put(("frame", "c", "v1"), np.zeros(10))
+    assert memory.get(key) is not None
+    assert memory.get(("frame", "b", "v1")) is None
+    assert memory.stats()["pinned"] == 1
+
+    memory.unpin(key)
+    memory.put(("frame", "d", "v1"), np.zeros(10))
+    memory.put(("frame", "e", "v1"), np.zeros(10))
+    assert memory.get(key) is None
+    assert memory.stats()["pinned"] == 0
+
+
+def test_discard_stale_versions_and_resize():
+    memory = MemoryManager(budget_bytes=10_000)
+    memory.put(("frame", "a", "v1"), np.zeros(10))
+    memory.put(("kpis", "a", "v1"), np.zeros(10))
+    memory.put(("frame", "b", "v1"), np.zeros(10))
+    assert memory.discard_stale("a", "v2") == 2
+    assert memory.used_bytes == 80
+
+    crece = {"valores": np.zeros(0)}
+
+    class Indice:
+        @property
+        def nbytes(self):
+            return crece["valores"].nbytes
+
+    memory.put(("index", "b", "v1"), Indice())
+    crece["valores"] = np.zeros(50)
+    memory.resize(("index", "b", "v1"))
+    assert memory.used_bytes == 480
+
+
+def test_discard_keeps_pinned_entries_until_released():
+    memory = MemoryManager(budget_bytes=10_000)
+    key = ("frame", "a", "v1")
+    memory.put(key, np.zeros(10))
+    memory.put(("kpis", "a", "v1"), np.zeros(10))
+    assert memory.acquire(key) is not None
+    # Una versión nueva descarta lo anterior, pero el frame sigue en uso por otra solicitud
+    assert memory.discard_stale("a", "v2") == 2
+    assert memory.get(key) is not None
+    assert memory.used_bytes == 80
+    assert memory.discard_stale("a", "v2") == 0
+
+    memory.unpin(key)
+    assert memory.get(key) is None
+    assert memory.used_bytes == 0
+    assert memory.stats()["pinned"] == 0
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import ckan_client, http_client, metadata_cache
+from app.services.metadata_cache import MetadataCache
+
+
+def nueva_cache(tmp_path, **kwargs):
+    opciones = {"ttl": 60, "stale_seconds": 3600, "negative_ttl": 30, **kwargs}
+    return MetadataCache(str(tmp_path / "metadata.sqlite3"), **opciones)
+
+
+class Ckan:
+    def __init__(self, valor):
+        self.valor = valor
+        self.llamadas = 0
+
+    async def __call__(self):
+        self.llamadas += 1
+        await asyncio.sleep(0.01)
+        if isinstance(self.valor, Exception):
+            raise self.valor
+        return self.valor
+
+
+@pytest.mark.asyncio
+async def test_fresh_entries_are_shared_across_instances_without_ckan(tmp_path):
+    ckan = Ckan({"id": "abc", "last_modified": "2024-01-01"})
+    cache = nueva_cache(tmp_path)
+    resultados = await asyncio.gather(*[cache.get("resource_show", "abc", ckan) for _ in range(5)])
+    assert all(r == ckan.valor for r in resultados)
+    assert ckan.llamadas == 1
+
+    # Otro worker (o un reinicio) lee la misma base SQLite
+    otra = nueva_cache(tmp_path)
+    assert await otra.get("resource_show", "abc", ckan) == ckan.valor
+    assert ckan.llamadas == 1
+    assert otra.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entries_are_served_while_revalidating(tmp_path):
+    ckan = Ckan(["v1"])
+    cache = nueva_cache(tmp_path, ttl=0.05)
+    await cache.get("package_search", "agua", ckan)
+    time.sleep(0.06)
+
+    ckan.valor = ["v2"]
+    assert await cache.get("package_search", "agua", ckan) == ["v1"]
+    await asyncio.sleep(0.05)
+    assert ckan.llamadas == 2
+    assert await cache.get("package_search", "agua", ckan) == ["v2"]
+    assert cache.stats()["stale"] == 1
+
+
+@pytest.mark.asyncio
+async def test_not_found_is_cached_and_ckan_errors_fall_back_to_old_copy(tmp_path):
+    cache = nueva_cache(tmp_path, ttl=0, stale_seconds=0)
+    inexistente = Ckan(None)
+    assert await cache.get("resource_show", "no-existe", inexistente) is None
+    assert await cache.get("resource_show", "no-existe", inexistente) is None
+    assert inexistente.llamadas == 1
+    assert cache.stats()["negative"] == 1
+
+    ckan = Ckan({"id": "abc"})
+    await cache.get("resource_show", "abc", ckan)
+    ckan.valor = ConnectionError("CKAN no responde")
+    assert await cache.get("resource_show", "abc", ckan) == {"id": "abc"}
+    assert cache.stats()["errors"] == 1
+
+    with pytest.raises(ConnectionError):
+        await cache.get("resource_show", "otro", ckan)
+
+
+@pytest.mark.asyncio
+async def test_only_ckan_not_found_is_cached_as_missing(tmp_path, monkeypatch):
+    respuestas = {
+        "no-existe": httpx.Response(404, json={
+            "success": False, "error": {"__type": "Not Found Error", "message": "Not found: Resource was not found."}
+        }),
+        "privado": httpx.Response(403, json={
+            "success": False, "error": {"__type": "Authorization Error", "message": "Access denied"}
+        }),
+        "caido": httpx.Response(502, text="Bad Gateway"),
+    }
+    llamadas = []
+
+    def ckan(request):
+        llamadas.append(request.url.params["id"])
+        return respuestas[request.url.params["id"]]
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(ckan))
+    monkeypatch.setattr(http_client, "get_client", lambda: client)
+    monkeypatch.setattr(settings, "MAX_RETRIES", 0)
+    monkeypatch.setattr(metadata_cache, "cache", nueva_cache(tmp_path))
+
+    for _ in range(2):
+        with pytest.raises(ckan_client.ResourceNotFound):
+            await ckan_client.get_resource("no-existe")
+        with pytest.raises(ckan_client.CkanError, match="Access denied"):
+            await ckan_client.get_resource("privado")
+        with pytest.raises(ckan_client.CkanError, match="HTTP 502"):
+            await ckan_client.get_resource("caido")
+    # Solo el "no encontrado" se recuerda; los demás errores se vuelven a consultar
+    assert llamadas == ["no-existe", "privado", "caido", "privado", "caido"]
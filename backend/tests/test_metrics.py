@@ -0,0 +1,68 @@
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.testclient import TestClient
+
+from app.services import compute, metrics
+
+
+def nueva_app():
+    app = FastAPI(default_response_class=metrics.TimedJSONResponse)
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @metrics.timed("parse")
+    def parsear():
+        metrics.count("parsed_rows", 10)
+        return list(range(10))
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        with metrics.span("download"):
+            metrics.count("downloaded_bytes", 100)
+        # El contexto de la solicitud viaja a los hilos del pool
+        filas = await run_in_threadpool(parsear)
+        return {"id": item_id, "filas": len(filas)}
+
+    @app.get("/pool")
+    async def en_pool():
+        # Igual con el pool de cómputo: los spans del hilo llegan a Server-Timing
+        filas = await compute.run(parsear)
+        return {"filas": len(filas)}
+
+    return app
+
+
+def test_server_timing_reports_each_stage():
+    client = TestClient(nueva_app())
+    r = client.get("/items/abc")
+    assert r.status_code == 200
+    timing = r.headers["server-timing"]
+    etapas = [parte.split(";")[0] for parte in timing.split(", ")]
+    assert etapas[:2] == ["download", "parse"]
+    assert "serialize" in etapas and "total" in etapas
+
+
+def test_spans_inside_compute_pool_reach_server_timing():
+    client = TestClient(nueva_app())
+    antes = metrics.parsed_rows._values.get((), 0)
+    r = client.get("/pool")
+    assert r.status_code == 200
+    etapas = [parte.split(";")[0] for parte in r.headers["server-timing"].split(", ")]
+    assert "parse" in etapas
+    assert metrics.parsed_rows._values[()] == antes + 10
+
+
+def test_render_uses_prometheus_format_with_route_templates():
+    client = TestClient(nueva_app())
+    antes = metrics.parsed_rows._values.get((), 0)
+    client.get("/items/uno")
+    client.get("/items/dos")
+    assert metrics.parsed_rows._values[()] == antes + 20
+
+    texto = metrics.render([("monita_prueba", "gauge", "Valor de prueba", {(("cache", "memoria"),): 0.5})])
+    assert "# TYPE monita_request_duration_seconds histogram" in texto
+    assert 'route="/items/{item_id}"' in texto
+    assert 'route="/items/uno"' not in texto
+    assert 'monita_stage_duration_seconds_bucket{stage="parse",le="+Inf"}' in texto
+    assert "# TYPE monita_parsed_rows_total counter" in texto
+    assert 'monita_prueba{cache="memoria"} 0.5' in texto
+    assert texto.endswith("\n")
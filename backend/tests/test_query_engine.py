@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import snapshot_store
+from app.services.query_engine import QueryError, build_sql, run_query
+
+pytest.importorskip("duckdb")
+
+FRAME = pd.DataFrame({
+    "comuna": ["1", "1", "2", "Sur", None],
+    "barrio": ["Centro", "El Peñón", "Granada", "Centro", "100%_real"],
+    "consumo": [10.0, 20.0, 5.0, 7.5, 1.0],
+})
+COLUMNS = FRAME.columns.tolist()
+
+
+def test_values_are_sent_as_parameters():
+    spec = {"where": [{"column": "barrio", "op": "=", "value": "x' OR '1'='1"}]}
+    sql, params, _ = build_sql(spec, COLUMNS, 100)
+    assert "OR" not in sql
+    assert params == ["x' OR '1'='1"]
+
+
+def test_unknown_columns_are_rejected():
+    with pytest.raises(QueryError):
+        build_sql({"select": ["consumo; DROP TABLE recurso"]}, COLUMNS, 100)
+    with pytest.raises(QueryError):
+        build_sql({"order_by": [{"column": "total", "direction": "asc"}]}, COLUMNS, 100)
+
+
+def test_group_by_aggregates_match_pandas():
+    spec = {
+        "where": [{"column": "consumo", "op": ">", "value": 2}],
+        "group_by": ["comuna"],
+        "aggregates": [{"fn": "sum", "column": "consumo", "alias": "total"}, {"fn": "count"}],
+        "order_by": [{"column": "total", "direction": "desc"}],
+    }
+    result, truncated = run_query(FRAME, spec, COLUMNS)
+    assert not truncated
+    assert result["comuna"].tolist() == ["1", "Sur", "2"]
+    assert result["total"].tolist() == [30.0, 7.5, 5.0]
+    assert result["count"].tolist() == [2, 1, 1]
+
+
+def test_contains_escapes_wildcards_and_limit_truncates():
+    result, _ = run_query(FRAME, {"where": [{"column": "barrio", "op": "contains", "value": "%_"}]}, COLUMNS)
+    assert result["barrio"].tolist() == ["100%_real"]
+    result, truncated = run_query(FRAME, {"select": ["barrio"], "limit": 2}, COLUMNS)
+    assert len(result) == 2 and truncated
+
+
+def test_snapshot_nan_floats_are_treated_as_null():
+    pytest.importorskip("pyarrow")
+    frame = pd.DataFrame({"comuna": ["1", "1", "2"], "v": [1.0, np.nan, 3.0]})
+    columns = frame.columns.tolist()
+    # El snapshot guarda los NaN como valores: la consulta debe dar lo mismo que sobre el DataFrame
+    for source in (frame, snapshot_store._to_table(frame)):
+        spec = {"aggregates": [{"fn": "sum", "column": "v", "alias": "total"}, {"fn": "avg", "column": "v", "alias": "media"}]}
+        result, _ = run_query(source, spec, columns)
+        assert result[["total", "media"]].iloc[0].tolist() == [4.0, 2.0]
+        result, _ = run_query(source, {"where": [{"column": "v", "op": "is_null"}]}, columns)
+        assert len(result) == 1
+        result, _ = run_query(source, {"group_by": ["comuna"], "aggregates": [{"fn": "sum", "column": "v", "alias": "t"}],
+                                       "order_by": [{"column": "comuna"}]}, columns)
+        assert result["t"].tolist() == [1.0, 3.0]
@@ -0,0 +1,108 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app, limiter
+from app.services import ckan_client, download_cache
+
+rng = np.random.default_rng(7)
+N = 300
+consumo = rng.gamma(2.0, 10.0, N).round(2)
+consumo[rng.random(N) < 0.1] = np.nan
+FRAME = pd.DataFrame({
+    "comuna": rng.choice(["Norte", "Sur", "Oeste"], N),
+    "consumo": consumo,
+    "usuarios": rng.integers(1, 50, N),
+})
+CSV = FRAME.to_csv(index=False).encode()
+
+
+@pytest.fixture
+def recurso(tmp_path, monkeypatch, request):
+    """Recurso CSV servido por un CKAN falso; el id es único por test para no compartir cachés"""
+    resource_id = f"router-{request.node.name}"
+    monkeypatch.setattr(settings, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(limiter, "enabled", False)
+
+    async def get_resource(rid, refresh=False):
+        if rid != resource_id:
+            raise ckan_client.ResourceNotFound(rid)
+        return {"id": rid, "url": f"https://datos.cali.gov.co/r/{rid}.csv", "format": "CSV", "last_modified": "2024-01-01"}
+
+    async def download(url, version=None, max_bytes=None):
+        return CSV
+
+    monkeypatch.setattr(ckan_client, "get_resource", get_resource)
+    monkeypatch.setattr(download_cache, "download", download)
+    return TestClient(app), resource_id
+
+
+def test_query_aggregates_skip_missing_floats_from_frame_and_snapshot(recurso, tmp_path):
+    client, resource_id = recurso
+    spec = {
+        "group_by": ["comuna"],
+        "aggregates": [{"fn": "sum", "column": "consumo", "alias": "t"}, {"fn": "avg", "column": "consumo", "alias": "m"}],
+        "order_by": [{"column": "comuna"}],
+    }
+    esperado = FRAME.groupby("comuna")["consumo"].agg(["sum", "mean"]).sort_index()
+    # La primera consulta usa el DataFrame (y publica el snapshot); la segunda, la tabla Arrow del snapshot
+    for _ in range(2):
+        r = client.post(f"/resources/{resource_id}/query", json=spec)
+        assert r.status_code == 200
+        rows = r.json()["rows"]
+        assert [row["comuna"] for row in rows] == esperado.index.tolist()
+        assert [row["t"] for row in rows] == pytest.approx(esperado["sum"].tolist())
+        assert [row["m"] for row in rows] == pytest.approx(esperado["mean"].tolist())
+        assert any(name.endswith(".arrow") for name in os.listdir(tmp_path))
+
+    nulos = {"where": [{"column": "consumo", "op": "is_null"}], "aggregates": [{"fn": "count", "alias": "n"}]}
+    r = client.post(f"/resources/{resource_id}/query", json=nulos)
+    assert r.json()["rows"] == [{"n": int(FRAME["consumo"].isna().sum())}]
+
+
+def test_filter_sort_and_cursor_round_trip(recurso):
+    client, resource_id = recurso
+    url = f"/resources/{resource_id}/filter"
+    params = {"filters": '{"comuna": "Sur"}', "sort_by": "consumo", "sort_order": "desc", "page_size": 7}
+    primera = client.get(url, params=params).json()
+    valores, pagina = [], primera
+    while True:
+        valores.extend(row["consumo"] for row in pagina["rows"])
+        if pagina["next_cursor"] is None:
+            break
+        pagina = client.get(url, params={**params, "cursor": pagina["next_cursor"]}).json()
+
+    sur = FRAME[FRAME["comuna"] == "Sur"].sort_values("consumo", ascending=False, kind="stable")
+    assert primera["total"] == len(sur)
+    assert valores == sur["consumo"].astype(object).where(sur["consumo"].notna(), None).tolist()
+    # Un cursor de otra consulta se rechaza
+    otro = client.get(url, params={**params, "sort_order": "asc", "cursor": primera["next_cursor"]})
+    assert otro.status_code == 400
+
+
+def test_kpis_and_chart_over_the_resource(recurso):
+    client, resource_id = recurso
+    r = client.get(f"/resources/{resource_id}/kpis")
+    assert r.status_code == 200
+    kpis = {kpi["column"]: kpi for kpi in r.json()["kpis"]}
+    assert kpis["consumo"]["nulls"] == int(FRAME["consumo"].isna().sum())
+    assert kpis["consumo"]["sum"] == pytest.approx(FRAME["consumo"].sum())
+    assert kpis["consumo"]["mean"] == pytest.approx(FRAME["consumo"].mean())
+
+    r = client.get(f"/resources/{resource_id}/chart", params={"column": "comuna", "chart_type": "bar"})
+    assert r.status_code == 200
+    puntos = {point["label"]: point["value"] for point in r.json()["data"]}
+    assert puntos == FRAME["comuna"].value_counts().astype(float).to_dict()
+
+
+def test_unknown_columns_and_resources(recurso):
+    client, resource_id = recurso
+    r = client.get(f"/resources/{resource_id}/chart", params={"column": "no_existe", "chart_type": "bar"})
+    assert r.status_code == 404
+    r = client.post(f"/resources/{resource_id}/query", json={"select": ["no_existe"]})
+    assert r.status_code == 400
+    assert client.get("/resources/otro-recurso/kpis").status_code == 404
@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import responses
+from app.responses import ColumnarResponse
+from app.services import metrics
+
+
+def frame():
+    return pd.DataFrame({
+        "zona": pd.Categorical(["Norte", None, "Sur"]),
+        "consumo": [1.5, np.nan, 3.0],
+        "usuarios": np.array([1, 2, 3], dtype="int16"),
+        "fecha": pd.to_datetime(["2024-01-05", None, "2024-03-01"]),
+    })
+
+
+ESPERADO = {
+    "columns": ["zona", "consumo", "usuarios", "fecha"],
+    "data": {
+        "zona": ["Norte", None, "Sur"],
+        "consumo": [1.5, None, 3.0],
+        "usuarios": [1, 2, 3],
+        "fecha": ["2024-01-05", None, "2024-03-01"],
+    },
+    "total": 3,
+}
+
+
+@pytest.mark.parametrize("con_orjson", [True, False])
+def test_columnar_response_shape_and_nulls(con_orjson, monkeypatch):
+    if not con_orjson:
+        # Sin orjson instalado se usa json de la librería estándar
+        monkeypatch.setattr(responses, "orjson", None)
+    elif responses.orjson is None:
+        pytest.skip("orjson no está instalado")
+    response = ColumnarResponse(frame(), extra={"total": 3})
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == ESPERADO
+    assert b"NaN" not in response.body and b"NaT" not in response.body
+
+
+def test_numeric_columns_are_serialized_from_numpy_arrays():
+    content = responses.columnar_content(frame())
+    assert isinstance(content["data"]["consumo"], np.ndarray)
+    assert isinstance(content["data"]["usuarios"], np.ndarray)
+    assert isinstance(content["data"]["zona"], list)
+
+
+@pytest.mark.parametrize("con_orjson", [True, False])
+def test_infinite_values_are_serialized_as_null(con_orjson, monkeypatch):
+    if not con_orjson:
+        monkeypatch.setattr(responses, "orjson", None)
+    elif responses.orjson is None:
+        pytest.skip("orjson no está instalado")
+    df = pd.DataFrame({"ratio": [1.0, np.inf, -np.inf], "texto": ["a", float("inf"), None]})
+    response = ColumnarResponse(df, extra={"maximo": np.float64(np.inf)})
+    assert json.loads(response.body) == {
+        "columns": ["ratio", "texto"],
+        "data": {"ratio": [1.0, None, None], "texto": ["a", None, None]},
+        "maximo": None,
+    }
+
+
+def test_columnar_render_is_timed_as_serialize():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/columnar")
+    def columnar():
+        return ColumnarResponse(frame())
+
+    timing = TestClient(app).get("/columnar").headers["server-timing"]
+    assert "serialize" in [parte.split(";")[0] for parte in timing.split(", ")]
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from app.services.scheduler import Scheduler
+
+
+@pytest.mark.asyncio
+async def test_scheduler_reports_versions_and_errors():
+    versiones = iter(["v1", "v1", "v2"])
+
+    async def dataset():
+        return next(versiones)
+
+    async def caido():
+        raise RuntimeError("CKAN no responde")
+
+    scheduler = Scheduler(interval=3600)
+    scheduler.add_job("agua", dataset)
+    scheduler.add_job("recurso:x", caido)
+    assert not scheduler.is_ready()
+    assert scheduler.upstream_status() == "unknown"
+
+    await scheduler.run_once()
+    report = scheduler.report()
+    assert report["agua"]["version"] == "v1"
+    assert report["agua"]["last_error"] is None
+    assert report["recurso:x"]["last_error"] == "CKAN no responde"
+    assert scheduler.upstream_status() == "fail"
+
+    await scheduler.run_once()
+    await scheduler.run_once()
+    assert scheduler.report()["agua"]["version"] == "v2"
+
+
+@pytest.mark.asyncio
+async def test_scheduler_is_ready_after_first_round():
+    async def dataset():
+        return "v1"
+
+    scheduler = Scheduler(interval=3600)
+    scheduler.add_job("agua", dataset)
+    scheduler.start()
+    for _ in range(100):
+        if scheduler.is_ready():
+            break
+        await asyncio.sleep(0.01)
+    assert scheduler.is_ready()
+    await scheduler.stop()
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    llamadas = 0
+
+    async def cargar():
+        nonlocal llamadas
+        llamadas += 1
+        await asyncio.sleep(0.01)
+        return {"filas": 10}
+
+    resultados = await asyncio.gather(*[flight.do("recurso", cargar) for _ in range(10)])
+    assert llamadas == 1
+    assert all(r is resultados[0] for r in resultados)
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "shared": 9}
+
+    # Terminada la carga la clave se libera y la siguiente llamada vuelve a ejecutar
+    await flight.do("recurso", cargar)
+    assert llamadas == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_keys_are_independent():
+    flight = SingleFlight("test")
+    llamadas = []
+
+    async def cargar(key):
+        llamadas.append(key)
+        await asyncio.sleep(0.01)
+        if key == "roto":
+            raise ValueError("CSV inválido")
+        return key
+
+    resultados = await asyncio.gather(
+        flight.do("roto", lambda: cargar("roto")),
+        flight.do("roto", lambda: cargar("roto")),
+        flight.do("ok", lambda: cargar("ok")),
+        return_exceptions=True,
+    )
+    assert sorted(llamadas) == ["ok", "roto"]
+    assert all(isinstance(r, ValueError) for r in resultados[:2])
+    assert resultados[2] == "ok"
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_shared_load():
+    flight = SingleFlight("test")
+
+    async def cargar():
+        await asyncio.sleep(0.02)
+        return "listo"
+
+    primero = asyncio.ensure_future(flight.do("recurso", cargar))
+    segundo = asyncio.ensure_future(flight.do("recurso", cargar))
+    await asyncio.sleep(0)
+    primero.cancel()
+    assert await segundo == "listo"
+    assert primero.cancelled()
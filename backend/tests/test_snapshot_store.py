@@ -0,0 +1,83 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.config import settings
+from app.services import snapshot_store
+
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def frame(n=1000):
+    consumo = np.arange(n, dtype="float64")
+    consumo[::10] = np.nan
+    return pd.DataFrame({
+        "zona": pd.Categorical(np.where(np.arange(n) % 2, "Norte", "Sur")),
+        "consumo": consumo,
+        "usuarios": np.arange(n),
+    })
+
+
+def test_published_frame_is_read_from_the_snapshot_without_copies():
+    df = frame()
+    mapped = snapshot_store.publish("abc", "0123456789abcdef", df, metadata={"etag": '"v1"'})
+    pd.testing.assert_frame_equal(mapped, df)
+    # Las columnas apuntan al archivo (solo lectura), no a una copia en memoria del proceso
+    assert not mapped["consumo"].to_numpy().flags.writeable
+    assert not mapped["usuarios"].to_numpy().flags.writeable
+    assert snapshot_store.read_metadata("abc", "0123456789abcdef") == {"etag": '"v1"'}
+    assert snapshot_store.latest("abc") == "0123456789abcdef"
+    # Un recurso cuyo id empieza igual no comparte snapshots
+    assert snapshot_store.latest("ab") is None
+
+
+def test_write_and_read_round_trip():
+    df = frame()
+    assert snapshot_store.write("abc", "0123456789abcdef", df) is not None
+    pd.testing.assert_frame_equal(snapshot_store.read("abc", "0123456789abcdef"), df)
+    pd.testing.assert_frame_equal(snapshot_store.read("abc", "0123456789abcdef", nrows=5), df.head(5))
+    assert snapshot_store.read("abc", "fedcba9876543210") is None
+
+
+def test_new_version_replaces_only_its_own_resource(snapshot_dir):
+    snapshot_store.write("abc", "0000000000000001", frame())
+    snapshot_store.write("abc-2", "0000000000000001", frame())
+    snapshot_store.write("abc", "0000000000000002", frame())
+    # La versión anterior de "abc" se borra; "abc-2" (mismo prefijo) no se toca
+    assert snapshot_store.read("abc", "0000000000000001") is None
+    assert snapshot_store.latest("abc") == "0000000000000002"
+    assert snapshot_store.latest("abc-2") == "0000000000000001"
+    assert sorted(p.name for p in snapshot_dir.glob("*.arrow")) == [
+        "abc-0000000000000002.arrow", "abc-2-0000000000000001.arrow"
+    ]
+
+
+def test_resource_version_changes_with_upstream_metadata():
+    resource = {"url": "https://datos.cali.gov.co/r.csv", "last_modified": "2024-01-01T00:00:00", "size": 10}
+    version = snapshot_store.resource_version(resource)
+    assert snapshot_store.resource_version(dict(resource)) == version
+    assert snapshot_store.resource_version({**resource, "last_modified": "2024-02-01T00:00:00"}) != version
+    assert snapshot_store.resource_version({**resource, "size": 11}) != version
+
+
+@pytest.mark.asyncio
+async def test_only_one_worker_publishes_at_a_time():
+    orden = []
+
+    async def publicar(nombre):
+        async with snapshot_store.apublishing("abc"):
+            orden.append(f"{nombre}:inicio")
+            await asyncio.sleep(0.05)
+            orden.append(f"{nombre}:fin")
+
+    await asyncio.gather(publicar("a"), publicar("b"))
+    assert orden in (
+        ["a:inicio", "a:fin", "b:inicio", "b:fin"],
+        ["b:inicio", "b:fin", "a:inicio", "a:fin"],
+    )
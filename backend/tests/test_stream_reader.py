@@ -0,0 +1,27 @@
+import codecs
+
+from app.services.stream_reader import read_csv_bytes, sniff
+
+
+def test_sniff_semicolon_latin1():
+    content = "zona;barrio;consumo\nSur;El Peñón;10,5\nNorte;Granada;3,2\n".encode("latin-1")
+    dialect = sniff(content)
+    assert dialect.sep == ";"
+    assert dialect.encoding == "latin-1"
+    df = read_csv_bytes(content)
+    assert list(df.columns) == ["zona", "barrio", "consumo"]
+    assert df["barrio"].iloc[0] == "El Peñón"
+
+
+def test_sniff_utf8_bom_and_truncated_sample():
+    content = codecs.BOM_UTF8 + "a,b\n1,2\n3,4\n".encode("utf-8")
+    assert sniff(content).encoding == "utf-8-sig"
+    # Muestra cortada a mitad de un carácter multibyte: no debe caer a latin-1
+    sample = "a,b\nPeñón,1\nPeñ".encode("utf-8")[:-1]
+    assert sniff(sample).encoding == "utf-8"
+    df = read_csv_bytes(content)
+    assert list(df.columns) == ["a", "b"]
+
+
+def test_read_empty_content():
+    assert read_csv_bytes(b"").empty
@@ -0,0 +1,34 @@
+import gzip
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+from app.streaming import compress_chunks, csv_chunks, ndjson_chunks, negotiate_encoding
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("*") in ("br", "gzip")
+
+
+def test_gzip_stream_round_trip():
+    chunks = [b"fecha,consumo\n"] + [f"2024-01-{i:02d},{i}\n".encode() for i in range(1, 29)]
+    comprimido = b"".join(compress_chunks(iter(chunks), "gzip"))
+    assert gzip.decompress(comprimido) == b"".join(chunks)
+    assert list(compress_chunks(iter(chunks), None)) == chunks
+
+
+def test_export_chunks_follow_selected_positions():
+    df = pd.DataFrame({"zona": ["Norte", "Sur", "Sur", "Oriente", "Sur"], "consumo": [1.0, np.nan, 3.0, 4.0, 5.0]})
+    positions = np.array([4, 2, 1])
+    partes = list(csv_chunks(df, positions, batch_rows=2))
+    assert len(partes) == 3  # encabezado y dos lotes
+    exportado = pd.read_csv(io.BytesIO(b"".join(partes)))
+    pd.testing.assert_frame_equal(exportado, df.iloc[positions].reset_index(drop=True))
+
+    lineas = b"".join(ndjson_chunks(df, positions, batch_rows=2)).decode().splitlines()
+    assert [json.loads(linea)["consumo"] for linea in lineas] == [5.0, 3.0, None]
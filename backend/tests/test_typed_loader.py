@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from app.services.agua_analysis import apply_filters
+from app.services.typed_loader import Schema, compact, read_csv
+
+CSV = (
+    b"fecha,zona,tipo_usuario,consumo_m3\n"
+    b"2024-01-05,Norte,residencial,10\n"
+    b"2024-02-05,Sur,comercial,20\n"
+    b"2024-02-10,Norte,comercial,5\n"
+)
+SCHEMA = Schema(categoricas=("zona", "tipo_usuario", "no_existe"), fechas=("fecha",), numericas=("consumo_m3",))
+
+
+def test_read_csv_applies_schema():
+    df = read_csv(CSV, SCHEMA)
+    assert isinstance(df["zona"].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(df["fecha"])
+    assert df["consumo_m3"].dtype == np.int8
+
+    filtrado = apply_filters(df, zonas=["Norte"], tipo_usuario="comercial", fecha_inicio="2024-02-01", fecha_fin="2024-02-29")
+    assert filtrado["consumo_m3"].tolist() == [5]
+
+
+def test_compact_keeps_values():
+    df = pd.DataFrame({
+        "barrio": ["Centro", "Granada", "Centro", "Centro"],
+        "id": ["a", "b", "c", "d"],
+        "entero": [1.0, 2.0, 3.0, 4.0],
+        "real": [1.5, 2.25, np.nan, 4.1],
+        "grande": [1, 2, 3, 2 ** 40],
+    })
+    result = compact(df)
+    assert isinstance(result["barrio"].dtype, pd.CategoricalDtype)
+    assert not isinstance(result["id"].dtype, pd.CategoricalDtype)
+    assert result["entero"].dtype == np.int8
+    assert result["real"].dtype == np.float64
+    assert result["grande"].dtype == np.int64
+    for col in ["barrio", "id", "entero", "grande"]:
+        assert result[col].astype(object).tolist() == df[col].astype(object).tolist()
+    pd.testing.assert_series_equal(result["real"], df["real"])
+
+
+def test_mixed_date_formats_are_not_lost(caplog):
+    csv = (
+        b"fecha,zona,tipo_usuario,consumo_m3\n"
+        b"2024-01-05,Norte,residencial,10\n"
+        b"2024-02-05 08:30,Sur,comercial,20\n"
+        b"2024/03/10,Norte,comercial,5\n"
+        b"sin fecha,Sur,residencial,1\n"
+    )
+    df = read_csv(csv, SCHEMA)
+    assert df["fecha"].dt.strftime("%Y-%m-%d").tolist()[:3] == ["2024-01-05", "2024-02-05", "2024-03-10"]
+    assert df["fecha"].isna().tolist() == [False, False, False, True]
+    assert "no son fechas" in caplog.text